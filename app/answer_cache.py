@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from llama_index.schema import NodeWithScore
+
+from app.query_cache import index_fingerprint
+
+
+def _node_id(node: NodeWithScore) -> str:
+    inner = getattr(node, "node", None)
+    return str(getattr(inner, "node_id", None) or getattr(node, "node_id", ""))
+
+
+def sources_key(contexts: Sequence[NodeWithScore]) -> str:
+    """Getirilen parçaların (sırasız) kümesinden anahtar üretir."""
+    ids = sorted(_node_id(n) for n in contexts)
+    return hashlib.sha1("|".join(ids).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    question: str
+    answer: str
+    model: str
+    sources: str
+    last_used: float
+
+
+class SemanticAnswerCache:
+    """
+    generate_answer önünde anlamsal cevap önbelleği.
+
+    Soru embed edilir; aynı model ve aynı kaynak parça kümesiyle daha önce cevaplanmış,
+    cosine benzerliği `threshold` üzerindeki en yakın soru bulunursa kayıtlı cevap döner.
+    Vektörler normalize edilmiş (max_entries, dim) bir matriste tutulur; dolunca en uzun
+    süredir kullanılmayan kayıt çıkarılır. Namespace = index sürümü + sistem promptu;
+    biri değişince önbellek boşaltılır.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        persist_dir: str = "db/faiss_index",
+        threshold: float = 0.92,
+        max_entries: int = 2000,
+    ):
+        self.embed_fn = embed_fn
+        self.persist_dir = persist_dir
+        self.threshold = float(threshold)
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+
+        self._vecs: Optional[np.ndarray] = None
+        self._entries: List[_Entry] = []
+        self._namespace: Optional[str] = None
+        self._last_q: Optional[tuple[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    # ------------------------- Yardımcılar -------------------------
+    def _embed(self, question: str) -> np.ndarray:
+        if self._last_q is not None and self._last_q[0] == question:
+            return self._last_q[1]
+        vec = np.asarray(self.embed_fn(question), dtype="float32")
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec = vec / norm
+        self._last_q = (question, vec)
+        return vec
+
+    def _check_namespace(self, system_prompt: str) -> None:
+        ns = hashlib.sha1(
+            (index_fingerprint(self.persist_dir) + "\n" + system_prompt).encode("utf-8")
+        ).hexdigest()
+        if ns != self._namespace:
+            self._namespace = ns
+            self.clear()
+
+    def clear(self) -> None:
+        self._vecs = None
+        self._entries = []
+
+    # ------------------------- API -------------------------
+    def lookup(
+        self,
+        question: str,
+        contexts: Sequence[NodeWithScore],
+        model: str,
+        system_prompt: str,
+    ) -> Optional[str]:
+        vec = self._embed(question)
+        src = sources_key(contexts)
+        with self._lock:
+            self._check_namespace(system_prompt)
+            best = None
+            if self._vecs is not None and self._entries:
+                sims = self._vecs[: len(self._entries)] @ vec
+                for i in np.argsort(-sims):
+                    if sims[i] < self.threshold:
+                        break
+                    entry = self._entries[i]
+                    if entry.model == model and entry.sources == src:
+                        best = entry
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            best.last_used = time.monotonic()
+            self.hits += 1
+            return best.answer
+
+    def store(
+        self,
+        question: str,
+        contexts: Sequence[NodeWithScore],
+        model: str,
+        system_prompt: str,
+        answer: str,
+    ) -> None:
+        vec = self._embed(question)
+        entry = _Entry(
+            question=question,
+            answer=answer,
+            model=model,
+            sources=sources_key(contexts),
+            last_used=time.monotonic(),
+        )
+        with self._lock:
+            self._check_namespace(system_prompt)
+            if self._vecs is None:
+                self._vecs = np.zeros((self.max_entries, vec.shape[0]), dtype="float32")
+            if len(self._entries) < self.max_entries:
+                slot = len(self._entries)
+                self._entries.append(entry)
+            else:
+                slot = min(
+                    range(len(self._entries)), key=lambda i: self._entries[i].last_used
+                )
+                self._entries[slot] = entry
+            self._vecs[slot] = vec
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,235 @@
+"""
+JSONL üzerinden toplu soru-cevap (geçmiş biletleri tekrar oynatma / prompt regresyonu).
+
+    python -m app.batch_qa girdi.jsonl cikti.jsonl --field question --concurrency 8 --rps 4
+
+Girdi satırları JSON nesneleridir; soru `--field` alanından okunur (birden fazla alan
+virgülle verilirse birleştirilir, örn. `--field title,body`). Sorgular `--batch-size`
+gruplar halinde `DocumentRetriever.retrieve_batch` ile getirilir, LLM çağrıları
+eşzamanlı ve hız sınırlı yapılır; sonuçlar tamamlandıkça çıktı dosyasına yazılır.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from llama_index.schema import NodeWithScore
+
+from app.http_client import AsyncLLMHttpClient, ClientConfig
+from app.llm_generator import DEFAULT_MODEL, agenerate_answer
+from app.retriever import DocumentRetriever
+
+
+class RateLimiter:
+    """Saniyede en fazla `rps` istek başlatır (0 → sınırsız)."""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _read_rows(path: str, fields: List[str]) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                print(f"[batch_qa] {lineno}. satır JSON değil, atlandı.")
+                continue
+            question = "\n".join(
+                str(row.get(k) or "").strip() for k in fields if row.get(k)
+            ).strip()
+            if question:
+                yield {"line": lineno, "row": row, "question": question}
+
+
+def _chunks(it: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for item in it:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _sources(nodes: List[NodeWithScore]) -> List[dict]:
+    out = []
+    for n in nodes:
+        meta = getattr(n.node, "metadata", None) or {}
+        out.append(
+            {
+                "source": meta.get("file_name") or meta.get("file_path"),
+                "score": n.score,
+                "node_id": n.node.node_id,
+            }
+        )
+    return out
+
+
+def schedule_answers(
+    items: List[Dict[str, Any]],
+    contexts: List[List[NodeWithScore]],
+    client: AsyncLLMHttpClient,
+    limiter: RateLimiter,
+    queue: "asyncio.Queue[dict]",
+    model_name: Optional[str] = None,
+    id_field: str = "id",
+) -> List["asyncio.Task[None]"]:
+    """Her soru için LLM çağrısını başlatır; sonuç satırları tamamlandıkça kuyruğa düşer."""
+
+    async def _one(item: Dict[str, Any], nodes: List[NodeWithScore]) -> None:
+        await limiter.wait()
+        t0 = time.perf_counter()
+        result = {
+            "id": item["row"].get(id_field, item["line"]),
+            "question": item["question"],
+            "model": model_name or DEFAULT_MODEL,
+            "sources": _sources(nodes),
+            "answer": None,
+            "error": None,
+        }
+        try:
+            result["answer"] = await agenerate_answer(
+                item["question"], nodes, model_name=model_name, client=client
+            )
+        except Exception as e:
+            result["error"] = repr(e)
+        result["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        await queue.put(result)
+
+    return [
+        asyncio.create_task(_one(item, nodes)) for item, nodes in zip(items, contexts)
+    ]
+
+
+def _open_output(path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return open(path, "w", encoding="utf-8")
+
+
+def _write_row(out, row: Dict[str, Any]) -> None:
+    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    fields: List[str],
+    id_field: str = "id",
+    batch_size: int = 64,
+    concurrency: int = 8,
+    rps: float = 0.0,
+    model_name: Optional[str] = None,
+    retriever: Optional[DocumentRetriever] = None,
+) -> Dict[str, Any]:
+    retriever = retriever or DocumentRetriever()
+    base = ClientConfig.from_env()
+    client = AsyncLLMHttpClient(
+        ClientConfig(
+            timeout=base.timeout,
+            max_connections=max(concurrency, 1),
+            max_concurrency=max(concurrency, 1),
+            max_retries=base.max_retries,
+        )
+    )
+    limiter = RateLimiter(rps)
+    stats = {"questions": 0, "errors": 0}
+    t0 = time.perf_counter()
+
+    # Dosya işlemleri thread'de: event loop LLM çağrılarını sürdürürken bloklanmasın
+    out = None
+    try:
+        out = await asyncio.to_thread(_open_output, output_path)
+        pending = 0
+        queue: "asyncio.Queue[dict]" = asyncio.Queue()
+        tasks: set = set()
+
+        async def _drain(until: int) -> None:
+            nonlocal pending
+            while pending > until:
+                row = await queue.get()
+                pending -= 1
+                tasks.difference_update([t for t in tasks if t.done()])
+                stats["questions"] += 1
+                stats["errors"] += int(row["error"] is not None)
+                await asyncio.to_thread(_write_row, out, row)
+
+        for items in _chunks(_read_rows(input_path, fields), batch_size):
+            # CPU ağırlıklı retrieval, önceki batch'in LLM çağrıları sürerken thread'de
+            contexts = await asyncio.to_thread(
+                retriever.retrieve_batch, [it["question"] for it in items]
+            )
+            tasks.update(
+                schedule_answers(
+                    items, contexts, client, limiter, queue, model_name, id_field
+                )
+            )
+            pending += len(items)
+            # Bellek sınırı: en fazla iki batch uçuşta kalsın
+            await _drain(batch_size)
+        await _drain(0)
+    finally:
+        if out is not None:
+            await asyncio.to_thread(out.close)
+        await client.close()
+
+    elapsed = time.perf_counter() - t0
+    stats["seconds"] = round(elapsed, 2)
+    stats["questions_per_sec"] = (
+        round(stats["questions"] / elapsed, 2) if elapsed else 0.0
+    )
+    stats["retry_count"] = client.retries
+    return stats
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="JSONL toplu soru-cevap")
+    p.add_argument("input", help="Girdi JSONL")
+    p.add_argument("output", help="Çıktı JSONL")
+    p.add_argument("--field", default="question", help="Soru alan(lar)ı, virgülle")
+    p.add_argument("--id-field", default="id")
+    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--concurrency", type=int, default=8, help="Eşzamanlı LLM çağrısı")
+    p.add_argument(
+        "--rps", type=float, default=0.0, help="Saniyede LLM isteği (0=sınırsız)"
+    )
+    p.add_argument("--model", default=None)
+    args = p.parse_args()
+
+    stats = asyncio.run(
+        run_batch(
+            args.input,
+            args.output,
+            fields=[f.strip() for f in args.field.split(",") if f.strip()],
+            id_field=args.id_field,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            rps=args.rps,
+            model_name=args.model,
+        )
+    )
+    print(f"[batch_qa] {json.dumps(stats, ensure_ascii=False)} → {args.output}")
+
+
+if __name__ == "__main__":
+    _cli()
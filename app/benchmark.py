@@ -0,0 +1,440 @@
+"""
+Uçtan uca benchmark: aşama bazında gecikme, verim, bellek ve retrieval kalitesi.
+
+`data/` ve isteğe bağlı sentetik olarak büyütülmüş korpuslardan (10k–1M parça) index
+kurar, etiketli sorgu setini tekrar oynatır ve her aşama (embed, FAISS araması, rerank,
+prompt hazırlama, LLM) için p50/p95/p99, verim (soru/sn), en yüksek RSS ve
+recall@k / MRR raporlar. LLM aşaması varsayılan olarak süreç içi stub sunucuya
+(bkz. `app.stub_llm_server`) gider; ağ gerekmez ve gecikme ayarlanabilir.
+
+    python -m app.benchmark
+    python -m app.benchmark --synthetic 10000 100000 --index-kind hnsw --repeat 3
+    python -m app.benchmark --llm-latency 0.8 --out logs/bench.json
+
+Sentetik korpus: `data/` belgeleri + bu belgelerin sözcük dağılımından üretilmiş dolgu
+metni. Etiketli cevaplar gerçek belgelerde kaldığından dolgu, aramayı zorlaştıran
+gürültü görevi görür. Korpus ve index `--work-dir` altında saklanır; aynı boyutla
+tekrar çalıştırmada embedding önbelleği ve artımlı build sayesinde yeniden embed edilmez.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "bench", "queries_v1.jsonl")
+STAGES = ("code", "embed", "search", "rerank", "prompt", "llm", "total")
+
+
+# ----------------------------- Sorgu seti -----------------------------
+def load_queries(path: str = QUERIES_PATH) -> List[dict]:
+    """
+    Satır başına {"id", "question", "relevant": [{"file", "contains"}]}. Bir parça,
+    kaynak dosyası `file` ise ve metni `contains`'i içeriyorsa etiketle eşleşir.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _matches(node: Any, label: dict) -> bool:
+    inner = getattr(node, "node", node)
+    meta = inner.metadata or {}
+    return (
+        meta.get("file_name") == label["file"]
+        and label["contains"] in inner.get_content()
+    )
+
+
+def recall_at_k(nodes: List[Any], labels: List[dict], k: int) -> float:
+    """Etiketlerden en az bir parçası ilk k sonuçta bulunanların oranı."""
+    if not labels:
+        return 0.0
+    top = nodes[:k]
+    return sum(any(_matches(n, lb) for n in top) for lb in labels) / len(labels)
+
+
+def reciprocal_rank(nodes: List[Any], labels: List[dict]) -> float:
+    for rank, node in enumerate(nodes, 1):
+        if any(_matches(node, lb) for lb in labels):
+            return 1.0 / rank
+    return 0.0
+
+
+# ----------------------------- Korpus -----------------------------
+def _vocabulary(data_dir: str) -> List[str]:
+    from app.lexical_index import turkish_lower
+
+    words: List[str] = []
+    for p in sorted(Path(data_dir).iterdir()):
+        if p.is_file() and not p.name.startswith("."):
+            text = turkish_lower(p.read_text(encoding="utf-8"))
+            words.extend(w for w in re.findall(r"[^\W\d_]{3,}", text))
+    return words
+
+
+def _words_per_chunk(words: List[str], chunk_size: int, overlap: int = 50) -> int:
+    """Parça başına düşen sözcük sayısı (SentenceSplitter'ın tokenizer'ıyla ölçülür)."""
+    from llama_index.utils import get_tokenizer
+
+    sample = " ".join(words[:2000])
+    tokens_per_word = len(get_tokenizer()(sample)) / max(1, len(words[:2000]))
+    return max(20, int((chunk_size - overlap) / tokens_per_word))
+
+
+def make_synthetic_corpus(
+    data_dir: str,
+    out_dir: str,
+    n_chunks: int,
+    chunk_size: int = 500,
+    chunks_per_file: int = 1000,
+    seed: int = 0,
+) -> str:
+    """
+    `data_dir` belgelerini kopyalar ve toplam ~n_chunks parça olacak şekilde dolgu
+    dosyaları üretir. Aynı argümanlarla üretilmiş korpus varsa dokunmaz.
+    """
+    root = Path(out_dir)
+    marker = root / ".corpus.json"
+    spec = {"n_chunks": n_chunks, "chunk_size": chunk_size, "seed": seed}
+    if marker.exists() and json.loads(marker.read_text()) == spec:
+        return out_dir
+    if root.exists():
+        shutil.rmtree(root)
+    root.mkdir(parents=True)
+    for p in sorted(Path(data_dir).iterdir()):
+        if p.is_file() and not p.name.startswith("."):
+            shutil.copy2(p, root / p.name)
+
+    rng = random.Random(seed)
+    words = _vocabulary(data_dir)
+    per_chunk = _words_per_chunk(words, chunk_size)
+    remaining = max(0, n_chunks)
+    file_no = 0
+    while remaining > 0:
+        n = min(chunks_per_file, remaining)
+        sentences: List[str] = []
+        for _ in range(n * per_chunk // 12):
+            sentence = rng.choices(words, k=rng.randint(8, 16))
+            sentences.append(" ".join(sentence).capitalize() + ".")
+        (root / f"sentetik_{file_no:05d}.txt").write_text(
+            "\n".join(sentences), encoding="utf-8"
+        )
+        remaining -= n
+        file_no += 1
+    marker.write_text(json.dumps(spec))
+    print(
+        f"[benchmark] Sentetik korpus: ~{n_chunks} dolgu parçası, {file_no} dosya → {out_dir}"
+    )
+    return out_dir
+
+
+# ----------------------------- Ölçüm -----------------------------
+def _rss_mb() -> float:
+    """Anlık RSS (Linux /proc; yoksa en yüksek RSS)."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    arr = np.asarray(values, dtype="float64")
+    return {
+        "n": len(values),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+    }
+
+
+@dataclass
+class BenchConfig:
+    """
+    k           : recall@k / MRR için son sonuç sayısı (retriever top_k_rerank)
+    candidates  : ilk aşama aday sayısı (retriever top_k_retrieval)
+    repeat      : sorgu setinin kaç kez tekrar oynatılacağı (önbellekler kapalı)
+    llm_latency : stub LLM toplam cevap süresi (sn); llm_url verilirse kullanılmaz
+    """
+
+    k: int = 5
+    candidates: int = 10
+    repeat: int = 1
+    load_mode: str = "mmap"
+    llm: bool = True
+    llm_latency: float = 0.3
+    llm_url: Optional[str] = None
+    retriever_kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+def _stub_llm(config: BenchConfig):
+    """LLM uç noktasını süreç içi stub'a (veya llm_url'e) yönlendirir."""
+    server = None
+    url = config.llm_url
+    if not url:
+        from app.stub_llm_server import StubConfig, start_stub_server
+
+        server = start_stub_server(
+            config=StubConfig(
+                latency=config.llm_latency, ttft=min(0.05, config.llm_latency)
+            )
+        )
+        url = server.url
+    os.environ["OPENROUTER_BASE_URL"] = url
+    os.environ.setdefault("OPENROUTER_API_KEY", "stub")
+    import app.llm_generator as llm
+
+    # Modül zaten içe aktarılmışsa ayarları o da görsün
+    llm.API_URL = url
+    llm.API_KEY = llm.API_KEY or os.environ["OPENROUTER_API_KEY"]
+    return server
+
+
+def run_queries(retriever, queries: List[dict], config: BenchConfig) -> Dict[str, Any]:
+    """Sorguları sırayla aşama aşama çalıştırır; gecikme ve kalite ölçümlerini döndürür."""
+    from app.llm_generator import _build_user_prompt, generate_answer
+
+    times: Dict[str, List[float]] = {s: [] for s in STAGES}
+    recall, recall_cand, rr = [], [], []
+    t_all = time.perf_counter()
+    for _ in range(config.repeat):
+        for q in queries:
+            question = q["question"]
+            t0 = time.perf_counter()
+            fast = retriever.lookup_codes(question)
+            t1 = time.perf_counter()
+            if fast:
+                times["code"].append((t1 - t0) * 1000)
+                nodes = candidates = fast
+            else:
+                embedding = retriever.embed_queries([question])
+                t2 = time.perf_counter()
+                cands, dense = retriever.search_queries([question], embedding)
+                t3 = time.perf_counter()
+                nodes = retriever.rerank_candidates([question], cands, dense)[0]
+                t4 = time.perf_counter()
+                candidates = cands[0]
+                times["embed"].append((t2 - t1) * 1000)
+                times["search"].append((t3 - t2) * 1000)
+                times["rerank"].append((t4 - t3) * 1000)
+
+            t5 = time.perf_counter()
+            _build_user_prompt(question, nodes)
+            t6 = time.perf_counter()
+            times["prompt"].append((t6 - t5) * 1000)
+            if config.llm:
+                generate_answer(question, nodes)
+                times["llm"].append((time.perf_counter() - t6) * 1000)
+            times["total"].append((time.perf_counter() - t0) * 1000)
+
+            labels = q.get("relevant") or []
+            recall.append(recall_at_k(nodes, labels, config.k))
+            recall_cand.append(recall_at_k(candidates, labels, config.candidates))
+            rr.append(reciprocal_rank(nodes[: config.k], labels))
+    elapsed = time.perf_counter() - t_all
+
+    # Retrieval verimi: tüm set tek retrieve_batch çağrısında (önbellek kapalı)
+    batch_queries = [q["question"] for q in queries] * config.repeat
+    t0 = time.perf_counter()
+    retriever.retrieve_batch(batch_queries)
+    batch_s = time.perf_counter() - t0
+
+    n = len(queries) * config.repeat
+    return {
+        "stages": {s: percentiles(v) for s, v in times.items() if v},
+        "quality": {
+            f"recall@{config.k}": round(float(np.mean(recall)), 4) if recall else 0.0,
+            f"recall@{config.candidates}_candidates": (
+                round(float(np.mean(recall_cand)), 4) if recall_cand else 0.0
+            ),
+            f"mrr@{config.k}": round(float(np.mean(rr)), 4) if rr else 0.0,
+        },
+        "throughput": {
+            "e2e_sequential_qps": round(n / elapsed, 2) if elapsed else 0.0,
+            "retrieval_batch_qps": round(n / batch_s, 2) if batch_s else 0.0,
+        },
+    }
+
+
+def bench_corpus(
+    name: str,
+    data_dir: str,
+    persist_dir: str,
+    queries: List[dict],
+    config: BenchConfig,
+    build_kwargs: Optional[Dict[str, Any]] = None,
+    skip_build: bool = False,
+) -> Dict[str, Any]:
+    from app.retriever import DocumentRetriever, RerankConfig
+
+    result: Dict[str, Any] = {"corpus": name}
+    if not skip_build:
+        from app.embedder import build_index
+
+        t0 = time.perf_counter()
+        build_index(
+            data_dir=data_dir,
+            persist_dir=persist_dir,
+            incremental=True,
+            **(build_kwargs or {}),
+        )
+        result["build_s"] = round(time.perf_counter() - t0, 2)
+        result["rss_after_build_mb"] = round(_rss_mb(), 1)
+
+    t0 = time.perf_counter()
+    retriever = DocumentRetriever(
+        persist_dir=persist_dir,
+        top_k_retrieval=config.candidates,
+        top_k_rerank=config.k,
+        cache_size=0,  # her tekrar gerçek iş ölçsün
+        load_mode=config.load_mode,  # type: ignore[arg-type]
+        rerank=RerankConfig(cache_size=0),
+        **config.retriever_kwargs,
+    )
+    _ = retriever.embed_model, retriever.rerank_engine.model
+    result["load_s"] = round(time.perf_counter() - t0, 2)
+    result["chunks"] = int(retriever.faiss_index.ntotal)
+    result["rss_after_load_mb"] = round(_rss_mb(), 1)
+
+    result.update(run_queries(retriever, queries, config))
+    result["rss_after_queries_mb"] = round(_rss_mb(), 1)
+    result["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    return result
+
+
+# ----------------------------- Rapor -----------------------------
+def _print_table(rows: List[dict]) -> None:
+    if not rows:
+        return
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(
+        f"\n=== {result['corpus']}: {result['chunks']} parça, "
+        f"yükleme {result['load_s']} sn"
+        + (f", build {result['build_s']} sn" if "build_s" in result else "")
+    )
+    _print_table([{"aşama": s, **v} for s, v in result["stages"].items()])
+    print("kalite :", json.dumps(result["quality"], ensure_ascii=False))
+    print("verim  :", json.dumps(result["throughput"], ensure_ascii=False))
+    print(
+        f"bellek : yükleme sonrası {result['rss_after_load_mb']} MB, sorgular sonrası "
+        f"{result['rss_after_queries_mb']} MB, en yüksek {result['peak_rss_mb']} MB"
+    )
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="Uçtan uca RAG benchmark'ı")
+    p.add_argument("--data-dir", default="data")
+    p.add_argument(
+        "--queries", default=QUERIES_PATH, help="Etiketli sorgu seti (JSONL)"
+    )
+    p.add_argument(
+        "--synthetic",
+        type=int,
+        nargs="*",
+        default=[],
+        help="Dolgu parça sayıları, örn. 10000 100000",
+    )
+    p.add_argument(
+        "--skip-base", action="store_true", help="Yalnızca sentetik korpuslar"
+    )
+    p.add_argument(
+        "--skip-build", action="store_true", help="Var olan index'leri kullan"
+    )
+    p.add_argument("--work-dir", default="db/bench")
+    p.add_argument(
+        "--index-kind", choices=("flat", "ivf_flat", "hnsw", "ivf_pq"), default="flat"
+    )
+    p.add_argument("--embed-workers", type=int, default=1)
+    p.add_argument("--load-mode", choices=("memory", "mmap"), default="mmap")
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--candidates", type=int, default=10)
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--no-llm", action="store_true", help="LLM aşamasını atla")
+    p.add_argument(
+        "--llm-latency", type=float, default=0.3, help="Stub LLM cevap süresi (sn)"
+    )
+    p.add_argument(
+        "--llm-url", default=None, help="Stub yerine gerçek chat/completions URL'i"
+    )
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default=None, help="Sonuçları JSON olarak yaz")
+    args = p.parse_args()
+
+    config = BenchConfig(
+        k=args.k,
+        candidates=args.candidates,
+        repeat=args.repeat,
+        load_mode=args.load_mode,
+        llm=not args.no_llm,
+        llm_latency=args.llm_latency,
+        llm_url=args.llm_url,
+    )
+    queries = load_queries(args.queries)
+    build_kwargs = {"index_kind": args.index_kind, "embed_workers": args.embed_workers}
+    server = _stub_llm(config) if config.llm else None
+
+    corpora = [] if args.skip_base else [("data", args.data_dir)]
+    for n in args.synthetic:
+        corpus_dir = os.path.join(args.work_dir, f"corpus_{n}")
+        if not args.skip_build:
+            make_synthetic_corpus(args.data_dir, corpus_dir, n, seed=args.seed)
+        corpora.append((f"synthetic_{n}", corpus_dir))
+
+    results = []
+    try:
+        for name, data_dir in corpora:
+            result = bench_corpus(
+                name,
+                data_dir,
+                os.path.join(args.work_dir, f"index_{name}_{args.index_kind}"),
+                queries,
+                config,
+                build_kwargs,
+                skip_build=args.skip_build,
+            )
+            print_report(result)
+            results.append(result)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": {**vars(args)}, "results": results},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"[benchmark] Sonuçlar → {args.out}")
+
+
+if __name__ == "__main__":
+    _cli()
@@ -0,0 +1,150 @@
+"""
+Arıza kodu / parça kodu / belge numarası için tam eşleşme (exact-match) ters index'i.
+
+"E01 hatası ne demek", "KL-VP-01 nerede kullanılıyor" gibi sorgularda kod, hangi
+parçalarda geçtiği önceden bilindiği için embedding, FAISS ve reranker'a gerek kalmaz.
+Index build sırasında (embedder) FAISS pozisyonlarıyla birlikte `codes.json`'a yazılır.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from llama_index.schema import BaseNode
+
+CODES_FILE = "codes.json"
+CODES_VERSION = 1
+
+# E01, E112 (arıza kodları) ve KL-VP-01, MT-VP-İP-003 gibi tireli parça/belge kodları
+_CODE = r"E\d{2,3}|[A-ZÇĞİÖŞÜ]{2,}(?:-[A-ZÇĞİÖŞÜ0-9]{2,})+"
+CODE_PATTERN = re.compile(rf"(?<![\w-])({_CODE})(?![\w-])")
+# "E01: Kapak Kilidi Hatası" → kodun tanımlandığı parça
+_DEFINITION = re.compile(rf"^\s*({_CODE})\s*:", re.M)
+# "Belge No: MT-VP-AK-001" → belgenin tüm parçaları bu numarayı kapsar
+_DOC_NUMBER = re.compile(rf"Belge\s+No\s*:\s*({_CODE})")
+# Kodlar ASCII'ye katlanarak saklanır; "mt-vp-ip-003" sorgusu da eşleşir
+_FOLD = str.maketrans("ÇĞİÖŞÜ", "CGIOSU")
+
+# Ağırlıklar: tanım satırı > metin içi geçiş > belge numarasından miras
+W_DEFINITION = 3.0
+W_MENTION = 2.0
+W_DOCUMENT = 1.0
+
+
+def extract_codes(text: str, fold_case: bool = False) -> List[str]:
+    """
+    Metindeki kodları (sırası korunmuş, tekrarsız) döndürür. Belgelerde kodlar büyük
+    harfle yazılır; sorgularda "e01" gibi yazımlar için fold_case=True kullanılır.
+    """
+    seen: Dict[str, None] = {}
+    for m in CODE_PATTERN.finditer(_upper(text) if fold_case else text):
+        code = _normalize(m.group(1))
+        # "SS-VP-xx" gibi şablon yazımları kod sayılmaz
+        if any(ch.isdigit() for ch in code):
+            seen.setdefault(code, None)
+    return list(seen)
+
+
+def _upper(text: str) -> str:
+    # Türkçe büyük harf: i → İ, ı → I
+    return text.replace("i", "İ").replace("ı", "I").upper()
+
+
+def _normalize(code: str) -> str:
+    return code.translate(_FOLD)
+
+
+def build_code_postings(
+    records: Iterable[Tuple[int, BaseNode]],
+) -> Dict[str, List[Tuple[int, float]]]:
+    """(FAISS pozisyonu, node) çiftlerinden kod → [(pozisyon, ağırlık)] haritası çıkarır."""
+    weights: Dict[str, Dict[int, float]] = defaultdict(dict)
+    doc_numbers: Dict[str, str] = {}
+    by_file: Dict[str, List[int]] = defaultdict(list)
+
+    for pos, node in records:
+        text = node.get_content()
+        file_name = (node.metadata or {}).get("file_name") or ""
+        by_file[file_name].append(pos)
+
+        for code in extract_codes(text):
+            weights[code][pos] = max(weights[code].get(pos, 0.0), W_MENTION)
+        for m in _DEFINITION.finditer(text):
+            weights[_normalize(m.group(1))][pos] = W_DEFINITION
+        m = _DOC_NUMBER.search(text)
+        if m and file_name:
+            doc_numbers[_normalize(m.group(1))] = file_name
+
+    for code, file_name in doc_numbers.items():
+        for pos in by_file.get(file_name, []):
+            weights[code].setdefault(pos, W_DOCUMENT)
+
+    return {
+        code: sorted(hits.items(), key=lambda x: (-x[1], x[0]))
+        for code, hits in weights.items()
+    }
+
+
+def write_code_index(persist_dir: str, records: Iterable[Tuple[int, BaseNode]]) -> int:
+    postings = build_code_postings(records)
+    path = Path(persist_dir) / CODES_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": CODES_VERSION, "codes": postings},
+            f,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+    os.replace(tmp, path)
+    return len(postings)
+
+
+class CodeIndex:
+    """
+    Sorgudaki bilinen kodları bulur ve o kodları kapsayan parçaları (FAISS pozisyonu,
+    skor) olarak döndürür. Birden çok kod içeren sorgularda hepsini kapsayan parçalar öne
+    çıkar; skor 0-1 aralığına normalize edilir.
+    """
+
+    def __init__(self, postings: Dict[str, List[Tuple[int, float]]]):
+        self.postings = {
+            code: [(int(p), float(w)) for p, w in hits]
+            for code, hits in postings.items()
+        }
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["CodeIndex"]:
+        path = Path(persist_dir) / CODES_FILE
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CODES_VERSION:
+            return None
+        return cls(data.get("codes") or {})
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    def match(self, query: str) -> List[str]:
+        """Sorguda geçen ve index'te bulunan kodlar."""
+        return [c for c in extract_codes(query, fold_case=True) if c in self.postings]
+
+    def lookup(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        codes = self.match(query)
+        if not codes:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for code in codes:
+            for pos, w in self.postings[code]:
+                scores[pos] += w
+        norm = W_DEFINITION * len(codes)
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:top_k]
+        return [(pos, score / norm) for pos, score in ranked]
@@ -0,0 +1,382 @@
+"""
+Token bütçeli bağlam paketleyici.
+
+Rerank sonrası parçalar prompt'a olduğu gibi eklendiğinde komşu parçaların ortak
+`chunk_overlap` metni (50 token) iki kez gider ve prompt top_k ile doğrusal büyür.
+pack_contexts parçaları rerank sırasıyla bütçeye yerleştirir:
+
+  * aynı dosyanın parçaları tek pasajda, belge sırasıyla birleştirilir; komşu
+    parçalardaki tekrar eden örtüşme metni çıkarılır (konum varsa start/end_char_idx'ten,
+    yoksa sonek/önek eşleşmesinden),
+  * her parça eklenmeden önce pasajın yeni token maliyeti hesaplanır; bütçeyi aşan
+    parça atlanır, sonraki (daha kısa) parçalar denenmeye devam eder,
+  * ilk parça tek başına bütçeyi aşıyorsa bütçeye kırpılır (bağlam hiç boş kalmaz).
+
+Token sayımı hedef modelin tokenizer'ıyla yapılır (bkz. get_tokenizer):
+    CONTEXT_TOKEN_BUDGET=1500        → bağlam bütçesi (0 → sınırsız, yalnızca birleştirme)
+    CONTEXT_TOKENIZER=<hf-repo>      → HF tokenizer (ör. meta-llama/Meta-Llama-3-8B-Instruct)
+    CONTEXT_TOKENIZER=tiktoken:o200k_base
+Ayar yoksa yerel GGUF modellerinde modelin kendi sözlüğü, OpenAI modellerinde modelin
+tiktoken kodlaması, diğerlerinde cl100k_base kullanılır (Llama 3'ün tokenizer'ı da tiktoken
+tabanlıdır; sayım yakın bir tahmindir).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.llm_backends import is_local_model
+
+if TYPE_CHECKING:
+    from llama_index.schema import NodeWithScore
+
+DEFAULT_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Konum bilgisi olmayan parçalarda örtüşme sayılacak en kısa sonek/önek (karakter)
+MIN_OVERLAP_CHARS = 20
+# Sonek/önek araması için en uzun pencere (50 token ≈ 200-400 karakter)
+MAX_OVERLAP_CHARS = 1200
+# Aynı dosyanın bitişik olmayan bölümleri arasına konan ayraç
+GAP_MARKER = "\n[...]\n"
+
+
+# ----------------------------- Tokenizer -----------------------------
+@dataclass(frozen=True)
+class Tokenizer:
+    name: str
+    encode: Callable[[str], List[int]]
+    decode: Callable[[List[int]], str]
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text)) if text else 0
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        ids = self.encode(text)
+        return (
+            text if len(ids) <= max_tokens else self.decode(ids[: max(0, max_tokens)])
+        )
+
+
+def _char_tokenizer() -> Tokenizer:
+    # Son çare: ~4 karakter/token (tiktoken da yoksa)
+    return Tokenizer(
+        "chars/4",
+        lambda t: list(range((len(t) + 3) // 4)),
+        lambda ids: "",
+    )
+
+
+def _tiktoken_cache_dir() -> Optional[str]:
+    # llama_index cl100k_base dosyasını paketle getirir; ağ yokken de yüklenebilsin
+    # (modülü içe aktarmadan yalnızca yolunu buluyoruz)
+    import importlib.util
+
+    spec = importlib.util.find_spec("llama_index")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(
+        list(spec.submodule_search_locations)[0], "_static", "tiktoken_cache"
+    )
+    return path if os.path.isdir(path) else None
+
+
+# Ortam değişkeni süreç geneli ve thread'ler arasında paylaşılır; çalışma anında
+# değiştirmek yerine içe aktarılırken bir kez (kullanıcı ayarlamadıysa) atanır
+if "TIKTOKEN_CACHE_DIR" not in os.environ:
+    _bundled = _tiktoken_cache_dir()
+    if _bundled:
+        os.environ["TIKTOKEN_CACHE_DIR"] = _bundled
+
+
+def _tiktoken(encoding: Optional[str], model: str) -> Tokenizer:
+    import tiktoken
+
+    if encoding:
+        enc = tiktoken.get_encoding(encoding)
+    else:
+        try:
+            enc = tiktoken.encoding_for_model(model.split("/")[-1])
+        except KeyError:
+            enc = tiktoken.get_encoding("cl100k_base")
+    return Tokenizer(
+        f"tiktoken:{enc.name}",
+        lambda t: enc.encode(t, disallowed_special=()),
+        enc.decode,
+    )
+
+
+def _hf(repo: str) -> Tokenizer:
+    from transformers import AutoTokenizer
+
+    tok = AutoTokenizer.from_pretrained(repo)
+    return Tokenizer(
+        f"hf:{repo}",
+        lambda t: tok.encode(t, add_special_tokens=False),
+        lambda ids: tok.decode(ids),
+    )
+
+
+def _llama_cpp(model: str) -> Tokenizer:
+    # Yerel GGUF modelinin kendi sözlüğü (model zaten bellekte tutulur)
+    from app.llm_backends import get_llama_cpp_backend, local_model_path
+
+    llm = get_llama_cpp_backend(local_model_path(model)).llm
+    return Tokenizer(
+        f"llamacpp:{os.path.basename(local_model_path(model))}",
+        lambda t: llm.tokenize(t.encode("utf-8"), add_bos=False, special=False),
+        lambda ids: llm.detokenize(ids).decode("utf-8", errors="ignore"),
+    )
+
+
+_TOKENIZERS: Dict[Tuple[str, str], Tokenizer] = {}
+_TOKENIZERS_LOCK = threading.Lock()
+
+
+def get_tokenizer(model: str, spec: Optional[str] = None) -> Tokenizer:
+    """Model için tokenizer (süreç başına bir kez yüklenir); spec → CONTEXT_TOKENIZER."""
+    spec = spec if spec is not None else os.getenv("CONTEXT_TOKENIZER", "")
+    key = (spec, model if not spec else "")
+    with _TOKENIZERS_LOCK:
+        tok = _TOKENIZERS.get(key)
+        if tok is None:
+            try:
+                if spec and not spec.startswith("tiktoken"):
+                    tok = _hf(spec)
+                elif not spec and is_local_model(model):
+                    tok = _llama_cpp(model)
+                else:
+                    tok = _tiktoken(spec.partition(":")[2] or None, model)
+            except Exception as e:
+                print(
+                    f"[context_packer] Tokenizer yüklenemedi ({e!r}); karakter tahmini kullanılıyor."
+                )
+                tok = _char_tokenizer()
+            _TOKENIZERS[key] = tok
+        return tok
+
+
+# ----------------------------- Paketleme -----------------------------
+@dataclass
+class _Chunk:
+    rank: int
+    node_id: str
+    source: str
+    text: str
+    score: Optional[float]
+    start: Optional[int]
+    end: Optional[int]
+
+
+@dataclass
+class Passage:
+    """Prompt'a giren tek belge bölümü (aynı dosyanın birleştirilmiş parçaları)."""
+
+    source: str
+    text: str
+    score: Optional[float]
+    node_ids: List[str]
+    tokens: int = 0
+
+
+@dataclass
+class PackStats:
+    tokenizer: str
+    budget: int
+    chunks_in: int = 0
+    chunks_used: int = 0
+    chunks_dropped: int = 0  # bütçeye sığmadığı için atlanan
+    chunks_merged: int = 0  # örtüşen/bitişik komşusuyla birleştirilen
+    duplicates: int = 0  # aynı id/metin ile tekrar gelen
+    overlap_tokens_removed: int = 0
+    raw_tokens: int = 0  # kullanılan parçaların birleştirilmeden önceki toplamı
+    context_tokens: int = 0
+    truncated: bool = False
+    dropped_ids: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d.pop("dropped_ids")
+        return d
+
+
+def _source(meta: dict, node) -> str:
+    src = (
+        meta.get("file_path")
+        or meta.get("file_name")
+        or meta.get("source")
+        or meta.get("doc_id")
+    )
+    return str(src or getattr(node, "ref_doc_id", None) or getattr(node, "node_id", ""))
+
+
+def _chunks(contexts: Sequence[NodeWithScore]) -> Tuple[List[_Chunk], int]:
+    out: List[_Chunk] = []
+    seen = set()
+    dupes = 0
+    for i, nws in enumerate(contexts):
+        node = getattr(nws, "node", nws)
+        text = (getattr(node, "text", None) or "").strip()
+        if not text:
+            continue
+        node_id = str(getattr(node, "node_id", "") or i)
+        if node_id in seen or text in seen:
+            dupes += 1
+            continue
+        seen.update((node_id, text))
+        meta = getattr(node, "metadata", None) or {}
+        raw = getattr(node, "text", "") or ""
+        start = getattr(node, "start_char_idx", None)
+        end = getattr(node, "end_char_idx", None)
+        if start is not None and end is not None and end - start == len(raw):
+            # Konumları strip() edilmiş metne kaydır
+            start += len(raw) - len(raw.lstrip())
+            end = start + len(text)
+        else:
+            start = end = None  # konum yok ya da metinle tutarsız
+        out.append(
+            _Chunk(
+                i,
+                node_id,
+                _source(meta, node),
+                text,
+                getattr(nws, "score", None),
+                start,
+                end,
+            )
+        )
+    return out, dupes
+
+
+def _text_overlap(a: str, b: str) -> int:
+    """a'nın sonu ile b'nin başındaki en uzun ortak metnin uzunluğu (yoksa 0)."""
+    limit = min(len(a), len(b), MAX_OVERLAP_CHARS)
+    for n in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def _join(chunks: List[_Chunk]) -> Tuple[str, int]:
+    """
+    Aynı dosyanın parçalarını belge sırasıyla tek metne çevirir; (metin, örtüşen/bitişik
+    komşusuyla birleşen parça sayısı) döndürür. Bitişik olmayan bölümler ayraçla ayrılır.
+    """
+    if all(c.start is not None for c in chunks):
+        ordered = sorted(chunks, key=lambda c: c.start)  # type: ignore[arg-type,return-value]
+        segments: List[List] = []  # [metin, bitiş]
+        merged = 0
+        for c in ordered:
+            if segments and c.start <= segments[-1][1]:  # type: ignore[operator]
+                seg = segments[-1]
+                if c.end > seg[1]:  # type: ignore[operator]
+                    seg[0] += c.text[seg[1] - c.start :]
+                    seg[1] = c.end
+                merged += 1
+            else:
+                segments.append([c.text, c.end])
+        return GAP_MARKER.join(s[0] for s in segments), merged
+
+    # Konum yok: rerank sırasıyla, sonek/önek örtüşmesi olan parçaları zincirle
+    segments_t: List[str] = []
+    merged = 0
+    for c in sorted(chunks, key=lambda c: c.rank):
+        text = c.text
+        for j, seg in enumerate(segments_t):
+            if text in seg:
+                merged += 1
+                break
+            cut = _text_overlap(seg, text)
+            if cut:
+                segments_t[j] = seg + text[cut:]
+                merged += 1
+                break
+            cut = _text_overlap(text, seg)
+            if cut:
+                segments_t[j] = text + seg[cut:]
+                merged += 1
+                break
+        else:
+            segments_t.append(text)
+    return GAP_MARKER.join(segments_t), merged
+
+
+def pack_contexts(
+    contexts: Sequence[NodeWithScore],
+    model: str,
+    budget: Optional[int] = None,
+    label: Callable[[int, str], str] = lambda i, src: f"[Belge {i + 1} | {src}]:\n",
+    tokenizer: Optional[Tokenizer] = None,
+) -> Tuple[List[Passage], PackStats]:
+    """
+    Parçaları rerank sırasıyla (contexts sırası) bütçeye yerleştirir. Pasaj sırası en iyi
+    parçasının sırasıdır. budget None → CONTEXT_TOKEN_BUDGET, 0 → sınırsız. Bütçe
+    etiketleri ve pasaj ayraçlarını da kapsar (soru ve sistem promptu hariç).
+    """
+    tok = tokenizer or get_tokenizer(model)
+    budget = DEFAULT_BUDGET if budget is None else budget
+    chunks, dupes = _chunks(contexts)
+    stats = PackStats(
+        tokenizer=tok.name, budget=budget, chunks_in=len(contexts), duplicates=dupes
+    )
+    sep_tokens = tok.count("\n\n")
+
+    groups: Dict[str, List[_Chunk]] = {}
+    order: List[str] = []
+    costs: Dict[str, int] = {}
+    texts: Dict[str, str] = {}
+    merges: Dict[str, int] = {}
+    total = 0
+    for c in chunks:
+        members = groups.get(c.source, []) + [c]
+        text, merged = _join(members)
+        slot = len(order) if c.source not in groups else order.index(c.source)
+        cost = tok.count(label(slot, os.path.basename(c.source)) + text)
+        cost += sep_tokens if c.source not in groups and order else 0
+        delta = cost - costs.get(c.source, 0)
+        if budget and total + delta > budget:
+            if total == 0:
+                # En iyi parça tek başına sığmıyor: bütçeye kırp
+                head = tok.count(label(0, os.path.basename(c.source)))
+                text = tok.truncate(text, max(0, budget - head)).strip()
+                cost, delta = budget, budget
+                stats.truncated = True
+            else:
+                continue  # sığmadı; sonraki (daha kısa) parçalar denenir
+        if c.source not in groups:
+            order.append(c.source)
+        groups[c.source] = members
+        texts[c.source] = text
+        merges[c.source] = merged
+        costs[c.source] = cost
+        total += delta
+        stats.raw_tokens += tok.count(c.text)
+        if stats.truncated:
+            break
+
+    passages: List[Passage] = []
+    for src in order:
+        members = groups[src]
+        text = texts[src]
+        stats.chunks_used += len(members)
+        stats.chunks_merged += merges[src]
+        best = members[0]
+        passages.append(
+            Passage(
+                source=src,
+                text=text,
+                score=best.score,
+                node_ids=[m.node_id for m in members],
+                tokens=tok.count(text),
+            )
+        )
+    used = {nid for p in passages for nid in p.node_ids}
+    stats.dropped_ids = [c.node_id for c in chunks if c.node_id not in used]
+    stats.chunks_dropped = len(stats.dropped_ids)
+    used_tokens = sum(p.tokens for p in passages)
+    if not stats.truncated:
+        stats.overlap_tokens_removed = max(0, stats.raw_tokens - used_tokens)
+    stats.context_tokens = total
+    return passages, stats
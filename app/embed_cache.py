@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Matris dosyası büyütülürken en az bu kadar satır ayrılır
+_MIN_CAPACITY = 1024
+
+
+def normalize_text(text: str) -> str:
+    """Önbellek anahtarı için: NFC unicode + boşlukları tek boşluğa indirme."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+class EmbeddingCache:
+    """
+    Parça embedding'leri için kalıcı disk önbelleği.
+
+    Model başına bir klasör tutulur (`<cache_dir>/<model>/`):
+        - vectors.f32 : (kapasite, dim) float32 matris, np.memmap ile açılır
+        - index.json  : normalize edilmiş metin hash'i → satır numarası
+
+    Anahtar (model adı, normalize metin hash'i) olduğundan chunk boyutu ya da index
+    tipi değişse bile içeriği aynı kalan parçaların vektörleri yeniden kullanılır.
+    Tek yazar varsayılır (embedder); okuyucular dosyayı paylaşabilir.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: str = "db/embed_cache",
+    ):
+        self.model_name = model_name
+        self.dir = Path(cache_dir) / _model_slug(model_name)
+        self.index_path = self.dir / "index.json"
+        self.matrix_path = self.dir / "vectors.f32"
+
+        self.dim: Optional[int] = None
+        self.rows: int = 0
+        self.keys: Dict[str, int] = {}
+        self._capacity = 0
+        self._mm: Optional[np.memmap] = None
+        self._dirty = False
+        self._load()
+
+    # ------------------------- Yükleme / kayıt -------------------------
+    def _load(self) -> None:
+        if not self.index_path.exists() or not self.matrix_path.exists():
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"[embed_cache] Önbellek indeksi okunamadı ({e}), boş başlatılıyor.")
+            return
+        if meta.get("model") != self.model_name or not meta.get("dim"):
+            return
+        self.dim = int(meta["dim"])
+        self.rows = int(meta.get("rows", 0))
+        self.keys = dict(meta.get("keys", {}))
+        self._capacity = os.path.getsize(self.matrix_path) // (4 * self.dim)
+        if self.rows > self._capacity:
+            # Yarım kalmış yazım: matris indeksin gerisinde
+            print("[embed_cache] Önbellek tutarsız, boş başlatılıyor.")
+            self.rows, self.keys = 0, {}
+        self._open("r+")
+
+    def _open(self, mode: str) -> None:
+        if self.dim is None or self._capacity == 0:
+            self._mm = None
+            return
+        self._mm = np.memmap(
+            self.matrix_path,
+            dtype="float32",
+            mode=mode,
+            shape=(self._capacity, self.dim),
+        )
+
+    def _grow(self, needed_rows: int) -> None:
+        if needed_rows <= self._capacity:
+            return
+        new_capacity = max(needed_rows, self._capacity * 2, _MIN_CAPACITY)
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm = None
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._capacity = new_capacity
+        self._open("r+")
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        if self._mm is not None:
+            self._mm.flush()
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model": self.model_name,
+                    "dim": self.dim,
+                    "rows": self.rows,
+                    "keys": self.keys,
+                },
+                f,
+            )
+        os.replace(tmp, self.index_path)
+        self._dirty = False
+
+    # ------------------------- Okuma / yazma -------------------------
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        for text in texts:
+            row = self.keys.get(text_key(text))
+            if row is None or self._mm is None:
+                out.append(None)
+            else:
+                out.append(np.array(self._mm[row]))
+        return out
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype="float32")
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding boyutu uyuşmuyor: önbellek {self.dim}, gelen {vectors.shape[1]}"
+            )
+
+        new_items: Dict[str, np.ndarray] = {}
+        for text, vec in zip(texts, vectors):
+            key = text_key(text)
+            if key not in self.keys:
+                new_items.setdefault(key, vec)
+        if not new_items:
+            return
+        self._grow(self.rows + len(new_items))
+        assert self._mm is not None
+        for key, vec in new_items.items():
+            self._mm[self.rows] = vec
+            self.keys[key] = self.rows
+            self.rows += 1
+        self._dirty = True
+
+    def __len__(self) -> int:
+        return self.rows
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+if TYPE_CHECKING:
+    from llama_index.embeddings import HuggingFaceEmbedding
+
+from app.embed_cache import EmbeddingCache
+from app.model_registry import get_embedding_model
+
+# Worker süreçlerinde yüklenen model (süreç başına bir kez)
+_WORKER_MODEL: Optional[HuggingFaceEmbedding] = None
+
+
+def _init_worker(model_name: str, batch_size: int, threads: int) -> None:
+    global _WORKER_MODEL
+    # Her worker kendi çekirdek payını kullanır; tokenizer thread'leri çakışmasın
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from llama_index.embeddings import HuggingFaceEmbedding
+
+    _WORKER_MODEL = HuggingFaceEmbedding(
+        model_name=model_name, embed_batch_size=batch_size
+    )
+
+
+def _embed_shard(texts: List[str]) -> np.ndarray:
+    assert _WORKER_MODEL is not None, "Worker başlatılmadı."
+    return np.asarray(_WORKER_MODEL.get_text_embedding_batch(texts), dtype="float32")
+
+
+@dataclass
+class EmbedStats:
+    chunks: int = 0
+    seconds: float = 0.0
+    cache_hits: int = 0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+
+class EmbeddingPipeline:
+    """
+    Parça metinlerini batch'ler halinde embed eder.
+
+    workers > 1 ise parçalar süreç havuzundaki worker'lara shard'lanır; her worker modeli
+    bir kez yükler ve `cpu_count // workers` torch thread'i kullanır. Sonuç, giriş
+    sırasını koruyan (n, dim) float32 matristir.
+
+    cache verilirse önce önbelleğe bakılır; yalnızca eksik parçalar modelden geçirilir
+    ve sonuçları önbelleğe yazılır.
+
+    progress verilirse her batch/shard sonrası (tamamlanan, toplam) parça sayısıyla çağrılır.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_size: int = 64,
+        workers: int = 1,
+        threads_per_worker: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.model_name = model_name
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // self.workers
+        )
+        self.cache = cache
+        self.progress = progress
+        self._base = self._total = 0
+        self._embed_model: Optional[HuggingFaceEmbedding] = None
+        self.stats = EmbedStats()
+
+    @property
+    def embed_model(self) -> HuggingFaceEmbedding:
+        """
+        Ana süreçteki fp32 model (tek süreç modu ve sorgu tarafı için); retriever ile
+        aynı süreçteyse model_registry üzerinden aynı örnek paylaşılır.
+        """
+        if self._embed_model is None:
+            self._embed_model = get_embedding_model(self.model_name, backend="torch")
+        return self._embed_model
+
+    def _report(self, done: int) -> None:
+        if self.progress is not None:
+            self.progress(self._base + done, self._total)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        t0 = time.perf_counter()
+        self._total = len(texts)
+        if self.cache is None:
+            self._base = 0
+            vectors = self._compute(texts)
+            hits = 0
+        else:
+            cached = self.cache.get_many(texts)
+            missing = [i for i, vec in enumerate(cached) if vec is None]
+            hits = len(texts) - len(missing)
+            # Önbellekten gelenler tamamlanmış sayılır
+            self._base = hits
+            self._report(0)
+            fresh = self._compute([texts[i] for i in missing])
+            if missing:
+                self.cache.put_many([texts[i] for i in missing], fresh)
+                self.cache.flush()
+            for i, vec in zip(missing, fresh):
+                cached[i] = vec
+            vectors = (
+                np.vstack(cached).astype("float32", copy=False)
+                if texts
+                else np.zeros((0, 0), dtype="float32")
+            )
+        elapsed = time.perf_counter() - t0
+
+        self.stats.chunks += len(texts)
+        self.stats.seconds += elapsed
+        self.stats.cache_hits += hits
+        if texts:
+            print(
+                f"[embed_pipeline] {len(texts)} parça {elapsed:.1f} sn'de embed edildi "
+                f"({len(texts) / max(elapsed, 1e-9):.1f} parça/sn, önbellekten {hits}, "
+                f"workers={self.workers}, batch={self.batch_size})"
+            )
+        return vectors
+
+    def _compute(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        if self.workers == 1 or len(texts) <= self.batch_size:
+            # Paylaşılan modelin embed_batch_size'ı değiştirilmez; batch'leme burada
+            model = self.embed_model
+            vectors: List[List[float]] = []
+            for start in tqdm(
+                range(0, len(texts), self.batch_size),
+                desc="Generating embeddings",
+                disable=len(texts) <= self.batch_size,
+            ):
+                vectors.extend(
+                    model._get_text_embeddings(texts[start : start + self.batch_size])
+                )
+                self._report(len(vectors))
+            return np.asarray(vectors, dtype="float32")
+        return self._embed_parallel(texts)
+
+    def _embed_parallel(self, texts: List[str]) -> np.ndarray:
+        # Worker başına birkaç shard: yük dengesi için, batch boyutunun katı olacak şekilde
+        per_shard = math.ceil(len(texts) / (self.workers * 4))
+        per_shard = max(
+            self.batch_size, math.ceil(per_shard / self.batch_size) * self.batch_size
+        )
+        shards = [texts[i : i + per_shard] for i in range(0, len(texts), per_shard)]
+
+        with ProcessPoolExecutor(
+            max_workers=min(self.workers, len(shards)),
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.batch_size, self.threads_per_worker),
+        ) as pool:
+            parts = []
+            for part in pool.map(_embed_shard, shards):
+                parts.append(part)
+                self._report(sum(len(p) for p in parts))
+        return np.vstack(parts)
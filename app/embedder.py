@@ -1,23 +1,229 @@
+import argparse
+import bisect
+import hashlib
+import json
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Callable, Dict, List, Literal, Optional
 
-import faiss
-from tqdm import tqdm
+import numpy as np
 
 from llama_index import SimpleDirectoryReader, ServiceContext, VectorStoreIndex
-from llama_index.embeddings import HuggingFaceEmbedding
+from llama_index import load_index_from_storage
+from llama_index.schema import BaseNode, Document, MetadataMode
 from llama_index.text_splitter import SentenceSplitter
 from llama_index import StorageContext
 from llama_index.vector_stores import FaissVectorStore
 
+from app.code_index import write_code_index
+from app.embed_cache import EmbeddingCache
+from app.embed_pipeline import EmbeddingPipeline
+from app.index_factory import (
+    INDEX_KINDS,
+    IndexKind,
+    IndexSpec,
+    load_spec,
+    make_index,
+    save_spec,
+    supports_removal,
+    train_index,
+)
+from app import snapshots
+from app.lexical_index import write_lexical_index
+from app.locks import build_lock
+from app.node_store import write_node_store
+from app.shard_index import write_shard_index
 
+# Persist klasöründe dosya → node eşlemesini tutan manifest
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+# İlerleme geri çağrısı: (aşama, tamamlanan, toplam); aşamalar load (dosya),
+# split / embed (parça) ve persist
+ProgressFn = Callable[[str, int, int], None]
+
+
+def _no_progress(stage: str, done: int, total: int) -> None:
+    pass
+
+
+# ----------------------------- Manifest -----------------------------
+def _file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _scan_files(data_path: Path) -> Dict[str, Path]:
+    """SimpleDirectoryReader ile aynı kümeyi döndürür (gizli dosyalar hariç, özyinelemesiz)."""
+    return {
+        p.name: p
+        for p in sorted(data_path.iterdir())
+        if p.is_file() and not p.name.startswith(".")
+    }
+
+
+def _load_manifest(persist_dir: str) -> Optional[dict]:
+    path = Path(persist_dir) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"[embedder] Manifest okunamadı ({e}), tam yeniden oluşturma yapılacak.")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _save_manifest(persist_dir: str, manifest: dict) -> None:
+    path = Path(persist_dir) / MANIFEST_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _file_entry(path: Path, node_ids: List[str], sha256: Optional[str] = None) -> dict:
+    st = path.stat()
+    return {
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "sha256": sha256 or _file_sha256(path),
+        "node_ids": node_ids,
+    }
+
+
+def _is_unchanged(path: Path, entry: dict) -> tuple[bool, Optional[str]]:
+    """Önce boyut/mtime, gerekirse içerik hash'i ile karşılaştırır. (aynı mı, hash)"""
+    st = path.stat()
+    if st.st_size == entry.get("size") and st.st_mtime == entry.get("mtime"):
+        return True, entry.get("sha256")
+    if st.st_size != entry.get("size"):
+        return False, None
+    sha = _file_sha256(path)
+    return sha == entry.get("sha256"), sha
+
+
+# ----------------------------- Yardımcılar -----------------------------
+def _load_documents(files: List[Path]) -> List[Document]:
+    if not files:
+        return []
+    return SimpleDirectoryReader(input_files=[str(p) for p in files]).load_data()
+
+
+def _group_node_ids(nodes: List[BaseNode]) -> Dict[str, List[str]]:
+    """Node id'lerini kaynak dosya adına göre gruplar."""
+    grouped: Dict[str, List[str]] = {}
+    for node in nodes:
+        src = (node.metadata or {}).get("file_name") or Path(
+            str((node.metadata or {}).get("file_path", ""))
+        ).name
+        grouped.setdefault(src, []).append(node.node_id)
+    return grouped
+
+
+def _remove_nodes(index: VectorStoreIndex, node_ids: List[str]) -> int:
+    """
+    Verilen node'ların vektörlerini FAISS'ten, metinlerini docstore'dan siler.
+
+    IndexFlat.remove_ids kalan vektörleri sıralarını koruyarak sıkıştırır; bu yüzden
+    index_struct içindeki vektör pozisyonları silinenlerin sayısı kadar kaydırılır.
+    """
+    drop = set(node_ids)
+    if not drop:
+        return 0
+    nodes_dict = index.index_struct.nodes_dict
+    removed = sorted(int(vid) for vid, nid in nodes_dict.items() if nid in drop)
+    if removed:
+        index.vector_store.client.remove_ids(np.asarray(removed, dtype="int64"))
+
+    remapped: Dict[str, str] = {}
+    for vid, nid in nodes_dict.items():
+        if nid in drop:
+            continue
+        pos = int(vid)
+        remapped[str(pos - bisect.bisect_left(removed, pos))] = nid
+    index.index_struct.nodes_dict = remapped
+    for nid in drop:
+        index.docstore.delete_document(nid, raise_error=False)
+    index.storage_context.index_store.add_index_struct(index.index_struct)
+    return len(removed)
+
+
+def _node_ids(nodes: List[BaseNode]) -> List[str]:
+    return [n.node_id for n in nodes]
+
+
+def _embed_nodes(pipeline: EmbeddingPipeline, nodes: List[BaseNode]) -> np.ndarray:
+    # VectorStoreIndex ile aynı metin: içerik + embed'e açık metadata
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    return pipeline.embed(texts)
+
+
+def _add_embedded_nodes(
+    index: VectorStoreIndex, nodes: List[BaseNode], vectors: np.ndarray
+) -> None:
+    """
+    Vektörleri FAISS'e tek `add` çağrısıyla yazar; node'ları docstore ve index_struct'a
+    ekler. (FaissVectorStore.add node başına ayrı `add` çağırır.)
+    """
+    if not nodes:
+        return
+    faiss_index = index.vector_store.client
+    start = faiss_index.ntotal
+    faiss_index.add(np.ascontiguousarray(vectors, dtype="float32"))
+    for offset, node in enumerate(nodes):
+        node.embedding = None
+        index.index_struct.add_node(node, text_id=str(start + offset))
+    index.docstore.add_documents(nodes, allow_update=True)
+    index.storage_context.index_store.add_index_struct(index.index_struct)
+
+
+def _write_sidecars(
+    index: VectorStoreIndex,
+    persist_dir: str,
+    spec: IndexSpec,
+    vectors: Dict[str, np.ndarray],
+) -> None:
+    """
+    FAISS pozisyonuna bağlı yan dosyaları yazar: mmap node deposu (nodes.bin/.idx),
+    kod index'i (codes.json), BM25 index'i (bm25.json/.bin) ve kategori shard'ları (shards/).
+    `vectors` bu build'de embed edilen node id → vektör eşlemesidir (shard'lar için).
+    """
+    nodes_dict = index.index_struct.nodes_dict
+    nodes = index.docstore.get_nodes(list(nodes_dict.values()))
+    records = [(int(vid), n) for vid, n in zip(nodes_dict.keys(), nodes)]
+    write_node_store(persist_dir, records)
+    n_codes = write_code_index(persist_dir, records)
+    n_terms = write_lexical_index(persist_dir, records)
+    n_shards = write_shard_index(
+        persist_dir, records, index.vector_store.client, spec, vectors
+    )
+    print(
+        f"[embedder] Kod index'i: {n_codes} kod, BM25 sözlüğü: {n_terms} terim, "
+        f"{n_shards} kategori shard'ı"
+    )
+
+
+# ----------------------------- Build -----------------------------
 def build_index(
     data_dir: str = "data",
     persist_dir: str = "db/faiss_index",
     embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
     chunk_size: int = 500,
     metric: Literal["l2", "ip"] = "l2",
+    incremental: bool = False,
+    embed_batch_size: int = 64,
+    embed_workers: int = 1,
+    embed_cache_dir: Optional[str] = "db/embed_cache",
+    index_kind: IndexKind = "flat",
+    index_spec: Optional[IndexSpec] = None,
+    progress: Optional[ProgressFn] = None,
 ) -> None:
     """
     Belgeleri okuyup parçalara ayırır, embedding'leri çıkarır ve FAISS'e persist eder.
@@ -25,57 +231,304 @@ def build_index(
     metric:
         - "l2"  → IndexFlatL2 (normalizasyon gerekmez, stabil)
         - "ip"  → IndexFlatIP (cosine ≈ IP için embedding'leri normalleştirmeniz gerekir; bu örnekte L2 tercih edilir)
+
+    incremental:
+        True ise persist klasöründeki manifest (dosya başına boyut, mtime, sha256, node id'leri)
+        ile karşılaştırma yapılır; yalnızca yeni/değişen dosyalar embed edilir, silinen
+        dosyaların vektörleri kaldırılır. Manifest yoksa veya ayarlar değiştiyse tam
+        yeniden oluşturmaya düşer.
+
+    embed_batch_size / embed_workers:
+        Embedding batch boyutu ve süreç sayısı (bkz. `EmbeddingPipeline`). Vektörler
+        FAISS'e toplu `add` ile yazılır.
+
+    embed_cache_dir:
+        (model, normalize parça metni hash'i) anahtarlı kalıcı embedding önbelleği.
+        İçeriği değişmeyen parçalar yeniden embed edilmez. None → önbellek kapalı.
+
+    index_kind / index_spec:
+        flat (varsayılan), ivf_flat, hnsw veya ivf_pq (bkz. `app.index_factory`).
+        IVF tipleri örneklem üzerinde eğitilir. Flat dışı index'lerde vektör silinemediği
+        için artımlı modda silinen/değişen dosya varsa tam yeniden oluşturma yapılır.
+
+    progress:
+        (aşama, tamamlanan, toplam) geri çağrısı; arka plan alımı (app.ingest) ilerleme
+        ve ETA için kullanır.
+
+    Aynı persist klasörüne aynı anda tek build yazar (`<persist_dir>.lock`); ikinci
+    çağrı ilki bitene kadar bekler. Build yeni bir snapshot klasörüne yazılır ve bitince
+    atomik olarak yayınlanır (bkz. `app.snapshots`); çalışan retriever'lar yarım index
+    görmez, yeni sürümü kendileri yükler. Değişiklik yoksa yeni sürüm yayınlanmaz.
     """
-    data_path = Path(data_dir)
-    if not data_path.exists():
-        raise FileNotFoundError(f"'{data_dir}' klasörü bulunamadı.")
+    progress = progress or _no_progress
+    with build_lock(persist_dir):
+        data_path = Path(data_dir)
+        if not data_path.exists():
+            raise FileNotFoundError(f"'{data_dir}' klasörü bulunamadı.")
+
+        files = _scan_files(data_path)
+        if not files:
+            raise RuntimeError(
+                "Yüklenecek belge bulunamadı. Lütfen 'data/' içine dosyalar ekleyin."
+            )
+
+        spec = index_spec or IndexSpec(kind=index_kind, metric=metric)
+        settings = {
+            "embedding_model": embedding_model_name,
+            "chunk_size": chunk_size,
+            "metric": spec.metric,
+            "index": spec.to_dict(),
+        }
+        manifest = (
+            _load_manifest(snapshots.resolve(persist_dir)) if incremental else None
+        )
+        if incremental and (manifest is None or manifest.get("settings") != settings):
+            print(
+                "[embedder] Geçerli manifest yok veya ayarlar değişti → tam yeniden oluşturma."
+            )
+            manifest = None
+
+        print(f"[embedder] Embedding modeli yükleniyor: {embedding_model_name}")
+        pipeline = EmbeddingPipeline(
+            model_name=embedding_model_name,
+            batch_size=embed_batch_size,
+            workers=embed_workers,
+            cache=(
+                EmbeddingCache(embedding_model_name, cache_dir=embed_cache_dir)
+                if embed_cache_dir
+                else None
+            ),
+            progress=lambda done, total: progress("embed", done, total),
+        )
+        text_splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=50)
+        service_context = ServiceContext.from_defaults(
+            embed_model=pipeline.embed_model,
+            text_splitter=text_splitter,
+        )
+        # Yayınlanmış index dosyalarına dokunulmaz; artımlı build güncel olanın kopyasına yazar
+        target = snapshots.new_snapshot(persist_dir, copy_current=manifest is not None)
+        old_files = manifest.get("files") if manifest else None
+        try:
+            status = "rebuild"
+            if manifest is not None:
+                status = _incremental_build(
+                    files,
+                    target,
+                    manifest,
+                    pipeline,
+                    text_splitter,
+                    service_context,
+                    progress,
+                )
+            if status == "rebuild":
+                _full_build(
+                    data_path,
+                    files,
+                    target,
+                    settings,
+                    pipeline,
+                    text_splitter,
+                    service_context,
+                    spec,
+                    progress,
+                )
+        except BaseException:
+            snapshots.discard(target)
+            raise
+        if status == "unchanged":
+            snapshots.discard(target)
+            # Yalnızca dosya stat'ları tazelendi: manifest'i okuyucular kullanmaz, bu yüzden
+            # yayınlanmış snapshot'ta yerinde (atomik) güncellenir; aksi halde her build
+            # dokunulmuş dosyaları yeniden hash'ler
+            if manifest.get("files") != old_files:
+                _save_manifest(snapshots.resolve(persist_dir), manifest)
+        else:
+            snapshots.publish(persist_dir, target)
+            snapshots.gc(persist_dir)
 
-    print(f"[embedder] Belgeler '{data_dir}/' klasöründen yükleniyor...")
-    documents = SimpleDirectoryReader(data_dir).load_data()
+        if pipeline.stats.chunks:
+            print(
+                f"[embedder] Embedding toplamı: {pipeline.stats.chunks} parça, "
+                f"{pipeline.stats.chunks_per_sec:.1f} parça/sn, "
+                f"önbellek isabeti {pipeline.stats.cache_hits}"
+            )
+
+
+def _full_build(
+    data_path: Path,
+    files: Dict[str, Path],
+    persist_dir: str,
+    settings: dict,
+    pipeline: EmbeddingPipeline,
+    text_splitter: SentenceSplitter,
+    service_context: ServiceContext,
+    spec: IndexSpec,
+    progress: ProgressFn = _no_progress,
+) -> None:
+    print(f"[embedder] Belgeler '{data_path}/' klasöründen yükleniyor...")
+    progress("load", 0, len(files))
+    documents = _load_documents(list(files.values()))
+    progress("load", len(files), len(files))
     if not documents:
         raise RuntimeError(
             "Yüklenecek belge bulunamadı. Lütfen 'data/' içine dosyalar ekleyin."
         )
-
     print(f"[embedder] Toplam belge: {len(documents)}")
-    print(f"[embedder] Embedding modeli yükleniyor: {embedding_model_name}")
-    embed_model = HuggingFaceEmbedding(model_name=embedding_model_name)
 
-    # Boyutu belirlemek için tek seferlik probe
-    probe_vec = embed_model.get_text_embedding("dim_probe")
-    dim = len(probe_vec)
+    nodes = text_splitter.get_nodes_from_documents(documents, show_progress=True)
+    progress("split", 0, len(nodes))
+    vectors = _embed_nodes(pipeline, nodes)
+    dim = vectors.shape[1]
     print(f"[embedder] Embedding vektör boyutu: {dim}")
 
-    # FAISS index (varsayılan: L2 – normalizasyon gerektirmez)
-    if metric == "ip":
-        faiss_index = faiss.IndexFlatIP(dim)
-        print("[embedder] FAISS index: IndexFlatIP (inner product)")
-    else:
-        faiss_index = faiss.IndexFlatL2(dim)
-        print("[embedder] FAISS index: IndexFlatL2 (L2 distance)")
-
+    faiss_index = make_index(spec, dim, len(nodes))
+    train_s = train_index(faiss_index, vectors, spec.train_size)
+    if train_s:
+        print(f"[embedder] Index eğitimi {train_s:.1f} sn sürdü.")
     vector_store = FaissVectorStore(faiss_index=faiss_index)
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
-    text_splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=50)
-    service_context = ServiceContext.from_defaults(
-        embed_model=embed_model,
-        text_splitter=text_splitter,
-    )
-
     print("[embedder] Indeks oluşturma ve persist başlıyor...")
-    os.makedirs(persist_dir, exist_ok=True)
-    # Not: from_documents çağrısı, FAISS store'a otomatik olarak yazacaktır.
-    _ = VectorStoreIndex.from_documents(
-        documents,
+    progress("persist", 0, 1)
+    index = VectorStoreIndex(
+        [],
         storage_context=storage_context,
         service_context=service_context,
-        show_progress=True,
     )
+    _add_embedded_nodes(index, nodes, vectors)
     storage_context.persist(persist_dir=persist_dir)
+    _write_sidecars(index, persist_dir, spec, dict(zip(_node_ids(nodes), vectors)))
+    save_spec(persist_dir, spec)
+
+    grouped = _group_node_ids(nodes)
+    _save_manifest(
+        persist_dir,
+        {
+            "version": MANIFEST_VERSION,
+            "settings": settings,
+            "files": {
+                name: _file_entry(path, grouped.get(name, []))
+                for name, path in files.items()
+            },
+        },
+    )
+    progress("persist", 1, 1)
     print(f"[embedder] FAISS index başarıyla kaydedildi → {persist_dir}/")
 
 
+def _incremental_build(
+    files: Dict[str, Path],
+    persist_dir: str,
+    manifest: dict,
+    pipeline: EmbeddingPipeline,
+    text_splitter: SentenceSplitter,
+    service_context: ServiceContext,
+    progress: ProgressFn = _no_progress,
+) -> str:
+    """
+    Artımlı güncellemeyi uygular. "updated", "unchanged" ya da tam yeniden oluşturma
+    gerekiyorsa "rebuild" döner.
+    """
+    old_entries: Dict[str, dict] = manifest.get("files", {})
+    new_entries: Dict[str, dict] = {}
+    changed: List[str] = []
+    stale_node_ids: List[str] = []
+
+    for name, path in files.items():
+        entry = old_entries.get(name)
+        if entry is not None:
+            same, sha = _is_unchanged(path, entry)
+            if same:
+                # mtime değişmiş olabilir; güncel stat ile yeniden yaz
+                new_entries[name] = _file_entry(path, entry["node_ids"], sha)
+                continue
+            stale_node_ids.extend(entry.get("node_ids", []))
+        changed.append(name)
+    deleted = [name for name in old_entries if name not in files]
+    for name in deleted:
+        stale_node_ids.extend(old_entries[name].get("node_ids", []))
+
+    print(
+        f"[embedder] Artımlı güncelleme: {len(changed)} yeni/değişen, "
+        f"{len(deleted)} silinen, {len(new_entries)} değişmeyen dosya."
+    )
+    if not changed and not deleted:
+        # Hedef snapshot atılacak; yenilenen mtime'ları build_index yayınlanmış olana yazar
+        manifest["files"] = new_entries
+        print("[embedder] Değişiklik yok, index olduğu gibi bırakıldı.")
+        return "unchanged"
+    vector_store = FaissVectorStore.from_persist_dir(persist_dir=persist_dir)
+    if stale_node_ids and not supports_removal(vector_store.client):
+        print(
+            "[embedder] Flat olmayan index'ten vektör silinemez → tam yeniden oluşturma."
+        )
+        return "rebuild"
+
+    spec = load_spec(persist_dir)
+    storage_context = StorageContext.from_defaults(
+        persist_dir=persist_dir,
+        vector_store=vector_store,
+    )
+    index: VectorStoreIndex = load_index_from_storage(
+        storage_context=storage_context,
+        service_context=service_context,
+    )
+
+    removed = _remove_nodes(index, stale_node_ids)
+    if removed:
+        print(f"[embedder] {removed} eski vektör kaldırıldı.")
+
+    progress("load", 0, len(changed))
+    documents = _load_documents([files[name] for name in changed])
+    progress("load", len(changed), len(changed))
+    nodes = text_splitter.get_nodes_from_documents(documents, show_progress=True)
+    progress("split", 0, len(nodes))
+    vectors: Dict[str, np.ndarray] = {}
+    if nodes:
+        print(f"[embedder] {len(nodes)} yeni parça embed ediliyor...")
+        new_vectors = _embed_nodes(pipeline, nodes)
+        _add_embedded_nodes(index, nodes, new_vectors)
+        vectors = dict(zip(_node_ids(nodes), new_vectors))
+
+    grouped = _group_node_ids(nodes)
+    for name in changed:
+        new_entries[name] = _file_entry(files[name], grouped.get(name, []))
+    manifest["files"] = new_entries
+
+    progress("persist", 0, 1)
+    storage_context.persist(persist_dir=persist_dir)
+    _write_sidecars(index, persist_dir, spec, vectors)
+    _save_manifest(persist_dir, manifest)
+    progress("persist", 1, 1)
+    print(f"[embedder] FAISS index güncellendi → {persist_dir}/")
+    return "updated"
+
+
 if __name__ == "__main__":
     # İsterseniz metric="ip" verip (cosine için) kendi normalizasyon stratejinizi ekleyebilirsiniz.
-    build_index()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Yalnızca yeni/değişen dosyaları embed et (manifest tabanlı)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="Embedding batch boyutu"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Embedding süreç sayısı (CPU çekirdeği)"
+    )
+    parser.add_argument(
+        "--index", choices=INDEX_KINDS, default="flat", help="FAISS index tipi"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Kalıcı embedding önbelleğini kapat"
+    )
+    args = parser.parse_args()
+    build_index(
+        incremental=args.incremental,
+        embed_batch_size=args.batch_size,
+        embed_workers=args.workers,
+        embed_cache_dir=None if args.no_cache else "db/embed_cache",
+        index_kind=args.index,
+    )
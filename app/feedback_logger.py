@@ -1,14 +1,33 @@
 from __future__ import annotations
-import os, json, argparse
+import os, json, argparse, glob, gzip, shutil, threading
 from datetime import datetime, timezone
 from uuid import uuid4
-from typing import Any, Iterable
+from typing import Any, Iterable, Iterator
+
+from app.locks import file_lock
+from app.tracing import answered_model
 
 # Repo köküne göre mutlak log yolu (UI/CLI nereden çalışırsa çalışsın aynı dosyaya yazar)
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DEFAULT_LOG_PATH = os.path.join(ROOT_DIR, "logs", "queries.jsonl")
 LOG_PATH = os.getenv("RAG_LOG_PATH", DEFAULT_LOG_PATH)
 
+# Döndürme: aktif dosya bu boyutu aşınca ya da gün değişince sıkıştırılmış segmente taşınır
+# (logs/queries.20261018-201157.jsonl.gz). 0 → boyut sınırı yok.
+LOG_MAX_BYTES = int(os.getenv("RAG_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_DAILY = os.getenv("RAG_LOG_ROTATE_DAILY", "1").lower() not in (
+    "0",
+    "false",
+    "no",
+)
+
+# İsteğe bağlı SQLite deposu (bkz. app.feedback_store); verilirse kayıtlar oraya da yazılır
+FEEDBACK_DB = os.getenv("RAG_FEEDBACK_DB")
+
+_TAIL_BLOCK = 64 * 1024
+# Süreç içi thread'ler için; süreçler (Streamlit worker'ları, CLI) arası `<log>.lock` flock'u
+_ROTATE_LOCK = threading.Lock()
+
 
 def _now_iso() -> str:
     return (
@@ -33,9 +52,13 @@ def log_feedback(
     extra: dict | None = None,
     email: str | None = None,
     fb_id: str | None = None,
+    trace: dict | None = None,
     path: str = LOG_PATH,
 ) -> tuple[bool, str | None, str]:
-    """JSONL satırı olarak kaydeder. (ok, err, fb_id) döndürür."""
+    """
+    JSONL satırı olarak kaydeder. (ok, err, fb_id) döndürür.
+    trace: cevabı üreten isteğin izi (bkz. `app.tracing.Trace.to_dict`).
+    """
     _ensure_dir(path)
     fb_id = (
         fb_id or f"FB-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:6]}"
@@ -52,35 +75,277 @@ def log_feedback(
         "extra": extra or {},
         "email": email,
     }
+    if trace:
+        row["trace"] = trace
+    detached = None
     try:
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
-        return True, None, fb_id
+        # Yazım döndürmeyle aynı kilidi tutar: döndürme, açık olan eski dosyaya
+        # yazılan satırı kaybetmesin
+        with _ROTATE_LOCK, _rotate_lock(path):
+            try:
+                if _needs_rotation(path, LOG_MAX_BYTES, LOG_ROTATE_DAILY):
+                    detached = _detach_locked(path)
+            except Exception as e:
+                # Döndürme başarısız olsa da kayıt aktif dosyaya yazılır
+                print(f"[feedback_logger] Log döndürülemedi: {e!r}")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
     except Exception as e:
         return False, repr(e), fb_id
+    if detached:
+        _compress_segment(*detached)
+    if FEEDBACK_DB:
+        try:
+            from app.feedback_store import get_store
 
+            get_store(FEEDBACK_DB).add(row)
+        except Exception as e:
+            # JSONL asıl kayıttır; depo sonradan `--import` ile tamamlanabilir
+            print(f"[feedback_logger] SQLite deposuna yazılamadı: {e!r}")
+    return True, None, fb_id
 
-def tail(path: str = LOG_PATH, n: int = 20) -> list[dict[str, Any]]:
-    if not os.path.exists(path):
-        return []
+
+# ----------------------------- Döndürme -----------------------------
+def _segment_key(segment: str) -> tuple[str, int]:
+    # queries.<YYYYmmdd-HHMMSS>[-<sıra>].jsonl.gz → (zaman, sıra)
+    stamp = os.path.basename(segment)[: -len(".jsonl.gz")].rsplit(".", 1)[-1]
+    parts = stamp.split("-")
+    seq = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    return "-".join(parts[:2]), seq
+
+
+def segment_paths(path: str = LOG_PATH) -> list[str]:
+    """Döndürülmüş segmentler, eskiden yeniye."""
+    stem, _ = os.path.splitext(path)
+    return sorted(glob.glob(glob.escape(stem) + ".*.jsonl.gz"), key=_segment_key)
+
+
+def _needs_rotation(path: str, max_bytes: int, daily: bool) -> bool:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if st.st_size == 0:
+        return False
+    if max_bytes and st.st_size >= max_bytes:
+        return True
+    if daily:
+        last = datetime.fromtimestamp(st.st_mtime, timezone.utc).date()
+        return last < datetime.now(timezone.utc).date()
+    return False
+
+
+def _rotate_lock(path: str):
+    return file_lock(path + ".lock")
+
+
+def rotate(path: str = LOG_PATH) -> str | None:
+    """
+    Aktif dosyayı gzip segmentine taşır ve segment yolunu döndürür (dosya boşsa None).
+    Segment adı son yazım zamanını taşır; ad sırası kronolojik sıradır.
+    """
+    with _ROTATE_LOCK, _rotate_lock(path):
+        detached = _detach_locked(path)
+    return _compress_segment(*detached) if detached else None
+
+
+def _detach_locked(path: str) -> tuple[str, str] | None:
+    """
+    Aktif dosyayı segment adına ayırır; (ara dosya, segment yolu) döndürür. Kilit
+    altında çağrılır: yeni kayıtlar hemen yeni aktif dosyaya yazılır, sıkıştırma kilit
+    dışında yapılır.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if st.st_size == 0:
+        return None
+    stamp = datetime.fromtimestamp(st.st_mtime, timezone.utc).strftime("%Y%m%d-%H%M%S")
+    stem, _ = os.path.splitext(path)
+    name, i = f"{stem}.{stamp}", 1
+    # Sıkıştırması süren (ara/.tmp dosyası olan) segment adları da dolu sayılır
+    while any(
+        os.path.exists(name + ext)
+        for ext in (".jsonl.gz", ".jsonl.gz.tmp", ".rotating")
+    ):
+        name, i = f"{stem}.{stamp}-{i}", i + 1
+    pending = name + ".rotating"
+    try:
+        os.replace(path, pending)
+    except FileNotFoundError:
+        return None  # bu arada taşınmış (ör. kilit kullanmayan eski bir süreç)
+    return pending, name + ".jsonl.gz"
+
+
+def _compress_segment(pending: str, target: str) -> str:
+    with open(pending, "rb") as src, gzip.open(target + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(target + ".tmp", target)
+    os.remove(pending)
+    print(f"[feedback_logger] Log döndürüldü → {target}")
+    return target
+
+
+def maybe_rotate(
+    path: str = LOG_PATH,
+    max_bytes: int | None = None,
+    daily: bool | None = None,
+) -> str | None:
+    """Boyut veya gün sınırı aşıldıysa döndürür (her yazımdan önce tek stat çağrısı)."""
+    max_bytes = LOG_MAX_BYTES if max_bytes is None else max_bytes
+    daily = LOG_ROTATE_DAILY if daily is None else daily
+    if not _needs_rotation(path, max_bytes, daily):
+        return None
+    with _ROTATE_LOCK, _rotate_lock(path):
+        # Kilit beklenirken başka bir süreç döndürmüş olabilir
+        if not _needs_rotation(path, max_bytes, daily):
+            return None
+        detached = _detach_locked(path)
+    return _compress_segment(*detached) if detached else None
+
+
+# ----------------------------- Okuma -----------------------------
+def _parse(line: bytes | str) -> dict[str, Any] | None:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        row = json.loads(line)
+    except Exception:
+        return None
+    return row if isinstance(row, dict) else None
+
+
+def _reverse_lines(path: str, block_size: int = _TAIL_BLOCK) -> Iterator[bytes]:
+    """Dosyanın satırlarını sondan başa, bloklar halinde geri okuyarak verir."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b"\n")
+            # İlk parça bir önceki bloğun devamı olabilir; bir sonraki tura bırak
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                yield line
+        yield rest
+
+
+def _segment_rows(segment: str) -> list[dict[str, Any]]:
     rows = []
-    with open(path, "r", encoding="utf-8") as f:
+    with gzip.open(segment, "rb") as f:
         for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    rows.append(json.loads(line))
-                except Exception:
-                    pass
-    return rows[-n:]
+            row = _parse(line)
+            if row is not None:
+                rows.append(row)
+    return rows
+
+
+def iter_rows(path: str = LOG_PATH, segments: bool = True) -> Iterator[dict[str, Any]]:
+    """Tüm kayıtlar, eskiden yeniye (segmentler + aktif dosya)."""
+    for segment in segment_paths(path) if segments else []:
+        yield from _segment_rows(segment)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                row = _parse(line)
+                if row is not None:
+                    yield row
+
+
+def tail(path: str = LOG_PATH, n: int = 20) -> list[dict[str, Any]]:
+    """
+    Son n kayıt, eskiden yeniye (n <= 0 → tümü). Aktif dosya sondan geri okunur;
+    yetmezse en yeni segmentlerden tamamlanır. Maliyet log boyutuna değil n'e bağlıdır.
+    """
+    if n <= 0:
+        return list(iter_rows(path))
+    rows: list[dict[str, Any]] = []
+    if os.path.exists(path):
+        for line in _reverse_lines(path):
+            row = _parse(line)
+            if row is not None:
+                rows.append(row)
+                if len(rows) >= n:
+                    break
+    for segment in reversed(segment_paths(path)):
+        if len(rows) >= n:
+            break
+        rows.extend(reversed(_segment_rows(segment)[-(n - len(rows)) :]))
+    rows.reverse()
+    return rows
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def latency_report(rows: Iterable[dict]) -> list[dict[str, Any]]:
+    """İz içeren kayıtlardan model × aşama bazında gecikme yüzdelikleri (ms)."""
+    samples: dict[tuple[str, str], list[float]] = {}
+    for r in rows:
+        tr = r.get("trace") or {}
+        if not tr:
+            continue
+        # Hedge'de ikincil model kazanabilir; izdeki kazanan, satırdaki modelden önce gelir
+        model = answered_model(tr.get("attrs") or {}) or r.get("model") or "-"
+        stages = dict(tr.get("spans_ms") or {})
+        if tr.get("total_ms") is not None:
+            stages["total"] = tr["total_ms"]
+        for stage, ms in stages.items():
+            samples.setdefault((model, stage), []).append(float(ms))
+    return [
+        {
+            "model": model,
+            "stage": stage,
+            "n": len(v),
+            "p50_ms": round(_percentile(v, 50), 1),
+            "p95_ms": round(_percentile(v, 95), 1),
+            "p99_ms": round(_percentile(v, 99), 1),
+        }
+        for (model, stage), v in sorted(samples.items())
+    ]
+
+
+def _print_table(rows: list[dict[str, Any]]) -> None:
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
 
 
 def _cli():
     p = argparse.ArgumentParser()
     p.add_argument("--show", type=int, default=0, help="Son N kaydı göster")
     p.add_argument("--test", action="store_true", help="Test kaydı ekle")
+    p.add_argument(
+        "--latency",
+        action="store_true",
+        help="Model/aşama bazında gecikme yüzdelikleri",
+    )
+    p.add_argument(
+        "--limit", type=int, default=0, help="--latency için son N kayıt (0=tümü)"
+    )
+    p.add_argument(
+        "--rotate", action="store_true", help="Aktif log dosyasını hemen döndür"
+    )
     args = p.parse_args()
 
+    if args.rotate:
+        if rotate() is None:
+            print("Döndürülecek kayıt yok.")
+
     if args.test:
         ok, err, fid = log_feedback(
             question="Test sorusu",
@@ -98,6 +363,12 @@ def _cli():
             print(f"[{i}] {r.get('ts','')}  id={r.get('id','')}")
             print(json.dumps(r, ensure_ascii=False, indent=2))
             print()
+    if args.latency:
+        rows = latency_report(tail(n=args.limit))
+        if not rows:
+            print("İz (trace) içeren kayıt yok.")
+        else:
+            _print_table(rows)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+"""
+Geri bildirimler için isteğe bağlı SQLite deposu.
+
+JSONL logu (feedback_logger) asıl kayıttır; RAG_FEEDBACK_DB verilirse her kayıt buraya
+da yazılır. Depo ts, helpful ve model üzerinde indekslidir; kaynak belgeler ayrı bir
+tabloda tutulur. Böylece "son 50 olumsuz kayıt" ya da "model/belge bazında faydalı oranı"
+tüm geçmiş taranmadan hesaplanır.
+
+    python -m app.feedback_store --db logs/feedback.db --import     # JSONL + segmentleri aktar
+    python -m app.feedback_store --db logs/feedback.db --rate model
+    python -m app.feedback_store --db logs/feedback.db --rate source --since 2026-10-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable
+
+from app.feedback_logger import LOG_PATH, _print_table, iter_rows
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id       TEXT PRIMARY KEY,
+    ts       TEXT NOT NULL,
+    helpful  INTEGER NOT NULL,
+    model    TEXT,
+    question TEXT,
+    comment  TEXT,
+    row      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_feedback_ts ON feedback(ts);
+CREATE INDEX IF NOT EXISTS ix_feedback_helpful ON feedback(helpful, ts);
+CREATE INDEX IF NOT EXISTS ix_feedback_model ON feedback(model, ts);
+CREATE TABLE IF NOT EXISTS feedback_docs (
+    feedback_id TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    score       REAL,
+    PRIMARY KEY (feedback_id, source)
+);
+CREATE INDEX IF NOT EXISTS ix_feedback_docs_source ON feedback_docs(source);
+"""
+
+# helpful_rate gruplama anahtarları
+_GROUPS = {
+    "model": ("COALESCE(f.model, '-')", "feedback f"),
+    "source": ("d.source", "feedback_docs d JOIN feedback f ON f.id = d.feedback_id"),
+}
+
+
+class FeedbackStore:
+    """Thread-safe (tek bağlantı + kilit), WAL kipinde SQLite geri bildirim deposu."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    # ------------------------- Yazma -------------------------
+    def _insert(self, row: dict[str, Any]) -> None:
+        fb_id = row.get("id") or (row.get("extra") or {}).get("feedback_id")
+        if not fb_id or not row.get("ts"):
+            return
+        self._conn.execute(
+            "INSERT OR IGNORE INTO feedback (id, ts, helpful, model, question, comment, row)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                fb_id,
+                row["ts"],
+                1 if row.get("helpful") else 0,
+                row.get("model"),
+                row.get("question"),
+                row.get("comment"),
+                json.dumps(row, ensure_ascii=False),
+            ),
+        )
+        # Aynı dosyanın birden çok parçası tek satır sayılır (ilk = en yüksek skor)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO feedback_docs (feedback_id, source, score) VALUES (?, ?, ?)",
+            [
+                (fb_id, str(d["source"]), d.get("score"))
+                for d in row.get("docs") or []
+                if isinstance(d, dict) and d.get("source")
+            ],
+        )
+
+    def add(self, row: dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._insert(row)
+
+    def add_many(self, rows: Iterable[dict[str, Any]], batch_size: int = 1000) -> int:
+        """Toplu ekleme (aynı id'li kayıtlar atlanır); işlenen satır sayısını döndürür."""
+        n = 0
+        batch: list[dict[str, Any]] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                n += self._flush(batch)
+        return n + self._flush(batch)
+
+    def _flush(self, batch: list[dict[str, Any]]) -> int:
+        n = len(batch)
+        with self._lock, self._conn:
+            for row in batch:
+                self._insert(row)
+        batch.clear()
+        return n
+
+    def import_jsonl(self, path: str = LOG_PATH) -> int:
+        """JSONL logunu ve döndürülmüş segmentleri aktarır (tekrar çalıştırmak güvenlidir)."""
+        return self.add_many(iter_rows(path))
+
+    # ------------------------- Sorgular -------------------------
+    @staticmethod
+    def _where(
+        helpful: bool | None = None,
+        model: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> tuple[str, list[Any]]:
+        clauses, params = [], []
+        if helpful is not None:
+            clauses.append("f.helpful = ?")
+            params.append(1 if helpful else 0)
+        if model is not None:
+            clauses.append("f.model = ?")
+            params.append(model)
+        if since:
+            clauses.append("f.ts >= ?")
+            params.append(since)
+        if until:
+            clauses.append("f.ts < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def recent(
+        self,
+        limit: int = 50,
+        helpful: bool | None = None,
+        model: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Filtreye uyan en yeni kayıtlar, eskiden yeniye (tail ile aynı sıra)."""
+        where, params = self._where(helpful, model, since, until)
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT f.row FROM feedback f{where} ORDER BY f.ts DESC LIMIT ?",
+                params + [int(limit)],
+            )
+            rows = [json.loads(r["row"]) for r in cur.fetchall()]
+        rows.reverse()
+        return rows
+
+    def count(self, **filters: Any) -> int:
+        where, params = self._where(**filters)
+        with self._lock:
+            cur = self._conn.execute(f"SELECT COUNT(*) FROM feedback f{where}", params)
+            return int(cur.fetchone()[0])
+
+    def helpful_rate(
+        self,
+        by: str = "model",
+        since: str | None = None,
+        until: str | None = None,
+        min_count: int = 1,
+    ) -> list[dict[str, Any]]:
+        """model ya da source (kaynak belge) bazında kayıt sayısı ve faydalı oranı."""
+        if by not in _GROUPS:
+            raise ValueError(f"by {tuple(_GROUPS)} olmalı, verilen: {by!r}")
+        key, source = _GROUPS[by]
+        where, params = self._where(since=since, until=until)
+        sql = (
+            f"SELECT {key} AS k, COUNT(*) AS n, SUM(f.helpful) AS ok FROM {source}{where}"
+            f" GROUP BY k HAVING COUNT(*) >= ? ORDER BY n DESC, k"
+        )
+        with self._lock:
+            cur = self._conn.execute(sql, params + [int(min_count)])
+            return [
+                {
+                    by: r["k"],
+                    "n": r["n"],
+                    "helpful": r["ok"],
+                    "rate": round(r["ok"] / r["n"], 3),
+                }
+                for r in cur.fetchall()
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_STORES: dict[str, FeedbackStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(db_path: str) -> FeedbackStore:
+    """Süreç başına yol başına tek depo örneği."""
+    db_path = os.path.abspath(db_path)
+    with _STORES_LOCK:
+        store = _STORES.get(db_path)
+        if store is None:
+            store = _STORES[db_path] = FeedbackStore(db_path)
+        return store
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="Geri bildirim SQLite deposu")
+    p.add_argument("--db", default=os.getenv("RAG_FEEDBACK_DB") or "logs/feedback.db")
+    p.add_argument(
+        "--import",
+        dest="do_import",
+        action="store_true",
+        help="JSONL + segmentleri aktar",
+    )
+    p.add_argument("--log", default=LOG_PATH, help="--import için JSONL yolu")
+    p.add_argument(
+        "--rate", choices=tuple(_GROUPS), help="Faydalı oranı (model / kaynak belge)"
+    )
+    p.add_argument("--since", help="ISO zaman (ör. 2026-10-01)")
+    p.add_argument("--min-count", type=int, default=1)
+    p.add_argument("--show", type=int, default=0, help="Son N kaydı göster")
+    p.add_argument(
+        "--unhelpful", action="store_true", help="--show yalnızca olumsuzlar"
+    )
+    args = p.parse_args()
+
+    store = get_store(args.db)
+    if args.do_import:
+        n = store.import_jsonl(args.log)
+        print(
+            f"[feedback_store] {n} satır işlendi, depoda {store.count()} kayıt → {args.db}"
+        )
+    if args.rate:
+        rows = store.helpful_rate(args.rate, since=args.since, min_count=args.min_count)
+        if rows:
+            _print_table(rows)
+        else:
+            print("Kayıt yok.")
+    if args.show:
+        helpful = False if args.unhelpful else None
+        for r in store.recent(args.show, helpful=helpful, since=args.since):
+            flag = "+" if r.get("helpful") else "-"
+            print(
+                f"{r.get('ts', '')}  {flag}  {r.get('model') or '-'}  {(r.get('question') or '')[:100]}"
+            )
+
+
+if __name__ == "__main__":
+    _cli()
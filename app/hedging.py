@@ -0,0 +1,323 @@
+"""
+İstek başına süre sınırı (deadline) ve hedge edilmiş LLM istekleri.
+
+Birincil model uyarlamalı bir eşik içinde ilk token'ı göndermezse ikincil modele de
+istek atılır; ilk token'ı hangisi önce gönderirse cevap onundur, diğeri iptal edilir
+(HTTP akışının bağlantısı kapatılır, yerel modelde üretim durur). Birincil hata verirse
+eşik beklenmeden ikincile geçilir. Toplam süre `deadline`'ı aşarsa tüm denemeler iptal
+edilip DeadlineExceeded fırlatılır.
+
+Eşik, modelin son ilk-token sürelerinin `quantile` yüzdeliğidir (varsayılan p95);
+yeterli örnek yokken `initial_delay` kullanılır, sonuç [min_delay, max_delay]'e sıkıştırılır.
+
+    LLM_HEDGE_MODEL=llamacpp:models/...gguf   → ikincil model (yoksa hedge kapalı)
+    LLM_DEADLINE=30                           → istek başına toplam süre (sn, 0 → kapalı)
+    LLM_HEDGE_QUANTILE=95  LLM_HEDGE_AFTER=3  LLM_HEDGE_MIN=0.5  LLM_HEDGE_MAX=10
+
+Kazanan yol ize (`hedge` değeri) ve olay sayaçlarına (hedge_fired, hedge_primary_won,
+hedge_secondary_won, hedge_failover, llm_deadline_exceeded) yazılır.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterator, List, Optional
+
+from app import tracing
+
+if TYPE_CHECKING:
+    from app.llm_backends import LLMBackend
+
+
+class DeadlineExceeded(TimeoutError):
+    """LLM cevabı istek süresi içinde tamamlanmadı."""
+
+
+@dataclass(frozen=True)
+class HedgeConfig:
+    secondary: Optional[str] = None
+    deadline: float = 0.0  # sn; 0 → sınırsız
+    quantile: float = 95.0
+    initial_delay: float = 3.0  # yeterli örnek yokken eşik (sn)
+    min_delay: float = 0.5
+    max_delay: float = 10.0
+    min_samples: int = 20
+    window: int = 200  # model başına saklanan son ilk-token süresi
+
+    @classmethod
+    def from_env(cls) -> "HedgeConfig":
+        return cls(
+            secondary=os.getenv("LLM_HEDGE_MODEL") or None,
+            deadline=float(os.getenv("LLM_DEADLINE", "0")),
+            quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "95")),
+            initial_delay=float(os.getenv("LLM_HEDGE_AFTER", "3")),
+            min_delay=float(os.getenv("LLM_HEDGE_MIN", "0.5")),
+            max_delay=float(os.getenv("LLM_HEDGE_MAX", "10")),
+        )
+
+    def enabled_for(self, model: str) -> bool:
+        return self.deadline > 0 or bool(self.secondary and self.secondary != model)
+
+
+CONFIG = HedgeConfig.from_env()
+
+
+class TTFTTracker:
+    """Model başına son ilk-token süreleri ve bunlardan hedge eşiği; yol sayaçları."""
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = {}
+        self.wins: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float, window: int = 200) -> None:
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None or samples.maxlen != window:
+                samples = self._samples[model] = deque(samples or (), maxlen=window)
+            samples.append(seconds)
+
+    def threshold(self, model: str, config: HedgeConfig) -> float:
+        with self._lock:
+            samples = sorted(self._samples.get(model) or ())
+        if len(samples) < config.min_samples:
+            delay = config.initial_delay
+        else:
+            delay = samples[
+                min(len(samples) - 1, int(len(samples) * config.quantile / 100))
+            ]
+        return min(config.max_delay, max(config.min_delay, delay))
+
+    def record_win(self, path: str) -> None:
+        with self._lock:
+            self.wins[path] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "wins": dict(self.wins),
+                "samples": {m: len(s) for m, s in self._samples.items()},
+            }
+
+
+TRACKER = TTFTTracker()
+
+
+class CancelToken:
+    """Denemeyi başka bir thread'den durdurur; kayıtlı geri çağrılar (ör. resp.close) çalışır."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def on_cancel(self, fn: Callable[[], None]) -> None:
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:  # noqa: BLE001
+                # Kapatma hatası denemenin sonucunu değiştirmez
+                pass
+
+
+class _Attempt:
+    """Bir modele yapılan akış isteği; olayları (token / done / error) ortak kuyruğa yazar."""
+
+    def __init__(
+        self, path: str, model: str, backend: LLMBackend, events: "queue.Queue"
+    ):
+        self.path = path
+        self.model = model
+        self.backend = backend
+        self.events = events
+        self.cancel = CancelToken()
+        self.usage: dict = {}
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+
+    def start(
+        self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int
+    ):
+        ctx = contextvars.copy_context()
+        args = (system_prompt, user_prompt, temperature, max_tokens)
+        threading.Thread(
+            target=ctx.run,
+            args=(self._run, *args),
+            name=f"llm-{self.path}",
+            daemon=True,
+        ).start()
+        return self
+
+    def _run(
+        self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int
+    ):
+        try:
+            for delta in self.backend.stream(
+                self.model,
+                system_prompt,
+                user_prompt,
+                temperature,
+                max_tokens,
+                self.usage,
+                cancel=self.cancel,
+            ):
+                if self.cancel.cancelled:
+                    return
+                self.events.put(("token", self, delta))
+            if not self.cancel.cancelled:
+                self.events.put(("done", self, None))
+        except Exception as e:  # noqa: BLE001 - hata kuyruk üzerinden çağırana iletilir
+            if not self.cancel.cancelled:
+                self.events.put(("error", self, e))
+
+
+def hedged_stream(
+    model: str,
+    backend: LLMBackend,
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    usage: Optional[dict] = None,
+    outcome: Optional[dict] = None,
+    config: Optional[HedgeConfig] = None,
+    secondary_backend: Optional[LLMBackend] = None,
+    tracker: TTFTTracker = TRACKER,
+) -> Iterator[str]:
+    """
+    Birincil (model) ve gerekirse ikincil modelden gelen akışı yarıştırır; kazananın
+    token parçalarını üretir. `usage` verilirse kazananın token kullanımı, `outcome`
+    verilirse kazanan yol ve model ({"path", "model"}) yazılır.
+    """
+    cfg = config or CONFIG
+    secondary = cfg.secondary if cfg.secondary and cfg.secondary != model else None
+    if secondary and secondary_backend is None:
+        from app.llm_generator import get_backend
+
+        secondary_backend = get_backend(secondary)
+    t0 = time.perf_counter()
+    deadline_at = t0 + cfg.deadline if cfg.deadline > 0 else None
+    threshold = tracker.threshold(model, cfg)
+    hedge_at = t0 + threshold if secondary else None
+
+    events: "queue.Queue" = queue.Queue()
+    args = (system_prompt, user_prompt, temperature, max_tokens)
+    attempts = [_Attempt("primary", model, backend, events).start(*args)]
+    failed: List[_Attempt] = []
+    winner: Optional[_Attempt] = None
+
+    def _hedge(reason: str) -> None:
+        attempts.append(
+            _Attempt("secondary", secondary, secondary_backend, events).start(*args)
+        )
+        tracing.count(reason)
+
+    def _cancel_all(keep: Optional[_Attempt] = None) -> None:
+        for a in attempts:
+            if a is not keep and not a.cancel.cancelled:
+                a.cancel.cancel()
+                if a.first_token is None and a not in failed:
+                    # Sansürlü örnek: ilk token en az bu kadar sürecekti
+                    tracker.observe(
+                        a.model, time.perf_counter() - a.started, cfg.window
+                    )
+
+    def _next(until: Optional[float]):
+        timeout = None if until is None else max(0.0, until - time.perf_counter())
+        try:
+            return events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    try:
+        # 1) İlk token yarışı
+        while winner is None:
+            waits = [
+                t for t in (deadline_at, hedge_at if len(attempts) == 1 else None) if t
+            ]
+            ev = _next(min(waits) if waits else None)
+            now = time.perf_counter()
+            if ev is None:
+                if deadline_at is not None and now >= deadline_at:
+                    raise DeadlineExceeded(
+                        f"LLM {cfg.deadline:g} sn içinde cevap vermedi"
+                    )
+                _hedge("hedge_fired")
+                continue
+            kind, attempt, value = ev
+            if attempt.cancel.cancelled:
+                continue
+            if kind == "error":
+                failed.append(attempt)
+                if secondary and len(attempts) == 1:
+                    _hedge("hedge_failover")
+                    continue
+                if len(failed) == len(attempts):
+                    raise value
+                continue
+            winner = attempt
+            winner.first_token = now - winner.started
+            tracker.observe(winner.model, winner.first_token, cfg.window)
+            _cancel_all(keep=winner)
+            tracker.record_win(winner.path)
+            if outcome is not None:
+                outcome.update(path=winner.path, model=winner.model)
+            tracing.count(f"hedge_{winner.path}_won")
+            tracing.annotate(
+                hedge={
+                    "path": winner.path,
+                    "model": winner.model,
+                    "hedged": len(attempts) > 1,
+                    "threshold_ms": round(threshold * 1000, 1) if secondary else None,
+                    "ttft_ms": round((now - t0) * 1000, 1),
+                }
+            )
+            if kind == "done":
+                break
+            yield value
+
+        # 2) Kazananın akışının geri kalanı
+        while kind != "done":
+            ev = _next(deadline_at)
+            if ev is None:
+                raise DeadlineExceeded(
+                    f"LLM {cfg.deadline:g} sn içinde cevabı tamamlamadı"
+                )
+            kind, attempt, value = ev
+            if attempt is not winner:
+                continue
+            if kind == "error":
+                raise value
+            if kind == "token":
+                yield value
+        if usage is not None:
+            usage.update(winner.usage)
+    except DeadlineExceeded:
+        tracing.count("llm_deadline_exceeded")
+        raise
+    finally:
+        _cancel_all(keep=None if winner is None else winner)
+        if winner is not None:
+            winner.cancel.cancel()  # tüketici akışı erken bıraktıysa
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, FrozenSet, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass(frozen=True)
+class ClientConfig:
+    """
+    LLM HTTP istemcisi ayarları (senkron ve asenkron istemci aynı ayarları kullanır).
+
+    max_connections : havuzdaki keep-alive bağlantı sayısı
+    max_concurrency : aynı anda uçuşta olabilecek istek sayısı
+    max_retries     : 429/5xx ve bağlantı kurulamama hatalarında tekrar sayısı. Okuma
+                      zaman aşımı tekrar edilmez: POST idempotent değildir, istek
+                      sunucuda işlenmiş (ve ücretlendirilmiş) olabilir
+    backoff_base/max: jitter'lı üstel bekleme (sn); Retry-After varsa o kullanılır
+    """
+
+    timeout: float = 90.0
+    connect_timeout: float = 10.0
+    max_connections: int = 16
+    max_concurrency: int = 8
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 20.0
+    retry_statuses: FrozenSet[int] = field(
+        default_factory=lambda: frozenset({429, 500, 502, 503, 504})
+    )
+
+    @classmethod
+    def from_env(cls) -> "ClientConfig":
+        return cls(
+            timeout=float(os.getenv("LLM_HTTP_TIMEOUT", "90")),
+            max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "16")),
+            max_concurrency=int(os.getenv("LLM_HTTP_MAX_CONCURRENCY", "8")),
+            max_retries=int(os.getenv("LLM_HTTP_MAX_RETRIES", "3")),
+        )
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Retry-After başlığını (saniye veya HTTP tarihi) saniyeye çevirir."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(
+    config: ClientConfig, attempt: int, retry_after: Optional[str] = None
+) -> float:
+    """Retry-After varsa onu, yoksa 'full jitter' üstel bekleme süresini döndürür."""
+    ra = retry_after_seconds(retry_after)
+    if ra is not None:
+        return min(ra, config.backoff_max)
+    cap = min(config.backoff_max, config.backoff_base * (2**attempt))
+    return random.uniform(0, cap)
+
+
+def abort_response(resp: requests.Response) -> None:
+    """
+    Başka bir thread'de okunmakta olan stream yanıtını keser. resp.close() bekleyen okuma
+    bitene kadar bloklar; bunun yerine soket kapatılır, okuyan thread hemen EOF/hata alır
+    ve yanıtı kendisi kapatır. `Connection: close` yanıtlarında soket bağlantıdan
+    ayrılmıştır, http.client yanıtının dosya nesnesinden bulunur.
+    """
+    sock = getattr(getattr(resp.raw, "connection", None), "sock", None)
+    if sock is None:
+        fp = getattr(getattr(resp.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is None:
+        threading.Thread(target=resp.close, daemon=True).start()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class LLMHttpClient:
+    """
+    Bağlantı havuzlu (keep-alive), eşzamanlılık sınırlı ve tekrar denemeli senkron istemci.
+    Tek bir süreçte paylaşılır (bkz. `get_client`).
+    """
+
+    def __init__(self, config: Optional[ClientConfig] = None):
+        self.config = config or ClientConfig.from_env()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.config.max_connections,
+            max_retries=0,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = threading.BoundedSemaphore(self.config.max_concurrency)
+        self.retries = 0
+
+    @contextmanager
+    def post(
+        self, url: str, headers: dict, payload: dict, stream: bool = False
+    ) -> Iterator[requests.Response]:
+        """
+        POST isteği gönderir; tekrar denenebilir hatalarda bekleyip yeniden dener.
+        Yanıt, blok boyunca (stream tüketilirken de) eşzamanlılık slotunu tutar.
+        """
+        cfg = self.config
+        with self._slots:
+            attempt = 0
+            while True:
+                try:
+                    resp = self.session.post(
+                        url,
+                        headers=headers,
+                        json=payload,
+                        timeout=(cfg.connect_timeout, cfg.timeout),
+                        stream=stream,
+                    )
+                except requests.ConnectionError:
+                    # ConnectTimeout dahil; ReadTimeout (requests.Timeout) tekrar edilmez
+                    if attempt >= cfg.max_retries:
+                        raise
+                    time.sleep(backoff_delay(cfg, attempt))
+                    attempt += 1
+                    self.retries += 1
+                    continue
+
+                if resp.status_code in cfg.retry_statuses and attempt < cfg.max_retries:
+                    delay = backoff_delay(cfg, attempt, resp.headers.get("Retry-After"))
+                    resp.close()
+                    time.sleep(delay)
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                break
+            try:
+                yield resp
+            finally:
+                resp.close()
+
+    def post_json(self, url: str, headers: dict, payload: dict) -> tuple[int, Any]:
+        with self.post(url, headers, payload) as resp:
+            try:
+                body = resp.json()
+            except ValueError:
+                body = {"raw": resp.text}
+            return resp.status_code, body
+
+
+class AsyncLLMHttpClient:
+    """
+    LLMHttpClient'ın asyncio sürümü (aiohttp). Aynı ClientConfig ile havuz, eşzamanlılık
+    ve tekrar politikası uygulanır; event loop başına bir örnek kullanın.
+    """
+
+    def __init__(self, config: Optional[ClientConfig] = None):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError(
+                "Asenkron istemci için 'aiohttp' gerekli: pip install aiohttp"
+            ) from e
+        self._aiohttp = aiohttp
+        self.config = config or ClientConfig.from_env()
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._slots = asyncio.Semaphore(self.config.max_concurrency)
+        self.retries = 0
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            aiohttp = self._aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.config.max_connections),
+                timeout=aiohttp.ClientTimeout(
+                    total=self.config.timeout, connect=self.config.connect_timeout
+                ),
+            )
+        return self._session
+
+    def _connect_errors(self) -> tuple:
+        """İsteğin sunucuya ulaşmadığı (tekrar denenebilir) hatalar."""
+        aiohttp = self._aiohttp
+        errors = (aiohttp.ClientConnectorError,)
+        if hasattr(aiohttp, "ConnectionTimeoutError"):  # aiohttp >= 3.10
+            errors += (aiohttp.ConnectionTimeoutError,)
+        return errors
+
+    @asynccontextmanager
+    async def post(self, url: str, headers: dict, payload: dict) -> AsyncIterator[Any]:
+        cfg = self.config
+        retry_errors = self._connect_errors()
+        session = await self._get_session()
+        async with self._slots:
+            attempt = 0
+            while True:
+                try:
+                    resp = await session.post(url, headers=headers, json=payload)
+                except retry_errors:
+                    if attempt >= cfg.max_retries:
+                        raise
+                    await asyncio.sleep(backoff_delay(cfg, attempt))
+                    attempt += 1
+                    self.retries += 1
+                    continue
+
+                if resp.status in cfg.retry_statuses and attempt < cfg.max_retries:
+                    delay = backoff_delay(cfg, attempt, resp.headers.get("Retry-After"))
+                    resp.release()
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                break
+            try:
+                yield resp
+            finally:
+                resp.release()
+
+    async def post_json(
+        self, url: str, headers: dict, payload: dict
+    ) -> tuple[int, Any]:
+        async with self.post(url, headers, payload) as resp:
+            try:
+                body = await resp.json(content_type=None)
+            except ValueError:
+                body = {"raw": await resp.text()}
+            return resp.status, body
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_CLIENT: Optional[LLMHttpClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> LLMHttpClient:
+    """Süreç genelinde paylaşılan senkron istemci."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = LLMHttpClient()
+    return _CLIENT
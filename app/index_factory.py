@@ -0,0 +1,301 @@
+"""
+Seçilebilir FAISS index tipleri (flat, IVF-Flat, HNSW, IVF-PQ) ve recall/gecikme raporu.
+
+    python -m app.index_factory --report                 # persist edilmiş vektörlerle
+    python -m app.index_factory --report --synthetic 200000 --dim 384
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Literal, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+IndexKind = Literal["flat", "ivf_flat", "hnsw", "ivf_pq"]
+INDEX_KINDS = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# FaissVectorStore.persist'in yazdığı FAISS dosyası
+VECTOR_STORE_FILE = "default__vector_store.json"
+# Persist klasöründe index tipini ve sorgu zamanı varsayılanlarını tutan dosya
+SPEC_FILE = "index_spec.json"
+
+
+@dataclass
+class IndexSpec:
+    """
+    kind      : flat | ivf_flat | hnsw | ivf_pq
+    nlist     : IVF küme sayısı (None → ~4·√n)
+    hnsw_m    : HNSW komşu sayısı
+    pq_m      : PQ alt-vektör sayısı (dim'i bölmeli; None → dim/8'e en yakın bölen)
+    pq_nbits  : PQ kod başına bit
+    train_size: eğitim için örneklenecek en fazla vektör
+    nprobe / ef_search : sorgu zamanı varsayılanları (retriever'da ezilebilir)
+    """
+
+    kind: IndexKind = "flat"
+    metric: Literal["l2", "ip"] = "l2"
+    nlist: Optional[int] = None
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    pq_m: Optional[int] = None
+    pq_nbits: int = 8
+    train_size: int = 100_000
+    nprobe: int = 8
+    ef_search: int = 64
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "IndexSpec":
+        known = {k: v for k, v in d.items() if k in cls.__dataclass_fields__}
+        return cls(**known)
+
+
+def _faiss_metric(metric: str) -> int:
+    import faiss
+
+    return faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+
+def _pick_pq_m(dim: int, wanted: Optional[int]) -> int:
+    target = wanted or max(1, dim // 8)
+    divisors = [m for m in range(1, dim + 1) if dim % m == 0 and m <= target]
+    return max(divisors) if divisors else 1
+
+
+def make_index(spec: IndexSpec, dim: int, n_vectors: int) -> faiss.Index:
+    """Spec'e göre (henüz eğitilmemiş) FAISS index'i kurar."""
+    import faiss
+
+    metric = _faiss_metric(spec.metric)
+    kind = spec.kind
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        nlist = spec.nlist or max(1, int(4 * math.sqrt(max(n_vectors, 1))))
+        nlist = max(1, min(nlist, n_vectors))
+        quantizer = (
+            faiss.IndexFlatIP(dim) if spec.metric == "ip" else faiss.IndexFlatL2(dim)
+        )
+        if kind == "ivf_pq":
+            if n_vectors < (1 << spec.pq_nbits):
+                print(
+                    f"[index_factory] IVF-PQ için en az {1 << spec.pq_nbits} vektör gerekir "
+                    f"({n_vectors} var) → IVF-Flat kullanılıyor."
+                )
+                kind = "ivf_flat"
+            else:
+                pq_m = _pick_pq_m(dim, spec.pq_m)
+                index = faiss.IndexIVFPQ(
+                    quantizer, dim, nlist, pq_m, spec.pq_nbits, metric
+                )
+                print(
+                    f"[index_factory] FAISS index: IVF{nlist},PQ{pq_m}x{spec.pq_nbits}"
+                )
+                return index
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        print(f"[index_factory] FAISS index: IVF{nlist},Flat")
+        return index
+
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, spec.hnsw_m, metric)
+        index.hnsw.efConstruction = spec.ef_construction
+        print(f"[index_factory] FAISS index: HNSW{spec.hnsw_m}")
+        return index
+
+    if spec.metric == "ip":
+        print("[index_factory] FAISS index: IndexFlatIP (inner product)")
+        return faiss.IndexFlatIP(dim)
+    print("[index_factory] FAISS index: IndexFlatL2 (L2 distance)")
+    return faiss.IndexFlatL2(dim)
+
+
+def train_index(
+    index: faiss.Index, vectors: np.ndarray, train_size: int, seed: int = 0
+) -> float:
+    """Gerekiyorsa rastgele örneklem üzerinde eğitir; eğitim süresini (sn) döndürür."""
+    if index.is_trained:
+        return 0.0
+    sample = vectors
+    if len(vectors) > train_size:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), train_size, replace=False)]
+    t0 = time.perf_counter()
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+    return time.perf_counter() - t0
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """Pozisyonları kaydırarak silme (IndexFlat.remove_ids) yalnızca flat index'lerde güvenli."""
+    import faiss
+
+    return isinstance(index, faiss.IndexFlat)
+
+
+def set_search_params(
+    index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+) -> None:
+    """Sorgu zamanı parametrelerini uygular (index tipine uymayanlar yok sayılır)."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = int(min(nprobe, ivf.nlist))
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None and ef_search:
+        hnsw.efSearch = int(ef_search)
+
+
+def save_spec(persist_dir: str, spec: IndexSpec) -> None:
+    with open(Path(persist_dir) / SPEC_FILE, "w", encoding="utf-8") as f:
+        json.dump(spec.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+def load_spec(persist_dir: str) -> IndexSpec:
+    path = Path(persist_dir) / SPEC_FILE
+    if not path.exists():
+        return IndexSpec()
+    with open(path, "r", encoding="utf-8") as f:
+        return IndexSpec.from_dict(json.load(f))
+
+
+# ----------------------------- Rapor -----------------------------
+def _index_bytes(index: faiss.Index) -> int:
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def _synthetic(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Kümelenmiş sentetik embedding'ler (gerçek metin embedding'lerine daha yakın dağılım)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(16, n // 500), dim)).astype("float32")
+    labels = rng.integers(0, len(centers), size=n)
+    x = centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x.astype("float32")
+
+
+def _persisted_vectors(persist_dir: str) -> np.ndarray:
+    import faiss
+
+    path = Path(persist_dir) / VECTOR_STORE_FILE
+    index = faiss.read_index(str(path))
+    return np.asarray(index.reconstruct_n(0, index.ntotal), dtype="float32")
+
+
+def recall_report(
+    vectors: np.ndarray,
+    specs: List[IndexSpec],
+    k: int = 10,
+    n_queries: int = 200,
+    seed: int = 0,
+) -> List[dict]:
+    """
+    Her spec için recall@k (flat'e göre), sorgu gecikmesi (tekil p50/p95, batch
+    sorgu başına), eğitim/ekleme süresi ve serileştirilmiş index boyutunu ölçer.
+    """
+    rng = np.random.default_rng(seed)
+    n, dim = vectors.shape
+    q_idx = rng.choice(n, min(n_queries, n), replace=False)
+    queries = vectors[q_idx] + 0.05 * rng.normal(size=(len(q_idx), dim)).astype(
+        "float32"
+    )
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    k = min(k, n)
+
+    rows = []
+    truth = None
+    reference = IndexSpec(kind="flat", metric=specs[0].metric if specs else "l2")
+    for i, spec in enumerate([reference] + specs):
+        index = make_index(spec, dim, n)
+        train_s = train_index(index, vectors, spec.train_size, seed)
+        t0 = time.perf_counter()
+        index.add(vectors)
+        add_s = time.perf_counter() - t0
+        set_search_params(index, spec.nprobe, spec.ef_search)
+
+        t0 = time.perf_counter()
+        _, ids = index.search(queries, k)
+        batch_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        single = []
+        for q in queries[: min(50, len(queries))]:
+            t0 = time.perf_counter()
+            index.search(q[np.newaxis, :], k)
+            single.append((time.perf_counter() - t0) * 1000)
+
+        if truth is None:
+            truth = ids
+        recall = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ids, truth)]))
+        rows.append(
+            {
+                "kind": "flat (ref)" if i == 0 else spec.kind,
+                "nprobe": spec.nprobe if "ivf" in spec.kind else None,
+                "ef_search": spec.ef_search if spec.kind == "hnsw" else None,
+                f"recall@{k}": round(recall, 4),
+                "p50_ms": round(float(np.percentile(single, 50)), 3),
+                "p95_ms": round(float(np.percentile(single, 95)), 3),
+                "batch_ms_per_q": round(batch_ms, 3),
+                "train_s": round(train_s, 2),
+                "add_s": round(add_s, 2),
+                "size_mb": round(_index_bytes(index) / 2**20, 2),
+            }
+        )
+    return rows
+
+
+def _print_table(rows: List[dict]) -> None:
+    if not rows:
+        return
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="FAISS index tipi karşılaştırma raporu")
+    p.add_argument("--report", action="store_true")
+    p.add_argument("--persist-dir", default="db/faiss_index")
+    p.add_argument("--synthetic", type=int, default=0, help="N sentetik vektör kullan")
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--nprobe", type=int, nargs="*", default=[4, 16])
+    p.add_argument("--ef-search", type=int, nargs="*", default=[32, 128])
+    p.add_argument("--metric", choices=("l2", "ip"), default="l2")
+    args = p.parse_args()
+    if not args.report:
+        p.print_help()
+        return
+
+    if args.synthetic:
+        vectors = _synthetic(args.synthetic, args.dim)
+    else:
+        from app.snapshots import resolve
+
+        vectors = _persisted_vectors(resolve(args.persist_dir))
+    print(f"[index_factory] {len(vectors)} vektör, dim={vectors.shape[1]}")
+
+    specs: List[IndexSpec] = []
+    for nprobe in args.nprobe:
+        specs.append(IndexSpec(kind="ivf_flat", metric=args.metric, nprobe=nprobe))
+        specs.append(IndexSpec(kind="ivf_pq", metric=args.metric, nprobe=nprobe))
+    for ef in args.ef_search:
+        specs.append(IndexSpec(kind="hnsw", metric=args.metric, ef_search=ef))
+
+    _print_table(recall_report(vectors, specs, k=args.k, n_queries=args.queries))
+
+
+if __name__ == "__main__":
+    _cli()
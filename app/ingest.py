@@ -0,0 +1,425 @@
+"""
+Arka plan belge alımı: kalıcı iş kuyruğu, tek worker ve index yazım kilidi.
+
+UI yüklenen dosyaları `data/`ya yazar ve `submit()` ile kuyruğa bir iş ekler; embedding
+oturumu bloklamaz. Tek bir worker süreci (`python -m app.ingest --worker`, gerekirse
+`ensure_worker()` ile UI başlatır) bekleyen tüm işleri tek bir artımlı build'de birleştirir
+ve ilerlemeyi (dosya, parça, ETA) kuyruğa yazar; UI bunu `job_status()` ile okur.
+
+    db/ingest.db             → işler ve build ilerlemesi (SQLite, WAL)
+    db/ingest.worker.lock    → aynı anda tek worker
+    <persist_dir>.lock       → aynı anda tek build (build_index de alır)
+
+    python -m app.ingest --submit            # data/ için iş ekle
+    python -m app.ingest --worker            # kuyruğu işle (Ctrl+C ile durur)
+    python -m app.ingest --status
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.locks import file_lock
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", os.path.join(ROOT_DIR, "db", "ingest.db"))
+WORKER_LOG_PATH = os.path.join(ROOT_DIR, "logs", "ingest.log")
+
+# Bekleyen ilk iş görüldükten sonra arka arkaya gelen yüklemeler için kısa bekleme
+DEBOUNCE_S = float(os.getenv("INGEST_DEBOUNCE_S", "2"))
+POLL_S = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    created     REAL NOT NULL,
+    status      TEXT NOT NULL,          -- pending | running | done | failed
+    data_dir    TEXT NOT NULL,
+    persist_dir TEXT NOT NULL,
+    files       TEXT NOT NULL,          -- JSON liste (bilgi amaçlı; build tüm klasörü tarar)
+    build_id    TEXT,
+    error       TEXT,
+    finished    REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs(status, created);
+CREATE TABLE IF NOT EXISTS builds (
+    id           TEXT PRIMARY KEY,
+    started      REAL NOT NULL,
+    finished     REAL,
+    status       TEXT NOT NULL,         -- running | done | failed
+    stage        TEXT,
+    files_done   INTEGER DEFAULT 0,
+    files_total  INTEGER DEFAULT 0,
+    chunks_done  INTEGER DEFAULT 0,
+    chunks_total INTEGER DEFAULT 0,
+    eta_s        REAL,
+    error        TEXT
+);
+"""
+
+
+# ----------------------------- Kuyruk -----------------------------
+class JobQueue:
+    """SQLite tabanlı kalıcı iş kuyruğu (UI süreçleri ve worker aynı dosyayı paylaşır)."""
+
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def submit(
+        self,
+        files: Optional[List[str]] = None,
+        data_dir: str = "data",
+        persist_dir: str = "db/faiss_index",
+    ) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, created, status, data_dir, persist_dir, files)"
+                " VALUES (?, ?, 'pending', ?, ?, ?)",
+                (
+                    job_id,
+                    time.time(),
+                    os.path.abspath(data_dir),
+                    os.path.abspath(persist_dir),
+                    json.dumps(list(files or []), ensure_ascii=False),
+                ),
+            )
+        return job_id
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE status = 'pending' LIMIT 1"
+            ).fetchone()
+        return row is not None
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        En eski bekleyen işin hedefine (data_dir, persist_dir) ait TÜM bekleyen işleri tek
+        build'e bağlar. Döndürülen dict: build_id, data_dir, persist_dir, job_ids, files.
+        """
+        with self._lock, self._conn:
+            first = self._conn.execute(
+                "SELECT data_dir, persist_dir FROM jobs WHERE status = 'pending'"
+                " ORDER BY created LIMIT 1"
+            ).fetchone()
+            if first is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT id, files FROM jobs WHERE status = 'pending'"
+                " AND data_dir = ? AND persist_dir = ? ORDER BY created",
+                (first["data_dir"], first["persist_dir"]),
+            ).fetchall()
+            build_id = uuid.uuid4().hex[:12]
+            self._conn.execute(
+                "INSERT INTO builds (id, started, status, stage) VALUES (?, ?, 'running', 'queued')",
+                (build_id, time.time()),
+            )
+            job_ids = [r["id"] for r in rows]
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'running', build_id = ? WHERE id = ?",
+                [(build_id, jid) for jid in job_ids],
+            )
+        files = sorted({f for r in rows for f in json.loads(r["files"])})
+        return {
+            "build_id": build_id,
+            "data_dir": first["data_dir"],
+            "persist_dir": first["persist_dir"],
+            "job_ids": job_ids,
+            "files": files,
+        }
+
+    def update_build(self, build_id: str, **fields: Any) -> None:
+        if not fields:
+            return
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE builds SET {cols} WHERE id = ?", [*fields.values(), build_id]
+            )
+
+    def finish(self, claim: Dict[str, Any], error: Optional[str] = None) -> None:
+        status = "failed" if error else "done"
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE builds SET status = ?, finished = ?, error = ?, eta_s = 0 WHERE id = ?",
+                (status, now, error, claim["build_id"]),
+            )
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                [(status, now, error, jid) for jid in claim["job_ids"]],
+            )
+
+    def requeue_running(self) -> int:
+        """Çöken bir worker'dan kalan 'running' işleri bekleyene döndürür (worker açılışında)."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'pending', build_id = NULL WHERE status = 'running'"
+            )
+            self._conn.execute(
+                "UPDATE builds SET status = 'failed', error = 'worker durdu' WHERE status = 'running'"
+            )
+            return cur.rowcount
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """İş durumu; bağlı build varsa ilerlemesi 'progress' altında."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            job["files"] = json.loads(job["files"])
+            if job["status"] == "pending":
+                job["queue_position"] = (
+                    self._conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE status = 'pending' AND created < ?",
+                        (job["created"],),
+                    ).fetchone()[0]
+                    + 1
+                )
+            build = None
+            if job["build_id"]:
+                build = self._conn.execute(
+                    "SELECT * FROM builds WHERE id = ?", (job["build_id"],)
+                ).fetchone()
+        job["progress"] = dict(build) if build is not None else None
+        return job
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                ).fetchall()
+            )
+            last = self._conn.execute(
+                "SELECT * FROM builds ORDER BY started DESC LIMIT 1"
+            ).fetchone()
+        return {"jobs": counts, "last_build": dict(last) if last is not None else None}
+
+
+_QUEUES: Dict[str, JobQueue] = {}
+_QUEUES_LOCK = threading.Lock()
+
+
+def get_queue(path: str = QUEUE_PATH) -> JobQueue:
+    path = os.path.abspath(path)
+    with _QUEUES_LOCK:
+        queue = _QUEUES.get(path)
+        if queue is None:
+            queue = _QUEUES[path] = JobQueue(path)
+        return queue
+
+
+def submit(
+    files: Optional[List[str]] = None,
+    data_dir: str = "data",
+    persist_dir: str = "db/faiss_index",
+    start_worker: bool = True,
+) -> str:
+    """İş ekler (gerekirse worker'ı başlatır) ve iş kimliğini döndürür."""
+    job_id = get_queue().submit(files, data_dir=data_dir, persist_dir=persist_dir)
+    if start_worker:
+        ensure_worker()
+    return job_id
+
+
+def job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    return get_queue().job(job_id)
+
+
+# ----------------------------- Worker -----------------------------
+class _Progress:
+    """build_index ilerleme geri çağrısını kuyruğa yazar (en fazla ~2 yazım/sn)."""
+
+    def __init__(self, queue: JobQueue, build_id: str, min_interval: float = 0.5):
+        self.queue = queue
+        self.build_id = build_id
+        self.min_interval = min_interval
+        self._last = 0.0
+        self._embed_start: Optional[float] = None
+        self._embed_base = 0
+
+    def __call__(self, stage: str, done: int, total: int) -> None:
+        now = time.monotonic()
+        fields: Dict[str, Any] = {"stage": stage}
+        if stage == "load":
+            fields.update(files_done=done, files_total=total)
+        elif stage in ("split", "embed"):
+            fields.update(chunks_done=done, chunks_total=total)
+        if stage == "embed":
+            if self._embed_start is None:
+                # Önbellekten gelenler hemen sayılır; hız yalnızca hesaplananlardan
+                self._embed_start, self._embed_base = now, done
+            rate = (done - self._embed_base) / max(now - self._embed_start, 1e-9)
+            fields["eta_s"] = round((total - done) / rate, 1) if rate > 0 else None
+        final = done >= total
+        if final or now - self._last >= self.min_interval:
+            self._last = now
+            self.queue.update_build(self.build_id, **fields)
+
+
+def _run_build(
+    queue: JobQueue, claim: Dict[str, Any], build_kwargs: Dict[str, Any]
+) -> None:
+    from app.embedder import build_index
+
+    progress = _Progress(queue, claim["build_id"])
+    print(
+        f"[ingest] Build {claim['build_id']}: {len(claim['job_ids'])} iş, "
+        f"{len(claim['files'])} yüklenen dosya → {claim['persist_dir']}"
+    )
+    t0 = time.perf_counter()
+    try:
+        build_index(
+            data_dir=claim["data_dir"],
+            persist_dir=claim["persist_dir"],
+            incremental=True,
+            progress=progress,
+            **build_kwargs,
+        )
+    except Exception as e:
+        print(f"[ingest] Build {claim['build_id']} başarısız: {e!r}")
+        queue.finish(claim, error=repr(e))
+        return
+    queue.update_build(claim["build_id"], stage="done")
+    queue.finish(claim)
+    print(
+        f"[ingest] Build {claim['build_id']} tamamlandı ({time.perf_counter() - t0:.1f} sn)"
+    )
+
+
+def _worker_lock_path(queue_path: str) -> str:
+    return os.path.splitext(queue_path)[0] + ".worker.lock"
+
+
+def run_worker(
+    idle_exit: Optional[float] = None,
+    debounce: float = DEBOUNCE_S,
+    queue_path: str = QUEUE_PATH,
+    **build_kwargs: Any,
+) -> bool:
+    """
+    Kuyruğu işler. Başka bir worker çalışıyorsa hemen False döner. idle_exit saniye
+    boyunca iş gelmezse çıkar (None → süresiz).
+    """
+    lock_path = _worker_lock_path(queue_path)
+    try:
+        with file_lock(lock_path, timeout=0):
+            queue = get_queue(queue_path)
+            requeued = queue.requeue_running()
+            if requeued:
+                print(f"[ingest] Yarım kalan {requeued} iş yeniden kuyruğa alındı.")
+            print(f"[ingest] Worker hazır (pid={os.getpid()}, kuyruk={queue_path})")
+            idle_since = time.monotonic()
+            while True:
+                if not queue.has_pending():
+                    if (
+                        idle_exit is not None
+                        and time.monotonic() - idle_since >= idle_exit
+                    ):
+                        print("[ingest] Boşta, worker kapanıyor.")
+                        return True
+                    time.sleep(POLL_S)
+                    continue
+                # Art arda gelen yüklemeler aynı build'e girsin
+                time.sleep(debounce)
+                claim = queue.claim()
+                if claim is not None:
+                    _run_build(queue, claim, build_kwargs)
+                idle_since = time.monotonic()
+    except TimeoutError:
+        return False
+
+
+def worker_running(queue_path: str = QUEUE_PATH) -> bool:
+    lock_path = _worker_lock_path(queue_path)
+    try:
+        with file_lock(lock_path, timeout=0):
+            return False
+    except TimeoutError:
+        return True
+
+
+def ensure_worker(idle_exit: float = 300.0) -> bool:
+    """
+    Worker çalışmıyorsa ayrı bir süreç olarak başlatır (çıktı logs/ingest.log'a).
+    Aynı anda iki çağrı iki süreç başlatsa da kilidi yalnızca biri alır.
+    """
+    if worker_running():
+        return False
+    os.makedirs(os.path.dirname(WORKER_LOG_PATH), exist_ok=True)
+    with open(WORKER_LOG_PATH, "ab") as log:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "app.ingest",
+                "--worker",
+                "--idle-exit",
+                str(idle_exit),
+            ],
+            cwd=ROOT_DIR,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+            env={
+                **os.environ,
+                "PYTHONPATH": os.pathsep.join(
+                    filter(None, [ROOT_DIR, os.getenv("PYTHONPATH")])
+                ),
+                "PYTHONUNBUFFERED": "1",
+            },
+        )
+    return True
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="Arka plan belge alım kuyruğu")
+    p.add_argument("--worker", action="store_true", help="Kuyruğu işle")
+    p.add_argument(
+        "--idle-exit", type=float, default=None, help="Bu kadar sn boşta kalınca çık"
+    )
+    p.add_argument("--submit", action="store_true", help="data/ için iş ekle")
+    p.add_argument("--data-dir", default="data")
+    p.add_argument("--persist-dir", default="db/faiss_index")
+    p.add_argument("--status", action="store_true", help="Kuyruk özeti")
+    args = p.parse_args()
+
+    if args.submit:
+        job_id = submit(
+            data_dir=args.data_dir, persist_dir=args.persist_dir, start_worker=False
+        )
+        print(f"[ingest] İş eklendi: {job_id}")
+    if args.worker:
+        try:
+            if not run_worker(idle_exit=args.idle_exit):
+                print("[ingest] Başka bir worker zaten çalışıyor.")
+        except KeyboardInterrupt:
+            pass
+    if args.status:
+        print(json.dumps(get_queue().summary(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    _cli()
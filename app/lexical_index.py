@@ -0,0 +1,268 @@
+"""
+Türkçe'ye duyarlı BM25 sözcük index'i (hibrit retrieval'ın lexical ayağı).
+
+Index build sırasında FAISS pozisyonlarıyla yazılır:
+    bm25.json : parametreler + sözlük (terim → [ofset, df, genişlik])
+    bm25.bin  : parça uzunlukları (uint32) + sıkıştırılmış posting listeleri
+
+Posting listeleri artan pozisyon farkları (delta) olarak, listeye göre seçilen en dar
+tamsayı genişliğinde (1/2/4 bayt) tutulur; frekanslar uint8'e sığdırılır. Okuma tek
+mmap + numpy cumsum olduğundan büyük index'lerde bile açılış ve çözme hızlıdır.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from llama_index.schema import BaseNode
+
+BM25_META = "bm25.json"
+BM25_BIN = "bm25.bin"
+BM25_VERSION = 2
+
+_TOKEN = re.compile(r"[a-zçğıöşüâîû0-9]+")
+_APOSTROPHE_SUFFIX = re.compile(r"['’][a-zçğıöşüâîû]+")
+
+STOPWORDS = frozenset("""
+    acaba ama ancak bazı belki ben bir biri birkaç bu bunu bunun da daha de diye en
+    gibi hem hep her hiç için ile ise ki kim mi mu mı mü na ne neden nasıl niye o
+    olan olarak ona onu onun sadece sen siz şey şu tüm ve veya ya yani
+    """.split())
+
+# Türkçe eklemeli bir dil; çekim ekleri sondan başa katman katman (hal → iyelik → çoğul
+# → fiil) atılır, her katmanda en uzun eşleşen ek önce denenir. Ek önündeki kaynaştırma
+# ünsüzü (y/s) yalnızca ünlüden, ünlüyle başlayan ek yalnızca ünsüzden sonra gelir:
+# kapıyı/kapısı → kap, suyu → su, almıyor/alma → al, makinelerden → makin
+_SUFFIX_LAYERS = [
+    """
+    yı yi yu yü ya ye yla yle la le da de ta te dan den tan ten nda nde ndan nden
+    sını sini sunu sünü sına sine suna süne
+    """,
+    "sı si su sü ları leri",
+    "lar ler",
+    """
+    mıyor miyor muyor müyor ıyor iyor uyor üyor yor madı medi mamış memiş
+    mış miş muş müş mak mek maz mez ma me malı meli malıyım meliyim
+    abilir ebilir yabilir yebilir ınca ince unca ünce dığı diği duğu düğü
+    dığım diğim duğum düğüm
+    """,
+]
+SUFFIX_LAYERS = [
+    sorted(set(layer.split()), key=len, reverse=True) for layer in _SUFFIX_LAYERS
+]
+_VERB_LAYER = len(SUFFIX_LAYERS) - 1
+# İsim kökü en az 3 harf; fiil kökleri (al, aç) ve 'y' alan ünlü sonlu kökler (su) 2
+MIN_STEM = 3
+_VOWELS = frozenset("aeıioöuüâîû")
+# Ünlüyle başlayan ek atıldıysa ünsüz yumuşamasını geri al: kapağı → kapağ → kapak,
+# kilidi → kilit. Tek heceli kökler (dağ, top) yumuşamadığından dokunulmaz
+_SOFTENING = {"ğ": "k", "b": "p", "c": "ç", "d": "t"}
+
+
+def turkish_lower(text: str) -> str:
+    """İ/ı'yı doğru eşleyen küçük harf dönüşümü (str.lower 'I' → 'i' yapar)."""
+    return text.replace("I", "ı").replace("İ", "i").lower()
+
+
+def _fits(rest: str, suffix: str, min_stem: int) -> bool:
+    if suffix[0] == "y":
+        min_stem = 2
+    if len(rest) < min_stem or not any(ch in _VOWELS for ch in rest):
+        return False
+    if suffix[0] in "ys" and suffix[1] in _VOWELS:
+        return rest[-1] in _VOWELS
+    if suffix[0] in _VOWELS:
+        return rest[-1] not in _VOWELS
+    return True
+
+
+def stem(token: str) -> str:
+    last = None
+    for i, layer in enumerate(SUFFIX_LAYERS):
+        min_stem = 2 if i == _VERB_LAYER else MIN_STEM
+        for suffix in layer:
+            rest = token[: -len(suffix)]
+            if token.endswith(suffix) and _fits(rest, suffix, min_stem):
+                token, last = rest, suffix
+                break
+    # Tek ünlü ekler (belirtme/yönelme/iyelik: sesi, kapıya) kök sonundaki ünlüyle
+    # ayırt edilemez; kök sonundaki ünlü her durumda atılır: kapı/kapısı → kap
+    if len(token) > MIN_STEM and token[-1] in _VOWELS and token[-2] not in _VOWELS:
+        token, last = token[:-1], token[-1]
+    if (
+        last is not None
+        and last[0] in _VOWELS
+        and token[-1] in _SOFTENING
+        and sum(ch in _VOWELS for ch in token) >= 2
+    ):
+        token = token[:-1] + _SOFTENING[token[-1]]
+    return token
+
+
+def analyze(text: str) -> List[str]:
+    """Metni normalize edilmiş, kökleri alınmış terimlere ayırır."""
+    text = _APOSTROPHE_SUFFIX.sub("", turkish_lower(text))
+    return [
+        t if any(ch.isdigit() for ch in t) else stem(t)
+        for t in _TOKEN.findall(text)
+        if t not in STOPWORDS
+    ]
+
+
+def _width(max_value: int) -> int:
+    if max_value < 1 << 8:
+        return 1
+    if max_value < 1 << 16:
+        return 2
+    return 4
+
+
+_DTYPES = {1: "<u1", 2: "<u2", 4: "<u4"}
+
+
+def write_lexical_index(
+    persist_dir: str,
+    records: Iterable[Tuple[int, BaseNode]],
+    k1: float = 1.2,
+    b: float = 0.75,
+) -> int:
+    """(FAISS pozisyonu, node) çiftlerinden BM25 index'ini yazar; terim sayısını döndürür."""
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    lengths: Dict[int, int] = {}
+    for pos, node in sorted(records, key=lambda r: r[0]):
+        terms = analyze(node.get_content())
+        lengths[pos] = len(terms)
+        for term, tf in Counter(terms).items():
+            postings[term].append((pos, tf))
+
+    n_slots = (max(lengths) + 1) if lengths else 0
+    doc_len = np.zeros(n_slots, dtype="<u4")
+    for pos, length in lengths.items():
+        doc_len[pos] = length
+
+    root = Path(persist_dir)
+    tmp_bin = root / (BM25_BIN + ".tmp")
+    vocab: Dict[str, List[int]] = {}
+    with open(tmp_bin, "wb") as f:
+        f.write(doc_len.tobytes())
+        offset = doc_len.nbytes
+        for term in sorted(postings):
+            plist = postings[term]
+            ids = np.fromiter((p for p, _ in plist), dtype=np.int64, count=len(plist))
+            deltas = np.diff(ids, prepend=0)
+            width = _width(int(deltas.max()))
+            tfs = np.minimum([tf for _, tf in plist], 255).astype("<u1")
+            blob = deltas.astype(_DTYPES[width]).tobytes() + tfs.tobytes()
+            f.write(blob)
+            vocab[term] = [offset, len(plist), width]
+            offset += len(blob)
+
+    meta = {
+        "version": BM25_VERSION,
+        "k1": k1,
+        "b": b,
+        "n_docs": len(lengths),
+        "n_slots": n_slots,
+        "avgdl": (sum(lengths.values()) / len(lengths)) if lengths else 0.0,
+        "vocab": vocab,
+    }
+    tmp_meta = root / (BM25_META + ".tmp")
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_bin, root / BM25_BIN)
+    os.replace(tmp_meta, root / BM25_META)
+    return len(vocab)
+
+
+class LexicalIndex:
+    """bm25.json/bm25.bin'i mmap ile açar; sorgu başına yalnızca ilgili listeler çözülür."""
+
+    def __init__(self, persist_dir: str, meta: dict):
+        self.k1 = float(meta["k1"])
+        self.b = float(meta["b"])
+        self.n_docs = int(meta["n_docs"])
+        self.avgdl = float(meta["avgdl"]) or 1.0
+        self.vocab: Dict[str, List[int]] = meta["vocab"]
+        n_slots = int(meta["n_slots"])
+        path = Path(persist_dir) / BM25_BIN
+        self._buf = (
+            np.memmap(path, dtype="u1", mode="r") if path.stat().st_size else None
+        )
+        self.doc_len = (
+            np.frombuffer(self._buf, dtype="<u4", count=n_slots).astype("float32")
+            if n_slots
+            else np.zeros(0, dtype="float32")
+        )
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["LexicalIndex"]:
+        path = Path(persist_dir) / BM25_META
+        if not path.exists() or not (Path(persist_dir) / BM25_BIN).exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != BM25_VERSION:
+            return None
+        return cls(persist_dir, meta)
+
+    def __len__(self) -> int:
+        return len(self.vocab)
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Terimin (pozisyonlar, frekanslar) dizileri."""
+        entry = self.vocab.get(term)
+        if entry is None or self._buf is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype="float32")
+        offset, df, width = entry
+        end_ids = offset + df * width
+        deltas = np.frombuffer(self._buf[offset:end_ids], dtype=_DTYPES[width])
+        ids = np.cumsum(deltas, dtype=np.int64)
+        tfs = np.frombuffer(self._buf[end_ids : end_ids + df], dtype="<u1")
+        return ids, tfs.astype("float32")
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """BM25 skoruna göre en iyi `top_k` (pozisyon, skor)."""
+        terms = [t for t in dict.fromkeys(analyze(query)) if t in self.vocab]
+        if not terms or not len(self.doc_len):
+            return []
+        # Skorlar yalnızca posting listelerindeki belgeler için toplanır (korpus boyutundan
+        # bağımsız): terim katkıları birleştirilip belge başına np.add.at ile eklenir
+        all_ids, contribs = [], []
+        for term in terms:
+            ids, tfs = self.postings(term)
+            df = len(ids)
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[ids] / self.avgdl)
+            all_ids.append(ids)
+            contribs.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        docs, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.zeros(len(docs), dtype="float32")
+        np.add.at(scores, inverse, np.concatenate(contribs).astype("float32"))
+
+        hit = np.flatnonzero(scores)
+        if not len(hit):
+            return []
+        if len(hit) > top_k:
+            hit = hit[np.argpartition(-scores[hit], top_k - 1)[:top_k]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return [(int(docs[i]), float(scores[i])) for i in hit]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[int]], k: int = 60, top_k: Optional[int] = None
+) -> List[Tuple[int, float]]:
+    """Birden çok sıralamayı RRF ile birleştirir: skor = Σ 1 / (k + sıra)."""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking, 1):
+            fused[pos] += 1.0 / (k + rank)
+    ranked = sorted(fused.items(), key=lambda x: -x[1])
+    return ranked[:top_k] if top_k else ranked
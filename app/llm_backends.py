@@ -0,0 +1,325 @@
+"""
+LLM arka uçları: ortak arayüz ve yerel llama.cpp (GGUF, CPU) uygulaması.
+
+HTTP (OpenRouter uyumlu) arka uç llm_generator'dadır; hangisinin kullanılacağı model
+adından seçilir (bkz. llm_generator.get_backend):
+    OPENROUTER_MODEL=meta-llama/llama-3-8b-instruct          → OpenRouter
+    OPENROUTER_MODEL=llamacpp:models/llama-3-8b.Q4_K_M.gguf  → yerel model
+    LLM_BACKEND=llamacpp (+ LLAMA_CPP_MODEL=...)             → varsayılan model yerel
+
+Yerel model süreç boyunca bellekte kalır (model_registry). Sabit sistem promptu
+önekinin (chat şablonu + system_v1.txt) KV durumu bir kez hesaplanıp saklanır; her
+istekte yalnızca soru ve belgeler değerlendirilir. llama.cpp bağlamı thread-safe
+olmadığından istekler arka uç başına sıraya girer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from app import tracing
+
+if TYPE_CHECKING:
+    from app.hedging import CancelToken
+
+LOCAL_PREFIX = "llamacpp:"
+
+
+@dataclass
+class Completion:
+    text: str
+    usage: Optional[Dict[str, Any]] = None  # prompt_tokens, completion_tokens
+
+
+class LLMBackend:
+    """
+    Sohbet tamamlama arka ucu. complete zorunludur; stream ve acomplete varsayılan
+    olarak complete üzerine kuruludur. stream'e verilen `cancel` tetiklenirse arka uç
+    üretimi olabildiğince erken bırakır (bkz. app.hedging).
+    """
+
+    name = "base"
+    label = "LLM"
+
+    def check(self) -> None:
+        """Çağrı öncesi yapılandırma kontrolü (ör. API anahtarı); eksikse hata fırlatır."""
+
+    def warm_up(self, system_prompt: str) -> None:
+        """İlk istekten önce yapılabilecek hazırlık (model yükleme, önek önbelleği)."""
+
+    def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> Completion:
+        raise NotImplementedError
+
+    def stream(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        usage: Optional[dict] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Iterator[str]:
+        result = self.complete(
+            model, system_prompt, user_prompt, temperature, max_tokens
+        )
+        if usage is not None and result.usage:
+            usage.update(result.usage)
+        yield result.text
+
+    async def acomplete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        client: Any = None,
+    ) -> Completion:
+        return await asyncio.to_thread(
+            self.complete, model, system_prompt, user_prompt, temperature, max_tokens
+        )
+
+
+# ----------------------------- llama.cpp -----------------------------
+@dataclass(frozen=True)
+class ChatFormat:
+    """
+    prefix : sistem promptunu içeren, kullanıcı mesajının başına kadarki sabit kısım
+             ({system}); KV durumu önbelleğe alınan önek budur
+    suffix : kullanıcı mesajı ({user}) ve asistan başlığı
+    """
+
+    prefix: str
+    suffix: str
+    stop: Tuple[str, ...]
+
+
+CHAT_FORMATS: Dict[str, ChatFormat] = {
+    "llama-3": ChatFormat(
+        "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n{system}<|eot_id|>"
+        "<|start_header_id|>user<|end_header_id|>\n\n",
+        "{user}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n",
+        ("<|eot_id|>", "<|end_of_text|>"),
+    ),
+    "chatml": ChatFormat(
+        "<|im_start|>system\n{system}<|im_end|>\n<|im_start|>user\n",
+        "{user}<|im_end|>\n<|im_start|>assistant\n",
+        ("<|im_end|>",),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class LlamaCppConfig:
+    model_path: str = "models/Meta-Llama-3-8B-Instruct.Q4_K_M.gguf"
+    n_ctx: int = 4096
+    threads: Optional[int] = None  # None → llama.cpp varsayılanı
+    n_batch: int = 512
+    chat_format: str = "llama-3"
+
+    @classmethod
+    def from_env(cls, model_path: Optional[str] = None) -> "LlamaCppConfig":
+        threads = os.getenv("LLAMA_CPP_THREADS")
+        return cls(
+            model_path=model_path or os.getenv("LLAMA_CPP_MODEL", cls.model_path),
+            n_ctx=int(os.getenv("LLAMA_CPP_N_CTX", "4096")),
+            threads=int(threads) if threads else None,
+            n_batch=int(os.getenv("LLAMA_CPP_N_BATCH", "512")),
+            chat_format=os.getenv("LLAMA_CPP_CHAT_FORMAT", "llama-3"),
+        )
+
+
+def is_local_model(model: str) -> bool:
+    return model.startswith(LOCAL_PREFIX) or model.endswith(".gguf")
+
+
+def local_model_path(model: str) -> str:
+    return model[len(LOCAL_PREFIX) :] if model.startswith(LOCAL_PREFIX) else model
+
+
+class LlamaCppBackend(LLMBackend):
+    """GGUF modelini CPU'da çalıştırır; sistem promptu önekinin KV durumunu yeniden kullanır."""
+
+    name = "llamacpp"
+    label = "llama.cpp"
+
+    def __init__(self, config: LlamaCppConfig):
+        if config.chat_format not in CHAT_FORMATS:
+            raise ValueError(
+                f"chat_format {tuple(CHAT_FORMATS)} olmalı, verilen: {config.chat_format!r}"
+            )
+        self.config = config
+        self.format = CHAT_FORMATS[config.chat_format]
+        self._lock = threading.Lock()
+        # (sistem promptu, önek token'ları, önek sonrası llama.cpp durumu)
+        self._prefix: Optional[Tuple[str, List[int], Any]] = None
+        self.counters = {"requests": 0, "prefix_builds": 0, "prefix_restores": 0}
+
+    @property
+    def llm(self):
+        from app.model_registry import get_llama_cpp
+
+        cfg = self.config
+        return get_llama_cpp(cfg.model_path, cfg.n_ctx, cfg.threads, cfg.n_batch)
+
+    def warm_up(self, system_prompt: str) -> None:
+        with self._lock:
+            self._prompt_tokens(self.llm, system_prompt, "")
+
+    def _tokenize(self, llm, text: str) -> List[int]:
+        return llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+    def _prompt_tokens(
+        self, llm, system_prompt: str, user_prompt: str
+    ) -> Tuple[List[int], int]:
+        """
+        İsteğin token'ları ve önbellekten gelen önek uzunluğu. Önek ve devamı ayrı
+        tokenize edilir ki sınırdaki token'lar her istekte aynı olsun. Bağlam öneki
+        tutmuyorsa (farklı sistem promptu, sıfırlanmış bağlam) kayıtlı durum geri yüklenir;
+        llama.cpp ortak öneki atlayıp yalnızca kalan token'ları değerlendirir.
+        """
+        cached = self._prefix
+        if cached is None or cached[0] != system_prompt:
+            tokens = self._tokenize(
+                llm, self.format.prefix.replace("{system}", system_prompt)
+            )
+            llm.reset()
+            llm.eval(tokens)
+            cached = self._prefix = (system_prompt, tokens, llm.save_state())
+            self.counters["prefix_builds"] += 1
+            print(
+                f"[llm_backends] Sistem promptu öneki önbelleğe alındı ({len(tokens)} token)"
+            )
+        _, prefix, state = cached
+        if list(llm.input_ids[: len(prefix)]) != prefix:
+            llm.load_state(state)
+            self.counters["prefix_restores"] += 1
+        rest = self._tokenize(llm, self.format.suffix.replace("{user}", user_prompt))
+        return prefix + rest, len(prefix)
+
+    def _start(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool,
+    ):
+        llm = self.llm
+        tokens, cached = self._prompt_tokens(llm, system_prompt, user_prompt)
+        room = self.config.n_ctx - len(tokens)
+        if room <= 0:
+            raise RuntimeError(
+                f"Prompt ({len(tokens)} token) bağlam penceresini ({self.config.n_ctx}) aşıyor; "
+                "CONTEXT_TOKEN_BUDGET'ı düşürün veya LLAMA_CPP_N_CTX'i artırın."
+            )
+        self.counters["requests"] += 1
+        tracing.annotate(
+            prefix_cached_tokens=cached, prompt_eval_tokens=len(tokens) - cached
+        )
+        out = llm.create_completion(
+            tokens,
+            max_tokens=min(max_tokens, room),
+            temperature=float(temperature),
+            stop=list(self.format.stop),
+            stream=stream,
+        )
+        return out, len(tokens)
+
+    def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> Completion:
+        with self._lock:
+            out, n_prompt = self._start(
+                system_prompt, user_prompt, temperature, max_tokens, False
+            )
+        usage = dict(out.get("usage") or {})
+        usage.setdefault("prompt_tokens", n_prompt)
+        return Completion(text=(out["choices"][0]["text"] or "").strip(), usage=usage)
+
+    def stream(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        usage: Optional[dict] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Iterator[str]:
+        """
+        Üretim, kilidi tutan bir worker thread'inde yapılır; parçalar kuyruktan kilit
+        dışında verilir. Tüketici akışı erken bırakırsa (close, iptal) üretim bir sonraki
+        token'da durur ve kilit hemen serbest kalır.
+        """
+        events: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+
+        def _produce() -> None:
+            try:
+                with self._lock:
+                    chunks, n_prompt = self._start(
+                        system_prompt, user_prompt, temperature, max_tokens, True
+                    )
+                    n_out = 0
+                    for chunk in chunks:
+                        if stop.is_set() or (cancel is not None and cancel.cancelled):
+                            chunks.close()
+                            break
+                        delta = chunk["choices"][0].get("text")
+                        if delta:
+                            n_out += 1
+                            events.put(("token", delta))
+                if usage is not None:
+                    usage.update(prompt_tokens=n_prompt, completion_tokens=n_out)
+                events.put(("done", None))
+            except Exception as e:  # noqa: BLE001 - hata tüketiciye iletilir
+                events.put(("error", e))
+
+        ctx = contextvars.copy_context()
+        threading.Thread(
+            target=ctx.run, args=(_produce,), name="llamacpp-stream", daemon=True
+        ).start()
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    return
+                yield value
+        finally:
+            stop.set()
+
+
+_BACKENDS: Dict[str, LlamaCppBackend] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+def get_llama_cpp_backend(model_path: Optional[str] = None) -> LlamaCppBackend:
+    """Model dosyası başına tek arka uç (model ilk istekte yüklenir ve bellekte kalır)."""
+    config = LlamaCppConfig.from_env(model_path)
+    with _BACKENDS_LOCK:
+        backend = _BACKENDS.get(config.model_path)
+        if backend is None:
+            backend = _BACKENDS[config.model_path] = LlamaCppBackend(config)
+        return backend
@@ -1,9 +1,29 @@
+from __future__ import annotations
+
 import os
 import json
+import time
+import asyncio
 import requests
-from typing import List, Optional
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from llama_index.schema import NodeWithScore
+
+if TYPE_CHECKING:
+    from llama_index.schema import NodeWithScore
+
+from app import hedging, tracing
+from app.answer_cache import SemanticAnswerCache
+from app.context_packer import PackStats, get_tokenizer, pack_contexts
+from app.http_client import AsyncLLMHttpClient, abort_response, get_client
+from app.llm_backends import (
+    LOCAL_PREFIX,
+    Completion,
+    LlamaCppConfig,
+    LLMBackend,
+    get_llama_cpp_backend,
+    is_local_model,
+    local_model_path,
+)
 
 # İsteğe bağlı: HF tokenizers uyarısını kapatmak istersen .env'de zaten ayarlı olabilir.
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
@@ -15,6 +35,11 @@ API_URL = os.getenv(
 )
 API_KEY = os.getenv("OPENROUTER_API_KEY")
 DEFAULT_MODEL = os.getenv("OPENROUTER_MODEL", "meta-llama/llama-3-8b-instruct")
+# LLM_BACKEND=llamacpp: varsayılan model yerel GGUF (LLAMA_CPP_MODEL); bkz. app.llm_backends
+if os.getenv("LLM_BACKEND", "openrouter").lower() == "llamacpp" and not is_local_model(
+    DEFAULT_MODEL
+):
+    DEFAULT_MODEL = LOCAL_PREFIX + LlamaCppConfig.from_env().model_path
 
 # Varsayılan sistem promptu (dosya okunamazsa buna düşer)
 DEFAULT_SYSTEM_PROMPT = (
@@ -48,99 +73,449 @@ def load_system_prompt() -> str:
 SYSTEM_PROMPT = load_system_prompt()
 
 
-def _node_label(i: int, node: NodeWithScore) -> str:
-    """
-    Kaynak bilgisini etiket olarak ekler (varsa).
-    """
-    meta = getattr(node, "metadata", None)
-    if not meta and hasattr(node, "node"):
-        meta = getattr(node.node, "metadata", None)
-    src = None
-    if isinstance(meta, dict):
-        src = meta.get("file_path") or meta.get("source") or meta.get("doc_id")
+def _passage_label(i: int, source: str) -> str:
+    """Pasaj başlığı: [Belge N | dosya] (kaynak yoksa yalnızca numara)."""
     label = f"[Belge {i+1}"
-    if src:
-        import os as _os
+    if source:
+        label += f" | {os.path.basename(str(source))}"
+    return label + "]:\n"
 
-        label += f" | {_os.path.basename(str(src))}"
-    label += "]"
-    return label
 
+NO_ANSWER = "Bu sorunun cevabı elimdeki belgelerde bulunmamaktadır."
 
-def generate_answer(
+
+def _build_user_prompt(
     question: str,
     contexts: List[NodeWithScore],
-    model_name: Optional[str] = None,
-    temperature: float = 0.3,
-    max_tokens: int = 768,
-) -> str:
-    if not API_KEY:
-        raise ValueError(
-            "API anahtarı bulunamadı. .env içindeki OPENROUTER_API_KEY değerini kontrol et."
-        )
-
-    # Boş sonuç güvenliği: belge yoksa LLM'i çağırma
-    if not contexts:
-        return "Bu sorunun cevabı elimdeki belgelerde bulunmamaktadır."
+    model: Optional[str] = None,
+    budget: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Belgeleri token bütçesine göre paketleyip tek metinde birleştirir (kaynak
+    etiketleriyle, bkz. app.context_packer). Metin yoksa None. Paketleme istatistikleri
+    ve tahmini prompt token sayısı etkin ize yazılır.
+    """
+    model = model or DEFAULT_MODEL
+    passages, stats = pack_contexts(
+        contexts, model, budget=budget, label=_passage_label
+    )
+    context_text = "\n\n".join(
+        _passage_label(i, p.source) + p.text for i, p in enumerate(passages)
+    ).strip()
 
-    model = model_name or DEFAULT_MODEL
+    if not context_text:
+        return None
+    user_prompt = f"Soru: {question}\n\nBelgeler:\n{context_text}"
+    _report_packing(model, stats, user_prompt)
+    return user_prompt
 
-    # Belgeleri tek metinde birleştir (kaynak etiketleriyle)
-    chunks: List[str] = []
-    for i, node in enumerate(contexts):
-        node_text = getattr(node, "text", None) or getattr(
-            getattr(node, "node", None), "text", ""
-        )
-        node_text = (node_text or "").strip()
-        if not node_text:
-            continue
-        label = _node_label(i, node)
-        chunks.append(f"{label}:\n{node_text}")
-    context_text = "\n\n".join(chunks).strip()
 
-    if not context_text:
-        return "Bu sorunun cevabı elimdeki belgelerde bulunmamaktadır."
+def _report_packing(model: str, stats: PackStats, user_prompt: str) -> None:
+    """Paketleme sayaçlarını ve sistem + kullanıcı mesajının token sayısını raporlar."""
+    tok = get_tokenizer(model)
+    prompt_tokens = tok.count(SYSTEM_PROMPT) + tok.count(user_prompt)
+    tracing.annotate(prompt_tokens_est=prompt_tokens, context_pack=stats.to_dict())
+    tracing.METRICS.tokens("prompt_est", prompt_tokens, model)
+    if stats.chunks_dropped:
+        tracing.count("context_chunks_dropped", stats.chunks_dropped)
+    if stats.chunks_merged:
+        tracing.count("context_chunks_merged", stats.chunks_merged)
+    if stats.truncated:
+        tracing.count("context_truncated")
 
-    user_prompt = f"Soru: {question}\n\nBelgeler:\n{context_text}"
 
-    payload = {
+def _build_payload(
+    model: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    system_prompt: Optional[str] = None,
+) -> dict:
+    return {
         "model": model,
         "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": system_prompt or SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt},
         ],
         "temperature": float(temperature),
         "max_tokens": int(max_tokens),
     }
 
-    headers = {
+
+def _headers() -> dict:
+    if not API_KEY:
+        raise ValueError(
+            "API anahtarı bulunamadı. .env içindeki OPENROUTER_API_KEY değerini kontrol et."
+        )
+    return {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json",
         "HTTP-Referer": "https://github.com/berkaybakac/rag-supportbot",
         "X-Title": "rag-supportbot",
     }
 
-    print("OpenRouter model =", payload["model"])
 
-    resp = requests.post(API_URL, headers=headers, json=payload, timeout=90)
-    if resp.status_code != 200:
-        try:
-            j = resp.json()
-        except Exception:
-            j = {"raw": resp.text}
-        raise RuntimeError(f"API hatası: {resp.status_code} - {json.dumps(j)[:800]}")
+def _raise_api_error(resp: requests.Response) -> None:
+    try:
+        j = resp.json()
+    except Exception:
+        j = {"raw": resp.text}
+    raise RuntimeError(f"API hatası: {resp.status_code} - {json.dumps(j)[:800]}")
 
-    data = resp.json()
+
+def _parse_completion(status: int, data: dict) -> str:
+    if status != 200:
+        raise RuntimeError(f"API hatası: {status} - {json.dumps(data)[:800]}")
     try:
         answer = data["choices"][0]["message"]["content"].strip()
-    except (KeyError, IndexError) as e:
+    except (KeyError, IndexError, TypeError) as e:
         raise RuntimeError(f"Beklenmeyen API yanıtı: {json.dumps(data)[:800]}") from e
+    return answer
 
-    if not answer:
-        answer = "Bu sorunun cevabı elimdeki belgelerde bulunmamaktadır."
+
+def iter_sse_deltas(
+    lines: Iterable[str], usage: Optional[dict] = None
+) -> Iterator[str]:
+    """
+    OpenAI uyumlu SSE akışındaki `data:` satırlarından içerik parçalarını üretir.
+    Yorum satırları (`: OPENROUTER PROCESSING`) ve boş satırlar atlanır. `usage`
+    sözlüğü verilirse akıştaki token kullanımı (genelde son parçada) buna yazılır.
+    """
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        if "error" in chunk:
+            raise RuntimeError(f"API hatası (stream): {json.dumps(chunk)[:800]}")
+        if usage is not None and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        choices = chunk.get("choices") or []
+        if not choices:
+            continue
+        delta = (choices[0].get("delta") or {}).get("content")
+        if delta:
+            yield delta
+
+
+class OpenRouterBackend(LLMBackend):
+    """OpenRouter (OpenAI uyumlu /chat/completions) HTTP arka ucu; paylaşılan istemciyle."""
+
+    name = "openrouter"
+    label = "OpenRouter"
+
+    def check(self) -> None:
+        _headers()
+
+    def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> Completion:
+        payload = _build_payload(
+            model, user_prompt, temperature, max_tokens, system_prompt
+        )
+        status, data = get_client().post_json(API_URL, _headers(), payload)
+        return Completion(_parse_completion(status, data), _usage(data))
+
+    async def acomplete(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        client: Optional[AsyncLLMHttpClient] = None,
+    ) -> Completion:
+        payload = _build_payload(
+            model, user_prompt, temperature, max_tokens, system_prompt
+        )
+        own_client = client is None
+        client = client or AsyncLLMHttpClient()
+        try:
+            status, data = await client.post_json(API_URL, _headers(), payload)
+        finally:
+            if own_client:
+                await client.close()
+        return Completion(_parse_completion(status, data), _usage(data))
+
+    def stream(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        usage: Optional[dict] = None,
+        cancel: Optional[hedging.CancelToken] = None,
+    ) -> Iterator[str]:
+        payload = _build_payload(
+            model, user_prompt, temperature, max_tokens, system_prompt
+        )
+        payload["stream"] = True
+        with get_client().post(API_URL, _headers(), payload, stream=True) as resp:
+            if cancel is not None:
+                # Soket kapatılınca bekleyen okuma biter, sunucu üretimi bırakır
+                cancel.on_cancel(lambda: abort_response(resp))
+            if resp.status_code != 200:
+                _raise_api_error(resp)
+            # text/event-stream charset belirtmez; requests latin-1 varsayar
+            resp.encoding = "utf-8"
+            yield from iter_sse_deltas(resp.iter_lines(decode_unicode=True), usage)
+
+
+OPENROUTER = OpenRouterBackend()
+
+
+def get_backend(model: str) -> LLMBackend:
+    """Model adına göre arka uç: `llamacpp:<yol>` / `.gguf` → yerel, diğerleri → OpenRouter."""
+    if is_local_model(model):
+        return get_llama_cpp_backend(local_model_path(model))
+    return OPENROUTER
+
+
+def warm_up(model: Optional[str] = None) -> None:
+    """Tokenizer'ı ve (yerel arka uçta) modeli + sistem promptu önekini önceden yükler."""
+    model = model or DEFAULT_MODEL
+    get_tokenizer(model)
+    get_backend(model).warm_up(SYSTEM_PROMPT)
+
+
+def _usage(data: dict) -> Optional[dict]:
+    return data.get("usage") if isinstance(data, dict) else None
+
+
+def _record_usage(model: str, usage: Optional[dict]) -> None:
+    """Token kullanımını (varsa) ize ve metriklere yazar."""
+    if usage:
+        tracing.record_tokens(
+            model, usage.get("prompt_tokens"), usage.get("completion_tokens")
+        )
+
+
+def _complete_hedged(
+    backend: LLMBackend,
+    model: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+) -> Tuple[Completion, str]:
+    """
+    Deadline/hedge etkinken cevap akışla toplanır (ilk token yarışı için).
+    (sonuç, cevaplayan model) döner.
+    """
+    usage: dict = {}
+    outcome: dict = {}
+    deltas = hedging.hedged_stream(
+        model,
+        backend,
+        SYSTEM_PROMPT,
+        user_prompt,
+        temperature,
+        max_tokens,
+        usage,
+        outcome,
+    )
+    text = "".join(deltas)
+    return Completion(text.strip(), usage or None), outcome.get("model", model)
+
+
+def generate_answer(
+    question: str,
+    contexts: List[NodeWithScore],
+    model_name: Optional[str] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 768,
+    cache: Optional[SemanticAnswerCache] = None,
+    context_budget: Optional[int] = None,
+) -> str:
+    """
+    context_budget: belgeler için token bütçesi (None → CONTEXT_TOKEN_BUDGET, 0 → sınırsız).
+    cache verilirse: aynı kaynak parçalarla cevaplanmış benzer bir soru varsa LLM
+    çağrılmadan kayıtlı cevap döner; yeni cevaplar önbelleğe eklenir.
+    """
+    model = model_name or DEFAULT_MODEL
+    backend = get_backend(model)
+    backend.check()
+
+    # Boş sonuç güvenliği: belge yoksa LLM'i çağırma
+    if not contexts:
+        return NO_ANSWER
+
+    tracing.annotate(model=model)
+
+    if cache is not None:
+        cached = cache.lookup(question, contexts, model, SYSTEM_PROMPT)
+        if cached is not None:
+            print("Önbellekten cevap (semantic cache)")
+            tracing.count("answer_cache_hit")
+            return cached
+
+    with tracing.span("prompt"):
+        user_prompt = _build_user_prompt(question, contexts, model, context_budget)
+        if user_prompt is None:
+            return NO_ANSWER
+
+    print(f"{backend.label} model =", model)
+
+    answered_by = model
+    with tracing.span("llm", model=model):
+        if hedging.CONFIG.enabled_for(model):
+            result, answered_by = _complete_hedged(
+                backend, model, user_prompt, temperature, max_tokens
+            )
+        else:
+            result = backend.complete(
+                model, SYSTEM_PROMPT, user_prompt, temperature, max_tokens
+            )
+    answer = result.text or NO_ANSWER
+    _record_usage(answered_by, result.usage)
+    if cache is not None:
+        cache.store(question, contexts, model, SYSTEM_PROMPT, answer)
     return answer
 
 
+async def agenerate_answer(
+    question: str,
+    contexts: List[NodeWithScore],
+    model_name: Optional[str] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 768,
+    cache: Optional[SemanticAnswerCache] = None,
+    client: Optional[AsyncLLMHttpClient] = None,
+    context_budget: Optional[int] = None,
+) -> str:
+    """
+    generate_answer'ın asyncio sürümü. Çok sayıda soru için paylaşılan bir
+    AsyncLLMHttpClient verin; verilmezse çağrı başına geçici istemci açılır.
+    Yerel arka uçta ve deadline/hedge etkinken çağrı bir worker thread'inde çalışır.
+    """
+    model = model_name or DEFAULT_MODEL
+    backend = get_backend(model)
+    backend.check()
+    if not contexts:
+        return NO_ANSWER
+
+    tracing.annotate(model=model)
+    if cache is not None:
+        cached = cache.lookup(question, contexts, model, SYSTEM_PROMPT)
+        if cached is not None:
+            tracing.count("answer_cache_hit")
+            return cached
+
+    with tracing.span("prompt"):
+        user_prompt = _build_user_prompt(question, contexts, model, context_budget)
+        if user_prompt is None:
+            return NO_ANSWER
+
+    answered_by = model
+    with tracing.span("llm", model=model):
+        if hedging.CONFIG.enabled_for(model):
+            result, answered_by = await asyncio.to_thread(
+                _complete_hedged, backend, model, user_prompt, temperature, max_tokens
+            )
+        else:
+            result = await backend.acomplete(
+                model,
+                SYSTEM_PROMPT,
+                user_prompt,
+                temperature,
+                max_tokens,
+                client=client,
+            )
+    answer = result.text or NO_ANSWER
+    _record_usage(answered_by, result.usage)
+    if cache is not None:
+        cache.store(question, contexts, model, SYSTEM_PROMPT, answer)
+    return answer
+
+
+def generate_answer_stream(
+    question: str,
+    contexts: List[NodeWithScore],
+    model_name: Optional[str] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 768,
+    cache: Optional[SemanticAnswerCache] = None,
+    context_budget: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    generate_answer'ın akış (stream) sürümü: token parçalarını geldikçe üretir.
+    Tam cevap, akış bittiğinde önbelleğe yazılır.
+    """
+    model = model_name or DEFAULT_MODEL
+    backend = get_backend(model)
+    backend.check()
+
+    if not contexts:
+        yield NO_ANSWER
+        return
+
+    tracing.annotate(model=model)
+
+    if cache is not None:
+        cached = cache.lookup(question, contexts, model, SYSTEM_PROMPT)
+        if cached is not None:
+            print("Önbellekten cevap (semantic cache)")
+            tracing.count("answer_cache_hit")
+            yield cached
+            return
+
+    with tracing.span("prompt"):
+        user_prompt = _build_user_prompt(question, contexts, model, context_budget)
+        if user_prompt is None:
+            yield NO_ANSWER
+            return
+
+    print(f"{backend.label} model =", model, "(stream)")
+
+    parts: List[str] = []
+    usage: dict = {}
+    outcome: dict = {}
+    if hedging.CONFIG.enabled_for(model):
+        deltas = hedging.hedged_stream(
+            model,
+            backend,
+            SYSTEM_PROMPT,
+            user_prompt,
+            temperature,
+            max_tokens,
+            usage,
+            outcome,
+        )
+    else:
+        deltas = backend.stream(
+            model, SYSTEM_PROMPT, user_prompt, temperature, max_tokens, usage
+        )
+    # llm: istek → son parça, llm_ttft: ilk parçaya kadar geçen süre
+    t0 = time.perf_counter()
+    with tracing.span("llm", model=model):
+        for delta in deltas:
+            if not parts:
+                tracing.record_span("llm_ttft", time.perf_counter() - t0, model)
+            parts.append(delta)
+            yield delta
+    if usage:
+        _record_usage(outcome.get("model", model), usage)
+    else:
+        tracing.annotate(stream_chunks=len(parts))
+
+    answer = "".join(parts).strip()
+    if not answer:
+        answer = NO_ANSWER
+        yield answer
+    if cache is not None:
+        cache.store(question, contexts, model, SYSTEM_PROMPT, answer)
+
+
 if __name__ == "__main__":
     from app.retriever import DocumentRetriever  # DÜZELTİLDİ
 
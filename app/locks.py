@@ -0,0 +1,69 @@
+"""
+Süreçler arası dosya kilitleri (flock; Windows'ta msvcrt).
+
+Hafif tutulur (yalnızca standart kütüphane): feedback logger ve embedder, ingest
+kuyruğunu içe aktarmadan kullanır.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock(f) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f) -> None:
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+@contextmanager
+def file_lock(
+    path: str, timeout: Optional[float] = None, poll: float = 0.5
+) -> Iterator[None]:
+    """
+    Süreçler arası özel kilit (flock). timeout=None → bekler, 0 → beklemez; süre dolarsa
+    TimeoutError. Kilit süreç ölünce işletim sistemince bırakılır.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a+") as f:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not _try_lock(f):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Kilit alınamadı: {path}")
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def build_lock(persist_dir: str, timeout: Optional[float] = None):
+    """Index yazım kilidi: aynı persist klasörüne aynı anda tek build yazar."""
+    return file_lock(
+        os.path.abspath(persist_dir).rstrip(os.sep) + ".lock", timeout=timeout
+    )
@@ -0,0 +1,333 @@
+"""
+Süreç genelinde paylaşılan model kayıt defteri.
+
+Embedding ve cross-encoder modelleri (model adı, çalışma zamanı) başına bir kez yüklenir,
+kısa bir ısınma çağrısından geçirilir ve embedder, retriever, cevap önbelleği gibi tüm
+tüketiciler aynı örneği kullanır. Yükleme anahtar başına kilitlidir: aynı modeli aynı
+anda isteyen thread'lerden yalnızca biri yükler, diğerleri bekler.
+
+Sorgu kodlayıcı için isteğe bağlı int8 (torch dinamik kuantizasyon) ve ONNX çalışma
+zamanları vardır; yüklenirken fp32 vektörlerle karşılaştırılır ve kosinüs sapması
+`max_cosine_deviation`'ı aşarsa fp32'ye dönülür.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+import numpy as np
+
+EmbedBackend = Literal["torch", "int8", "onnx", "onnx-int8"]
+EMBED_BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+# Kuantize/ONNX kodlayıcıyı doğrulamak için örnek sorgular
+VALIDATION_TEXTS = [
+    "E01 hatası ne demek?",
+    "Çamaşır makinesi su almıyor, ne yapmalıyım?",
+    "Garanti süresi kaç yıl ve hangi durumlarda geçersiz olur?",
+    "Servis randevusunu nasıl iptal edebilirim?",
+    "Kapak kilidi anahtarı KL-VP-01 nasıl test edilir?",
+    "Sıkma sırasında aşırı titreşim ve gürültü var.",
+    "Isıtıcı rezistans arızası belirtileri nelerdir?",
+    "İade ve değişim koşulları nelerdir?",
+]
+WARMUP_TEXT = "ısınma"
+
+
+@dataclass
+class _Entry:
+    model: Any
+    load_seconds: float
+    warmup_seconds: float
+    info: Dict[str, Any] = field(default_factory=dict)
+
+
+_MODELS: Dict[Tuple[str, ...], _Entry] = {}
+_KEY_LOCKS: Dict[Tuple[str, ...], threading.Lock] = {}
+_LOCK = threading.Lock()
+
+
+def _get_or_load(
+    key: Tuple[str, ...],
+    loader: Callable[[], Tuple[Any, Dict[str, Any]]],
+    warm_up: Callable[[Any], None],
+) -> Any:
+    entry = _MODELS.get(key)
+    if entry is not None:
+        return entry.model
+    with _LOCK:
+        lock = _KEY_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        entry = _MODELS.get(key)
+        if entry is None:
+            t0 = time.perf_counter()
+            model, info = loader()
+            t1 = time.perf_counter()
+            warm_up(model)
+            t2 = time.perf_counter()
+            entry = _Entry(model, t1 - t0, t2 - t1, info)
+            _MODELS[key] = entry
+            print(
+                f"[model_registry] {' / '.join(key)} yüklendi "
+                f"({entry.load_seconds:.1f} sn, ısınma {entry.warmup_seconds:.2f} sn)"
+            )
+    return entry.model
+
+
+def registry_stats() -> List[Dict[str, Any]]:
+    """Yüklü modeller, yükleme/ısınma süreleri ve doğrulama bilgileri."""
+    return [
+        {
+            "key": "/".join(key),
+            "load_s": round(e.load_seconds, 3),
+            "warmup_s": round(e.warmup_seconds, 3),
+            **e.info,
+        }
+        for key, e in list(_MODELS.items())
+    ]
+
+
+# ----------------------------- Embedding -----------------------------
+def _hf_embedding(model_name: str):
+    from llama_index.embeddings import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(model_name=model_name)
+
+
+def _quantize_int8(embed_model) -> None:
+    import torch
+
+    embed_model._model = torch.quantization.quantize_dynamic(
+        embed_model._model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def _onnx_embedding(model_name: str, quantize: bool, onnx_dir: str):
+    from llama_index.embeddings import OptimumEmbedding
+    from llama_index.embeddings.huggingface_utils import get_pooling_mode
+
+    out_dir = Path(onnx_dir) / model_name.replace("/", "__")
+    if not (out_dir / "model.onnx").exists():
+        print(f"[model_registry] {model_name} ONNX'e dışa aktarılıyor → {out_dir}")
+        OptimumEmbedding.create_and_save_optimum_model(model_name, str(out_dir))
+    model = None
+    if quantize:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        if not (out_dir / "model_quantized.onnx").exists():
+            ORTQuantizer.from_pretrained(out_dir).quantize(
+                save_dir=out_dir,
+                quantization_config=AutoQuantizationConfig.avx2(
+                    is_static=False, per_channel=False
+                ),
+            )
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            out_dir, file_name="model_quantized.onnx"
+        )
+    return OptimumEmbedding(
+        folder_name=str(out_dir), model=model, pooling=get_pooling_mode(model_name)
+    )
+
+
+def cosine_deviation(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Satır bazında 1 - kosinüs benzerliğinin en büyüğü."""
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return float(np.max(1.0 - np.sum(ref * cand, axis=1)))
+
+
+def _load_embedding(
+    model_name: str, backend: str, max_cosine_deviation: float, onnx_dir: str
+) -> Tuple[Any, Dict[str, Any]]:
+    model = _hf_embedding(model_name)
+    if backend == "torch":
+        return model, {"backend": "torch"}
+
+    reference = np.asarray(
+        model._get_text_embeddings(VALIDATION_TEXTS), dtype="float32"
+    )
+    if backend == "int8":
+        _quantize_int8(model)
+        candidate_model = model
+    else:
+        candidate_model = _onnx_embedding(model_name, backend == "onnx-int8", onnx_dir)
+    candidate = np.asarray(
+        candidate_model._get_text_embeddings(VALIDATION_TEXTS), dtype="float32"
+    )
+    deviation = cosine_deviation(reference, candidate)
+    if deviation > max_cosine_deviation:
+        print(
+            f"[model_registry] {backend} kodlayıcı sapması {deviation:.4f} > "
+            f"{max_cosine_deviation} → fp32 kullanılıyor."
+        )
+        # Reddedilen aday bırakılır; fp32 örneği zaten yüklüyse o paylaşılır
+        return get_embedding_model(model_name, backend="torch"), {
+            "backend": "torch",
+            "rejected_backend": backend,
+            "cosine_deviation": round(deviation, 5),
+        }
+    return candidate_model, {
+        "backend": backend,
+        "cosine_deviation": round(deviation, 5),
+    }
+
+
+def get_embedding_model(
+    model_name: str,
+    backend: EmbedBackend = "torch",
+    max_cosine_deviation: float = 0.02,
+    onnx_dir: str = "db/onnx_cache",
+):
+    """
+    Paylaşılan embedding modeli. backend:
+      torch     : fp32 HuggingFaceEmbedding (index vektörleri her zaman bununla üretilir)
+      int8      : Linear katmanları dinamik int8 kuantize edilmiş torch modeli
+      onnx      : optimum + onnxruntime (fp32)
+      onnx-int8 : dinamik int8 kuantize edilmiş ONNX modeli
+    """
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(
+            f"Bilinmeyen kodlayıcı: {backend} (seçenekler: {EMBED_BACKENDS})"
+        )
+    return _get_or_load(
+        ("embedding", model_name, backend),
+        lambda: _load_embedding(model_name, backend, max_cosine_deviation, onnx_dir),
+        lambda m: m.get_query_embedding(WARMUP_TEXT),
+    )
+
+
+# ----------------------------- Cross-encoder -----------------------------
+class OnnxCrossEncoder:
+    """CrossEncoder.predict ile aynı arayüz; model ilk kullanımda ONNX'e dışa aktarılır."""
+
+    def __init__(
+        self, model_name: str, quantize: bool, threads: Optional[int], onnx_dir: str
+    ):
+        try:
+            import onnxruntime as ort
+            from optimum.onnxruntime import (
+                ORTModelForSequenceClassification,
+                ORTQuantizer,
+            )
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "ONNX rerank için 'optimum[onnxruntime]' gerekli: pip install optimum[onnxruntime]"
+            ) from e
+
+        out_dir = Path(onnx_dir) / model_name.replace("/", "__")
+        if not (out_dir / "model.onnx").exists():
+            print(f"[model_registry] {model_name} ONNX'e dışa aktarılıyor → {out_dir}")
+            model = ORTModelForSequenceClassification.from_pretrained(
+                model_name, export=True
+            )
+            model.save_pretrained(out_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(out_dir)
+        file_name = "model.onnx"
+        if quantize:
+            file_name = "model_quantized.onnx"
+            if not (out_dir / file_name).exists():
+                ORTQuantizer.from_pretrained(out_dir).quantize(
+                    save_dir=out_dir,
+                    quantization_config=AutoQuantizationConfig.avx2(
+                        is_static=False, per_channel=False
+                    ),
+                )
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.model = ORTModelForSequenceClassification.from_pretrained(
+            out_dir, file_name=file_name, session_options=options
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(out_dir)
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 32) -> np.ndarray:
+        scores: List[float] = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start : start + batch_size]
+            enc = self.tokenizer(
+                [q for q, _ in batch],
+                [t for _, t in batch],
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors="pt",
+            )
+            logits = self.model(**enc).logits.detach().numpy().reshape(len(batch), -1)
+            scores.extend(logits[:, 0].tolist())
+        # CrossEncoder (num_labels=1) ile aynı ölçek: sigmoid
+        return 1.0 / (1.0 + np.exp(-np.asarray(scores, dtype="float32")))
+
+
+def _load_cross_encoder(
+    model_name: str, backend: str, quantize: bool, threads: Optional[int], onnx_dir: str
+) -> Tuple[Any, Dict[str, Any]]:
+    info = {"backend": backend, "int8": quantize, "threads": threads}
+    if backend == "onnx":
+        return OnnxCrossEncoder(model_name, quantize, threads, onnx_dir), info
+
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = CrossEncoder(model_name, max_length=512)
+    if quantize:
+        model.model = torch.quantization.quantize_dynamic(
+            model.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model, info
+
+
+def get_cross_encoder(
+    model_name: str,
+    backend: str = "torch",
+    quantize: bool = False,
+    threads: Optional[int] = None,
+    onnx_dir: str = "db/onnx_cache",
+):
+    """Paylaşılan cross-encoder (torch CrossEncoder veya ONNX; isteğe bağlı int8)."""
+    return _get_or_load(
+        ("cross_encoder", model_name, backend, "int8" if quantize else "fp32"),
+        lambda: _load_cross_encoder(model_name, backend, quantize, threads, onnx_dir),
+        lambda m: m.predict([(WARMUP_TEXT, WARMUP_TEXT)], batch_size=1),
+    )
+
+
+# ----------------------------- llama.cpp (GGUF) -----------------------------
+def _load_llama_cpp(
+    model_path: str, n_ctx: int, n_threads: Optional[int], n_batch: int
+) -> Tuple[Any, Dict[str, Any]]:
+    from llama_cpp import Llama
+
+    if not Path(model_path).exists():
+        raise FileNotFoundError(f"GGUF model dosyası bulunamadı: {model_path}")
+    model = Llama(
+        model_path=model_path,
+        n_ctx=n_ctx,
+        n_threads=n_threads,
+        n_batch=n_batch,
+        n_gpu_layers=0,  # yalnızca CPU
+        verbose=False,
+    )
+    return model, {"n_ctx": n_ctx, "threads": n_threads, "n_batch": n_batch}
+
+
+def get_llama_cpp(
+    model_path: str,
+    n_ctx: int = 4096,
+    n_threads: Optional[int] = None,
+    n_batch: int = 512,
+):
+    """Süreç boyunca bellekte kalan llama.cpp modeli (GGUF, CPU)."""
+    return _get_or_load(
+        ("llama_cpp", str(model_path), str(n_ctx)),
+        lambda: _load_llama_cpp(model_path, n_ctx, n_threads, n_batch),
+        lambda m: m.tokenize(WARMUP_TEXT.encode("utf-8")),
+    )
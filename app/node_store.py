@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+    from llama_index.schema import TextNode
+
+# Persist klasöründe FAISS pozisyonuna göre sıralı node kayıtları
+NODES_BIN = "nodes.bin"
+NODES_IDX = "nodes.idx"
+_HEADER = struct.Struct("<II")  # (meta_len, text_len)
+
+
+def write_node_store(persist_dir: str, records: Iterable[Tuple[int, TextNode]]) -> int:
+    """
+    (FAISS pozisyonu, node) çiftlerini kompakt ikili dosyaya yazar.
+
+    nodes.bin : her kayıt = <meta_len, text_len> + meta JSON + metin (utf-8)
+    nodes.idx : uint64 ofset dizisi; i. pozisyonun kaydı [idx[i], idx[i+1]) aralığında.
+                Boş pozisyonlar sıfır uzunluklu kayıttır.
+    """
+    by_pos: Dict[int, TextNode] = dict(records)
+    n = (max(by_pos) + 1) if by_pos else 0
+    offsets = np.zeros(n + 1, dtype="<u8")
+    root = Path(persist_dir)
+    tmp_bin, tmp_idx = root / (NODES_BIN + ".tmp"), root / (NODES_IDX + ".tmp")
+
+    with open(tmp_bin, "wb") as f:
+        pos = 0
+        for i in range(n):
+            offsets[i] = pos
+            node = by_pos.get(i)
+            if node is None:
+                continue
+            meta = json.dumps(
+                {
+                    "id": node.node_id,
+                    "metadata": node.metadata,
+                    "excluded_embed_metadata_keys": node.excluded_embed_metadata_keys,
+                    "excluded_llm_metadata_keys": node.excluded_llm_metadata_keys,
+                    "ref_doc_id": node.ref_doc_id,
+                    # Kaynak belgedeki konum: bağlam paketleyici komşu parçaları birleştirir
+                    "start": node.start_char_idx,
+                    "end": node.end_char_idx,
+                },
+                ensure_ascii=False,
+            ).encode("utf-8")
+            text = (node.text or "").encode("utf-8")
+            f.write(_HEADER.pack(len(meta), len(text)))
+            f.write(meta)
+            f.write(text)
+            pos += _HEADER.size + len(meta) + len(text)
+        offsets[n] = pos
+    offsets.tofile(tmp_idx)
+    os.replace(tmp_bin, root / NODES_BIN)
+    os.replace(tmp_idx, root / NODES_IDX)
+    return n
+
+
+def node_store_exists(persist_dir: str) -> bool:
+    root = Path(persist_dir)
+    return (root / NODES_BIN).exists() and (root / NODES_IDX).exists()
+
+
+class NodeStore:
+    """
+    nodes.bin/nodes.idx dosyalarını salt-okunur mmap ile açar. Metin ve metadata yalnızca
+    `get` çağrıldığında (top-k isabetler için) çözülür; aynı makinedeki süreçler sayfaları
+    işletim sistemi önbelleği üzerinden paylaşır.
+    """
+
+    def __init__(self, persist_dir: str):
+        root = Path(persist_dir)
+        self._offsets = np.memmap(root / NODES_IDX, dtype="<u8", mode="r")
+        # mmap dosya tanıtıcısını kendisi çoğaltır; dosya eşlemeden sonra kapatılabilir
+        with open(root / NODES_BIN, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._buf = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            )
+
+    def __len__(self) -> int:
+        return max(0, len(self._offsets) - 1)
+
+    def get(self, pos: int) -> Optional[TextNode]:
+        if pos < 0 or pos >= len(self):
+            return None
+        start, end = int(self._offsets[pos]), int(self._offsets[pos + 1])
+        if end <= start:
+            return None
+        from llama_index.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+        meta_len, text_len = _HEADER.unpack_from(self._buf, start)
+        body = start + _HEADER.size
+        meta = json.loads(bytes(self._buf[body : body + meta_len]).decode("utf-8"))
+        text = bytes(self._buf[body + meta_len : body + meta_len + text_len]).decode(
+            "utf-8"
+        )
+        node = TextNode(
+            id_=meta["id"],
+            text=text,
+            metadata=meta.get("metadata") or {},
+            excluded_embed_metadata_keys=meta.get("excluded_embed_metadata_keys") or [],
+            excluded_llm_metadata_keys=meta.get("excluded_llm_metadata_keys") or [],
+            start_char_idx=meta.get("start"),
+            end_char_idx=meta.get("end"),
+        )
+        if meta.get("ref_doc_id"):
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                node_id=meta["ref_doc_id"]
+            )
+        return node
+
+    def get_many(self, positions: List[int]) -> List[Optional[TextNode]]:
+        return [self.get(p) for p in positions]
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+
+def read_faiss_mmap(path: str) -> faiss.Index:
+    """FAISS index'i salt-okunur mmap ile açar (desteklenmeyen tiplerde normal okuma)."""
+    import faiss
+
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path, faiss.IO_FLAG_READ_ONLY)
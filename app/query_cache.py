@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional
+
+from app.embed_cache import normalize_text
+
+
+class LRUCache:
+    """
+    Boyut (LRU) ve süre (TTL) sınırlı, thread-safe sözlük.
+
+    maxsize <= 0 → önbellek kapalı (her get miss sayılır). ttl <= 0 → süresiz.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0.0):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            ts, value = item
+            if self.ttl > 0 and time.monotonic() - ts > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+def index_fingerprint(persist_dir: str) -> str:
+    """Persist klasöründeki dosyaların (ad, boyut, mtime) özetinden index sürümü üretir."""
+    h = hashlib.sha1()
+    root = Path(persist_dir)
+    if root.exists():
+        for p in sorted(root.iterdir()):
+            if p.is_file() and not p.name.startswith("."):
+                st = p.stat()
+                h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+class QueryCache:
+    """
+    DocumentRetriever için iki katmanlı sorgu önbelleği.
+
+        - embeddings : normalize sorgu metni → sorgu embedding'i
+        - results    : (normalize sorgu, index sürümü) → rerank edilmiş NodeWithScore listesi
+
+    Sürüm, yüklü snapshot'ın adıdır (yayınlanmış snapshot değişmez); retriever yeni
+    sürümü takas ederken `set_version` çağırır ve sonuç katmanı boşaltılır. Sorgu
+    embedding'leri yalnızca modele bağlı olduğundan korunur.
+    """
+
+    def __init__(
+        self, version: Optional[str], maxsize: int = 1024, ttl: float = 3600.0
+    ):
+        self.version = version
+        self.embeddings = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.results = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return normalize_text(query)
+
+    def set_version(self, version: Optional[str]) -> None:
+        """Index sürümü değiştiyse sonuç katmanını boşaltır."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self.results.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "invalidations": self.invalidations,
+            "index_version": self.version,
+        }
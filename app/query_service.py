@@ -0,0 +1,453 @@
+"""
+DocumentRetriever + LLM cevabını sunan asyncio HTTP sorgu servisi (aiohttp).
+
+Eşzamanlı istekler aşama başına mikro-batch'lerde toplanır: sorgu embedding'i tek
+forward pass, FAISS araması tek çok-sorgulu `search`, cross-encoder tek `predict`
+çağrısıyla yapılır. Bir batch işlenirken gelen istekler bir sonrakinde birikir; yük
+arttıkça batch'ler kendiliğinden büyür. Aşamalar ayrı thread'lerde çalıştığından
+biri embed ederken diğeri rerank edebilir.
+
+    python -m app.query_service --port 8090 --max-batch-size 32 --max-wait-ms 5
+    curl -s localhost:8090/answer -d '{"question": "Makine su almıyor"}'
+
+Streamlit UI, QUERY_SERVICE_URL=http://127.0.0.1:8090 ile bu servisin ince istemcisi olur.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from app import tracing
+
+if TYPE_CHECKING:
+    from llama_index.schema import NodeWithScore
+
+    from app.answer_cache import SemanticAnswerCache
+    from app.retriever import DocumentRetriever
+
+
+@dataclass
+class BatchConfig:
+    """
+    max_batch_size : bir aşama çağrısında işlenecek en fazla istek
+    max_wait_ms    : ilk istek geldikten sonra batch'in dolması için beklenecek en uzun süre
+    """
+
+    max_batch_size: int = 32
+    max_wait_ms: float = 5.0
+
+    @classmethod
+    def from_env(cls) -> "BatchConfig":
+        return cls(
+            max_batch_size=int(os.getenv("QUERY_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.getenv("QUERY_BATCH_WAIT_MS", "5")),
+        )
+
+
+class MicroBatcher:
+    """
+    `submit` ile gelen öğeleri toplayıp `fn(items) -> results` fonksiyonunu tek çağrıda,
+    kendi thread'inde çalıştırır. Batch, max_batch_size'a ulaşınca veya ilk öğeden
+    max_wait_ms sonra işlenir. Event loop içinde oluşturulmalıdır.
+    """
+
+    def __init__(
+        self, name: str, fn: Callable[[List[Any]], List[Any]], config: BatchConfig
+    ):
+        self.name = name
+        self.fn = fn
+        self.config = config
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"batch-{name}"
+        )
+        self._task = asyncio.create_task(self._run())
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+        self.busy_seconds = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        self._wakeup.set()
+        if len(self._pending) >= self.config.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        size = max(1, self.config.max_batch_size)
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < size and self.config.max_wait_ms > 0:
+                try:
+                    await asyncio.wait_for(
+                        self._full.wait(), self.config.max_wait_ms / 1000
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            batch = [(i, f) for i, f in self._pending[:size] if not f.done()]
+            del self._pending[:size]
+            if len(self._pending) < size:
+                self._full.clear()
+            if not self._pending:
+                self._wakeup.clear()
+            if not batch:
+                continue
+
+            t0 = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.fn, [i for i, _ in batch]
+                )
+            except Exception as e:  # noqa: BLE001
+                # Hata batch'teki tüm isteklere iletilir
+                for _, f in batch:
+                    if not f.done():
+                        f.set_exception(e)
+                continue
+            finally:
+                self.busy_seconds += time.perf_counter() - t0
+            for (_, f), result in zip(batch, results):
+                if not f.done():
+                    f.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+            "busy_s": round(self.busy_seconds, 3),
+            "queued": len(self._pending),
+        }
+
+    async def close(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        for _, f in self._pending:
+            if not f.done():
+                f.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+
+def node_to_dict(node: NodeWithScore) -> Dict[str, Any]:
+    inner = node.node
+    return {
+        "node_id": inner.node_id,
+        "text": inner.get_content(),
+        "score": float(node.score) if node.score is not None else None,
+        "metadata": dict(inner.metadata or {}),
+    }
+
+
+class QueryService:
+    """
+    Retriever'ı embed → FAISS → rerank mikro-batch hattına, cevabı paylaşılan
+    AsyncLLMHttpClient'a bağlar. Event loop içinde `start()` ile başlatılır.
+    """
+
+    def __init__(
+        self,
+        retriever: DocumentRetriever,
+        config: Optional[BatchConfig] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+    ):
+        self.retriever = retriever
+        self.config = config or BatchConfig.from_env()
+        self.answer_cache = answer_cache
+        self.requests = 0
+        self.fast_hits = 0
+
+    def start(self) -> None:
+        from app.http_client import AsyncLLMHttpClient
+
+        r = self.retriever
+        self._embed = MicroBatcher("embed", r.embed_queries, self.config)
+        self._search = MicroBatcher(
+            "search",
+            lambda items: list(
+                zip(*r.search_queries([q for q, _ in items], [e for _, e in items]))
+            ),
+            self.config,
+        )
+        self._rerank = MicroBatcher(
+            "rerank",
+            lambda items: r.rerank_candidates(
+                [q for q, _, _ in items],
+                [c for _, c, _ in items],
+                [d for _, _, d in items],
+            ),
+            self.config,
+        )
+        self.client = AsyncLLMHttpClient()
+
+    async def close(self) -> None:
+        for batcher in (self._embed, self._search, self._rerank):
+            await batcher.close()
+        await self.client.close()
+
+    async def retrieve(
+        self, question: str
+    ) -> Tuple[List[NodeWithScore], Dict[str, float]]:
+        """Sorgunun rerank edilmiş parçaları ve aşama süreleri (ms, kuyruk bekleme dahil)."""
+        self.requests += 1
+        timings: Dict[str, float] = {}
+        ready = self.retriever.cached_results(question)
+        if ready is not None:
+            self.fast_hits += 1
+            return ready, timings
+
+        t0 = time.perf_counter()
+        embedding = await self._embed.submit(question)
+        t1 = time.perf_counter()
+        candidates, dense = await self._search.submit((question, embedding))
+        t2 = time.perf_counter()
+        nodes = await self._rerank.submit((question, candidates, dense))
+        t3 = time.perf_counter()
+        self.retriever.store_results(question, nodes)
+        timings.update(
+            embed=round((t1 - t0) * 1000, 2),
+            search=round((t2 - t1) * 1000, 2),
+            rerank=round((t3 - t2) * 1000, 2),
+        )
+        # Batch'ler executor thread'lerinde çalışır (contextvar taşınmaz); süreleri ize burada ekle
+        tr = tracing.current_trace()
+        if tr is not None:
+            for stage, ms in timings.items():
+                tr.add(stage, ms)
+        return nodes, timings
+
+    async def answer(
+        self,
+        question: str,
+        model_name: Optional[str] = None,
+        temperature: float = 0.3,
+        max_tokens: int = 768,
+    ) -> Dict[str, Any]:
+        from app.llm_generator import DEFAULT_MODEL, agenerate_answer
+
+        with tracing.trace(ui="service") as tr:
+            nodes, timings = await self.retrieve(question)
+            if self.answer_cache is not None:
+                # Önbellek sorguyu embed eder; embed batch'inden geçirip event loop'u bloklamayalım
+                await self._embed.submit(question)
+            t0 = time.perf_counter()
+            answer = await agenerate_answer(
+                question,
+                nodes,
+                model_name=model_name,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                cache=self.answer_cache,
+                client=self.client,
+            )
+            timings["llm"] = round((time.perf_counter() - t0) * 1000, 2)
+        # Cevabı üreten model: hedge'de ikincil model kazanmış olabilir
+        answered_by = tracing.answered_model(tr.attrs) if tr else None
+        return {
+            "answer": answer,
+            "model": answered_by or model_name or DEFAULT_MODEL,
+            "sources": [node_to_dict(n) for n in nodes],
+            "timings_ms": timings,
+            "trace": tr.to_dict() if tr else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "fast_hits": self.fast_hits,
+            "batch": {
+                b.name: b.stats() for b in (self._embed, self._search, self._rerank)
+            },
+            "retriever": self.retriever.cache_stats(),
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+        }
+
+
+# ----------------------------- HTTP -----------------------------
+def create_app(service_factory: Callable[[], QueryService]):
+    """
+    aiohttp uygulaması. service_factory, açılışta (thread'de) çağrılır; modeller ve
+    index yüklenene kadar /health 503 döner.
+    """
+    from aiohttp import web
+
+    async def _question(request: web.Request) -> Dict[str, Any]:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Geçersiz JSON")
+        question = str(body.get("question") or "").strip()
+        if not question:
+            raise web.HTTPBadRequest(text="'question' alanı boş")
+        body["question"] = question
+        return body
+
+    def _service(request: web.Request) -> QueryService:
+        service = request.app.get("service")
+        if service is None:
+            raise web.HTTPServiceUnavailable(text="Servis ısınıyor")
+        return service
+
+    async def health(request: web.Request) -> web.Response:
+        ready = request.app.get("service") is not None
+        return web.json_response(
+            {"status": "ok" if ready else "warming"}, status=200 if ready else 503
+        )
+
+    async def retrieve(request: web.Request) -> web.Response:
+        service = _service(request)
+        body = await _question(request)
+        with tracing.trace(ui="service") as tr:
+            nodes, timings = await service.retrieve(body["question"])
+        return web.json_response(
+            {
+                "sources": [node_to_dict(n) for n in nodes],
+                "timings_ms": timings,
+                "trace": tr.to_dict() if tr else None,
+            }
+        )
+
+    async def answer(request: web.Request) -> web.Response:
+        service = _service(request)
+        body = await _question(request)
+        try:
+            result = await service.answer(
+                body["question"],
+                model_name=body.get("model"),
+                temperature=float(body.get("temperature", 0.3)),
+                max_tokens=int(body.get("max_tokens", 768)),
+            )
+        except (RuntimeError, ValueError) as e:
+            return web.json_response({"error": str(e)}, status=502)
+        return web.json_response(result)
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(_service(request).stats())
+
+    async def metrics(request: web.Request) -> web.Response:
+        # Prometheus metin biçimi (aşama histogramları, önbellek olayları, token sayıları)
+        return web.Response(
+            text=tracing.METRICS.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def on_startup(app: web.Application) -> None:
+        async def _load() -> None:
+            service = await asyncio.get_running_loop().run_in_executor(
+                None, service_factory
+            )
+            service.start()
+            app["service"] = service
+            print("[query_service] Hazır.")
+
+        app["loader"] = asyncio.create_task(_load())
+
+    async def on_cleanup(app: web.Application) -> None:
+        app["loader"].cancel()
+        service = app.get("service")
+        if service is not None:
+            await service.close()
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.get("/health", health),
+            web.get("/stats", stats),
+            web.get("/metrics", metrics),
+            web.post("/retrieve", retrieve),
+            web.post("/answer", answer),
+        ]
+    )
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+# ----------------------------- İnce istemci -----------------------------
+def remote_answer(
+    question: str, url: Optional[str] = None, timeout: float = 120.0, **params: Any
+) -> Dict[str, Any]:
+    """Servisin /answer uç noktasını çağırır (UI ince istemci modu)."""
+    base = (url or os.getenv("QUERY_SERVICE_URL") or "http://127.0.0.1:8090").rstrip(
+        "/"
+    )
+    resp = requests.post(
+        f"{base}/answer", json={"question": question, **params}, timeout=timeout
+    )
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {"error": resp.text[:800]}
+    if resp.status_code != 200:
+        raise RuntimeError(
+            f"Sorgu servisi hatası: {resp.status_code} - {data.get('error', data)}"
+        )
+    return data
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="Mikro-batch'li asyncio sorgu servisi")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8090)
+    p.add_argument("--persist-dir", default="db/faiss_index")
+    p.add_argument("--load-mode", choices=("memory", "mmap"), default="mmap")
+    p.add_argument("--max-batch-size", type=int, default=None)
+    p.add_argument("--max-wait-ms", type=float, default=None)
+    p.add_argument(
+        "--answer-cache", action="store_true", help="Semantik cevap önbelleği"
+    )
+    args = p.parse_args()
+
+    config = BatchConfig.from_env()
+    if args.max_batch_size is not None:
+        config.max_batch_size = args.max_batch_size
+    if args.max_wait_ms is not None:
+        config.max_wait_ms = args.max_wait_ms
+
+    def factory() -> QueryService:
+        from app.warmup import get_retriever
+
+        retriever = get_retriever(
+            persist_dir=args.persist_dir, load_mode=args.load_mode
+        )
+        cache = None
+        if args.answer_cache:
+            from app.answer_cache import SemanticAnswerCache
+
+            cache = SemanticAnswerCache(
+                embed_fn=retriever.embed_query,
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            )
+        return QueryService(retriever, config, cache)
+
+    from aiohttp import web
+
+    print(
+        f"[query_service] http://{args.host}:{args.port} "
+        f"(batch={config.max_batch_size}, bekleme={config.max_wait_ms} ms)"
+    )
+    web.run_app(create_app(factory), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    _cli()
@@ -1,26 +1,271 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Set, Tuple
+
+import numpy as np
+
+# llama_index (torch, nltk, ...) içe aktarımı saniyeler sürer; yalnızca kullanıldığı
+# yerde yüklenir ki modülü içe aktarmak (ör. UI açılışı) hızlı kalsın.
+if TYPE_CHECKING:
+    from llama_index import VectorStoreIndex
+    from llama_index.embeddings.base import BaseEmbedding
+    from llama_index.postprocessor.types import BaseNodePostprocessor
+    from llama_index.query_engine import RetrieverQueryEngine
+    from llama_index.schema import BaseNode, NodeWithScore
+
+from app import snapshots, tracing
+from app.code_index import CodeIndex
+from app.embed_cache import normalize_text
+from app.index_factory import VECTOR_STORE_FILE, load_spec, set_search_params
+from app.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.model_registry import EmbedBackend, get_cross_encoder, get_embedding_model
+from app.node_store import NodeStore, node_store_exists, read_faiss_mmap
+from app.query_cache import LRUCache, QueryCache
+from app.shard_index import ShardIndex
+
+LoadMode = Literal["memory", "mmap"]
+RerankBackend = Literal["torch", "onnx"]
+
+
+@dataclass
+class RerankConfig:
+    """
+    backend     : torch (sentence-transformers CrossEncoder) | onnx (optimum + onnxruntime)
+    quantize    : int8 — torch'ta Linear katmanlarına dinamik kuantizasyon, onnx'te
+                  dinamik int8 kuantize edilmiş model dosyası
+    threads     : CPU thread sayısı (None → kütüphane varsayılanı)
+    cache_size  : (sorgu hash'i, node id) → skor önbelleği boyutu; 0 → kapalı
+    cut_gap     : ilk aşama skorları 0-1'e ölçeklendiğinde top_n. ve (top_n+1). aday
+                  arasındaki fark bu değeri aşarsa yalnızca ilk top_n aday rerank
+                  edilir (0 → kapalı)
+    keep_window : yalnızca en iyi ilk aşama skoruna bu pencere içinde kalan adaylar
+                  rerank edilir, en az top_n (1 → hepsi)
+    """
+
+    backend: RerankBackend = "torch"
+    quantize: bool = False
+    threads: Optional[int] = None
+    batch_size: int = 32
+    cache_size: int = 4096
+    cut_gap: float = 0.5
+    keep_window: float = 0.8
+    onnx_dir: str = "db/onnx_cache"
+
+    @classmethod
+    def from_env(cls) -> "RerankConfig":
+        threads = os.getenv("RERANK_THREADS")
+        return cls(
+            backend=os.getenv("RERANK_BACKEND", "torch"),  # type: ignore[arg-type]
+            quantize=os.getenv("RERANK_QUANTIZE", "0").lower() in ("1", "true", "yes"),
+            threads=int(threads) if threads else None,
+            cut_gap=float(os.getenv("RERANK_CUT_GAP", "0.5")),
+            keep_window=float(os.getenv("RERANK_KEEP_WINDOW", "0.8")),
+        )
+
+
+class RerankEngine:
+    """
+    Cross-encoder rerank motoru: seçilebilir çalışma zamanı (torch / onnx, int8),
+    (sorgu, node) skor önbelleği ve ilk aşama skorlarına göre uyarlamalı kırpma.
 
-from llama_index import (
-    VectorStoreIndex,
-    ServiceContext,
-    StorageContext,
-    load_index_from_storage,
-)
-from llama_index.embeddings import HuggingFaceEmbedding
-from llama_index.text_splitter import SentenceSplitter
-from llama_index.schema import NodeWithScore
+    Yollar (stats()):
+      truncated : yalnızca ilk aşamada en iyi skora yakın adaylar skorlandı (ilk top_n
+                  açıkça ayrışıyorsa yalnızca onlar)
+      full      : tüm adaylar skorlandı
+    Cross-encoder hiçbir yolda atlanmaz; dönen skorlar hep cross-encoder skorudur.
+    """
+
+    def __init__(
+        self, model_name: str, top_n: int, config: Optional[RerankConfig] = None
+    ):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.config = config or RerankConfig.from_env()
+        self.pair_cache = LRUCache(maxsize=self.config.cache_size)
+        self._model = None
+        self.counters = {
+            "truncated": 0,
+            "full": 0,
+            "pairs_scored": 0,
+            "pairs_cached": 0,
+        }
+
+    @property
+    def model(self):
+        if self._model is None:
+            # Kayıt defteri yüklemeyi kilitler; aynı model süreç içinde bir kez yüklenir
+            self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        cfg = self.config
+        return get_cross_encoder(
+            self.model_name,
+            backend=cfg.backend,
+            quantize=cfg.quantize,
+            threads=cfg.threads,
+            onnx_dir=cfg.onnx_dir,
+        )
+
+    def _plan(
+        self, nodes: List[NodeWithScore], dense: Optional[List[float]]
+    ) -> Tuple[str, List[NodeWithScore]]:
+        """
+        İlk aşama skor dağılımına göre yol ve skorlanacak adayları seçer. `dense`,
+        adaylarla aynı sırada ilk aşama skorlarıdır (büyük olan iyi, azalan sırada):
+        FAISS skorları ya da hibrit aramada RRF skorları.
+        """
+        cfg = self.config
+        if dense is None or len(nodes) <= self.top_n or len(dense) != len(nodes):
+            return "full", nodes
+        raw = np.asarray(dense, dtype="float32")
+        spread = float(raw[0] - raw[-1])
+        if spread <= 0:
+            return "full", nodes
+        norm = (raw - raw[-1]) / spread
+
+        gap = float(norm[self.top_n - 1] - norm[self.top_n])
+        if cfg.cut_gap > 0 and gap >= cfg.cut_gap:
+            return "truncated", nodes[: self.top_n]
+        if cfg.keep_window < 1:
+            keep = max(self.top_n, int(np.sum(norm >= 1 - cfg.keep_window)))
+            if keep < len(nodes):
+                return "truncated", nodes[:keep]
+        return "full", nodes
+
+    def rerank(
+        self,
+        queries: List[str],
+        candidates: List[List[NodeWithScore]],
+        dense_scores: Optional[List[List[float]]] = None,
+        batch_size: Optional[int] = None,
+    ) -> List[List[NodeWithScore]]:
+        """
+        candidates  : sorgu başına ilk aşama sırasındaki adaylar
+        dense_scores: sorgu başına, adaylarla aynı sırada ilk aşama skorları (büyük olan
+                      iyi); None → uyarlamalı politika kapalı, tüm adaylar skorlanır
+        """
+        dense_rows = dense_scores or [None] * len(candidates)
+        from llama_index.schema import MetadataMode, NodeWithScore
+
+        plans = [
+            self._plan(nodes, dense) for nodes, dense in zip(candidates, dense_rows)
+        ]
+        for path, _ in plans:
+            self.counters[path] += 1
+            tracing.count(f"rerank_{path}")
+
+        # Önbellekte olmayan (sorgu, node) çiftleri tek predict çağrısında skorlanır
+        scores: Dict[Tuple[str, str], float] = {}
+        missing: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for q, (_, nodes) in zip(queries, plans):
+            qhash = hashlib.sha1(normalize_text(q).encode("utf-8")).hexdigest()[:16]
+            for n in nodes:
+                key = (qhash, n.node.node_id)
+                if key in scores or key in missing:
+                    continue
+                cached = self.pair_cache.get(key)
+                if cached is not None:
+                    scores[key] = cached
+                    self.counters["pairs_cached"] += 1
+                    tracing.count("rerank_pair_cache_hit")
+                else:
+                    missing[key] = (
+                        q,
+                        n.node.get_content(metadata_mode=MetadataMode.EMBED),
+                    )
+        if missing:
+            predicted = self.model.predict(
+                list(missing.values()), batch_size=batch_size or self.config.batch_size
+            )
+            for key, score in zip(missing, predicted):
+                scores[key] = float(score)
+                self.pair_cache.put(key, float(score))
+            self.counters["pairs_scored"] += len(missing)
 
-# 0.9.x için:
-from llama_index.indices.query.schema import QueryBundle
-from llama_index.postprocessor import SentenceTransformerRerank
-from llama_index.query_engine import RetrieverQueryEngine
-from llama_index.vector_stores import FaissVectorStore
+        out: List[List[NodeWithScore]] = []
+        for q, (_, nodes) in zip(queries, plans):
+            qhash = hashlib.sha1(normalize_text(q).encode("utf-8")).hexdigest()[:16]
+            scored = [
+                NodeWithScore(node=n.node, score=scores[(qhash, n.node.node_id)])
+                for n in nodes
+            ]
+            scored.sort(key=lambda x: x.score or 0.0, reverse=True)
+            out.append(scored[: self.top_n])
+        return out
+
+    def stats(self) -> dict:
+        truncated = self.counters["truncated"]
+        requests = truncated + self.counters["full"]
+        return {
+            **self.counters,
+            "truncate_rate": truncated / requests if requests else 0.0,
+            "pair_cache": self.pair_cache.stats(),
+        }
+
+
+def _engine_reranker(engine: RerankEngine) -> BaseNodePostprocessor:
+    """RerankEngine'i llama_index node postprocessor'ı olarak sarar."""
+    from llama_index.postprocessor.types import BaseNodePostprocessor
+
+    class EngineReranker(BaseNodePostprocessor):
+        @classmethod
+        def class_name(cls) -> str:
+            return "EngineReranker"
+
+        def _postprocess_nodes(self, nodes, query_bundle=None):
+            if query_bundle is None:
+                raise ValueError("Rerank için sorgu gerekli.")
+            return engine.rerank([query_bundle.query_str], [nodes])[0]
+
+    return EngineReranker()
+
+
+@dataclass(frozen=True)
+class LoadedIndex:
+    """
+    Bir index sürümünün sorgu tarafı durumu. Sorgular başta bir kez okur; yeni sürüm
+    tek bir atamayla takas edildiğinden süren sorgu hep aynı sürümün FAISS index'i,
+    node deposu ve yan index'leriyle tamamlanır.
+    """
+
+    path: str
+    version: Optional[str]
+    load_mode: LoadMode
+    faiss_index: Any
+    node_store: Optional[NodeStore] = None
+    index: Optional[VectorStoreIndex] = None
+    retriever: Any = None  # llama_index retriever (yalnızca memory modunda)
+    code_index: Optional[CodeIndex] = None
+    lexical_index: Optional[LexicalIndex] = None
+    shard_index: Optional[ShardIndex] = None
+    higher_is_better: bool = False
 
 
 class DocumentRetriever:
     """
     Persist edilmiş FAISS index'i yükler, sorgu için retriever + reranker sunar.
+
+    load_mode="memory": docstore ve FAISS index RAM'e okunur (llama_index yolu).
+    load_mode="mmap"  : FAISS index ve nodes.bin salt-okunur mmap ile açılır; docstore
+                        JSON'u hiç parse edilmez, modeller ilk sorguda yüklenir. Aynı
+                        makinedeki worker'lar sayfaları işletim sistemi önbelleğinden paylaşır.
+
+    persist_dir snapshot düzenindeyse (bkz. `app.snapshots`) CURRENT en fazla
+    `reload_interval` saniyede bir kontrol edilir; yeni sürüm arka planda yüklenip
+    takas edilir, o sırada gelen sorgular eski sürümle cevaplanır.
+
+    Index'te kategori shard'ları varsa (bkz. `app.shard_index`) dense arama yalnızca
+    router'ın seçtiği en fazla `max_shards` shard'da yapılır; belirsiz sorgularda seçilen
+    shard'lar thread havuzunda paralel aranır. BM25 global kalır (yanlış yönlendirmeye
+    karşı RRF güvenlik ağı).
     """
 
     def __init__(
@@ -31,23 +276,144 @@ class DocumentRetriever:
         chunk_size: int = 500,
         top_k_retrieval: int = 10,  # ilk getirilen parça sayısı
         top_k_rerank: int = 2,  # rerank sonrası saklanacak parça sayısı
+        cache_size: int = 1024,  # 0 → sorgu önbelleği kapalı
+        cache_ttl: float = 3600.0,  # saniye; 0 → süresiz
+        nprobe: Optional[int] = None,  # IVF index'lerde taranacak küme sayısı
+        ef_search: Optional[int] = None,  # HNSW arama genişliği
+        load_mode: LoadMode = "memory",
+        use_code_index: bool = True,  # arıza/parça kodu sorgularında modelleri atla
+        hybrid: bool = True,  # BM25 + FAISS adaylarını RRF ile birleştir
+        rrf_k: int = 60,
+        rerank: Optional[RerankConfig] = None,
+        query_encoder: Optional[EmbedBackend] = None,  # torch | int8 | onnx | onnx-int8
+        # kuantize kodlayıcı doğrulama eşiği
+        max_cosine_deviation: Optional[float] = None,
+        # sn; yeni snapshot kontrolü, 0 → kapalı
+        reload_interval: Optional[float] = None,
+        shard_routing: Optional[bool] = None,  # kategori shard'larında ara (varsa)
+        max_shards: Optional[int] = None,  # sorgu başına aranacak en fazla shard
+        # en iyi router skoruna bu farkla yakın shard'lar da aranır
+        shard_margin: Optional[float] = None,
     ):
+        self.persist_dir = persist_dir
         self.top_k_retrieval = top_k_retrieval
         self.top_k_rerank = top_k_rerank
+        self.embedding_model_name = embedding_model_name
+        self.rerank_model_name = rerank_model_name
+        self.chunk_size = chunk_size
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.use_code_index = use_code_index
+        self.hybrid = hybrid
+        self.shard_routing = (
+            shard_routing
+            if shard_routing is not None
+            else os.getenv("SHARD_ROUTING", "1").lower() not in ("0", "false", "no")
+        )
+        self.max_shards = max_shards or int(os.getenv("SHARD_MAX", "2"))
+        self.shard_margin = (
+            shard_margin
+            if shard_margin is not None
+            else float(os.getenv("SHARD_MARGIN", "0.05"))
+        )
+        self._shard_pool: Optional[ThreadPoolExecutor] = None
+        self.query_encoder = query_encoder or os.getenv(
+            "QUERY_ENCODER_BACKEND", "torch"
+        )
+        self.max_cosine_deviation = (
+            max_cosine_deviation
+            if max_cosine_deviation is not None
+            else float(os.getenv("QUERY_ENCODER_MAX_DEVIATION", "0.02"))
+        )
+        self._embed_model: Optional[BaseEmbedding] = None
+        self._reranker: Optional[BaseNodePostprocessor] = None
+        self._query_engine: Optional[RetrieverQueryEngine] = None
+
+        if not Path(persist_dir).exists():
+            raise FileNotFoundError(
+                f"Persist klasörü '{persist_dir}' bulunamadı. Önce embedder.py çalıştırın."
+            )
+        self.requested_load_mode = load_mode
+        self._state = self._load_index(snapshots.current_version(persist_dir))
+        # Sorgu önbelleği yüklü snapshot'a bağlıdır; takasla birlikte sürümü değişir
+        self.cache = QueryCache(self._state.version, maxsize=cache_size, ttl=cache_ttl)
+        self.code_hits = 0
+        self.rrf_k = rrf_k
+        self.rerank_engine = RerankEngine(rerank_model_name, top_k_rerank, rerank)
+
+        self.reload_interval = (
+            reload_interval
+            if reload_interval is not None
+            else float(os.getenv("INDEX_RELOAD_INTERVAL", "2"))
+        )
+        self.reloads = 0
+        self._last_check = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._failed_version: Optional[str] = None
+
+    # ------------------------- Index yükleme / takas -------------------------
+    def _load_index(self, version: Optional[str]) -> LoadedIndex:
+        path = (
+            snapshots.snapshot_path(self.persist_dir, version)
+            if version
+            else self.persist_dir
+        )
+        load_mode = self.requested_load_mode
+        if load_mode == "mmap" and not node_store_exists(path):
+            print(
+                "[retriever] nodes.bin bulunamadı (eski index); bellek moduna geçiliyor. "
+                "mmap için embedder'ı yeniden çalıştırın."
+            )
+            load_mode = "memory"
+
+        index = retriever = node_store = None
+        if load_mode == "mmap":
+            faiss_index = read_faiss_mmap(str(Path(path) / VECTOR_STORE_FILE))
+            node_store = NodeStore(path)
+        else:
+            faiss_index, index, retriever = self._load_in_memory(path)
+
+        # ANN index'lerde sorgu parametreleri persist edilmez; spec'ten veya argümandan
+        spec = load_spec(path)
+        params = {
+            "nprobe": self.nprobe or spec.nprobe,
+            "ef_search": self.ef_search or spec.ef_search,
+        }
+        set_search_params(faiss_index, **params)
+        shard_index = ShardIndex.load(path) if self.shard_routing else None
+        if shard_index is not None:
+            shard_index.set_search_params(**params)
+        return LoadedIndex(
+            path=path,
+            version=version,
+            load_mode=load_mode,
+            faiss_index=faiss_index,
+            node_store=node_store,
+            index=index,
+            retriever=retriever,
+            code_index=CodeIndex.load(path) if self.use_code_index else None,
+            lexical_index=LexicalIndex.load(path) if self.hybrid else None,
+            shard_index=shard_index,
+            # FAISS skor yönü: iç çarpımda büyük, L2 mesafesinde küçük olan iyi
+            higher_is_better=spec.metric == "ip",
+        )
+
+    def _load_in_memory(self, persist_dir: str) -> Tuple[Any, VectorStoreIndex, Any]:
+        from llama_index import ServiceContext, StorageContext, load_index_from_storage
+        from llama_index.text_splitter import SentenceSplitter
+        from llama_index.vector_stores import FaissVectorStore
 
         # Embedding + splitter + service context
-        self.embed_model = HuggingFaceEmbedding(model_name=embedding_model_name)
-        self.text_splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=50)
+        self.text_splitter = SentenceSplitter(
+            chunk_size=self.chunk_size, chunk_overlap=50
+        )
         self.service_context = ServiceContext.from_defaults(
             embed_model=self.embed_model,
             text_splitter=self.text_splitter,
         )
 
         # FAISS VectorStore'ı persistten yükle
-        if not Path(persist_dir).exists():
-            raise FileNotFoundError(
-                f"Persist klasörü '{persist_dir}' bulunamadı. Önce embedder.py çalıştırın."
-            )
         vector_store = FaissVectorStore.from_persist_dir(persist_dir=persist_dir)
         storage_context = StorageContext.from_defaults(
             persist_dir=persist_dir,
@@ -55,27 +421,398 @@ class DocumentRetriever:
         )
 
         # Index'i yükle
-        self.index: VectorStoreIndex = load_index_from_storage(
+        index = load_index_from_storage(
             storage_context=storage_context,
             service_context=self.service_context,
         )
+        retriever = index.as_retriever(similarity_top_k=self.top_k_retrieval)
+        return vector_store.client, index, retriever
 
-        # Retriever + Reranker + QueryEngine
-        self.retriever = self.index.as_retriever(similarity_top_k=self.top_k_retrieval)
-        self.reranker = SentenceTransformerRerank(
-            model=rerank_model_name,
-            top_n=self.top_k_rerank,
-        )
-        self.query_engine = RetrieverQueryEngine.from_args(
-            self.retriever,
-            node_postprocessors=[self.reranker],
+    def _swap(self, state: LoadedIndex) -> None:
+        # Tek atama: süren sorgular eski durumu tutmaya devam eder
+        self._state = state
+        self.cache.set_version(state.version)
+        self._query_engine = None
+
+    def check_for_update(self) -> bool:
+        """
+        CURRENT değiştiyse yeni sürümü arka planda yüklemeye başlar (en fazla
+        reload_interval'de bir bakılır). Yükleme başlatıldıysa True.
+        """
+        if self.reload_interval <= 0:
+            return False
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return False
+        self._last_check = now
+        version = snapshots.current_version(self.persist_dir)
+        if version is None or version in (self._state.version, self._failed_version):
+            return False
+        with self._reload_lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+        threading.Thread(
+            target=self._reload, args=(version,), name="index-reload", daemon=True
+        ).start()
+        return True
+
+    def reload(self) -> bool:
+        """CURRENT'teki sürümü hemen (bu thread'de) yükleyip takas eder; değiştiyse True."""
+        version = snapshots.current_version(self.persist_dir)
+        if version is None or version == self._state.version:
+            return False
+        with self._reload_lock:
+            self._reloading = True
+        self._reload(version)
+        return self._state.version == version
+
+    def _reload(self, version: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            state = self._load_index(version)
+        except Exception as e:
+            # Yarım/silinmiş snapshot: bir sonraki yayına kadar tekrar deneme
+            self._failed_version = version
+            print(f"[retriever] Index sürümü {version} yüklenemedi: {e!r}")
+            return
+        finally:
+            self._reloading = False
+        self._swap(state)
+        self.reloads += 1
+        print(
+            f"[retriever] Index sürümü {version} yüklendi ve devreye alındı "
+            f"({time.perf_counter() - t0:.2f} sn, {state.faiss_index.ntotal} vektör)"
         )
 
+    # Mevcut çağıranlar için (benchmark, warmup, UI) yüklü sürümün alanları
+    @property
+    def index_version(self) -> Optional[str]:
+        return self._state.version
+
+    @property
+    def load_mode(self) -> LoadMode:
+        return self._state.load_mode
+
+    @property
+    def faiss_index(self):
+        return self._state.faiss_index
+
+    @property
+    def node_store(self) -> Optional[NodeStore]:
+        return self._state.node_store
+
+    @property
+    def index(self) -> Optional[VectorStoreIndex]:
+        return self._state.index
+
+    @property
+    def retriever(self):
+        return self._state.retriever
+
+    @property
+    def code_index(self) -> Optional[CodeIndex]:
+        return self._state.code_index
+
+    @property
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        return self._state.lexical_index
+
+    @property
+    def shard_index(self) -> Optional[ShardIndex]:
+        return self._state.shard_index
+
+    @property
+    def higher_is_better(self) -> bool:
+        return self._state.higher_is_better
+
+    @property
+    def query_engine(self) -> RetrieverQueryEngine:
+        """llama_index QueryEngine (yalnızca memory modunda; retrieve bunu kullanmaz)."""
+        if self._query_engine is None:
+            if self.index is None:
+                raise RuntimeError(
+                    "query_engine yalnızca load_mode='memory' ile kullanılabilir."
+                )
+            from llama_index.query_engine import RetrieverQueryEngine
+
+            self._query_engine = RetrieverQueryEngine.from_args(
+                self.retriever,
+                node_postprocessors=[self.reranker],
+            )
+        return self._query_engine
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """Sorgu kodlayıcı (süreç genelinde paylaşılan, bkz. model_registry)."""
+        if self._embed_model is None:
+            self._embed_model = get_embedding_model(
+                self.embedding_model_name,
+                backend=self.query_encoder,  # type: ignore[arg-type]
+                max_cosine_deviation=self.max_cosine_deviation,
+            )
+        return self._embed_model
+
+    @property
+    def reranker(self) -> BaseNodePostprocessor:
+        """RerankEngine'i llama_index node postprocessor'ı olarak sunar (query_engine için)."""
+        if self._reranker is None:
+            self._reranker = _engine_reranker(self.rerank_engine)
+        return self._reranker
+
     def retrieve(self, query: str) -> List[NodeWithScore]:
-        query_bundle = QueryBundle(query_str=query)
-        results: List[NodeWithScore] = self.query_engine.retrieve(query_bundle)
+        ready = self.cached_results(query)
+        if ready is not None:
+            return ready
+
+        candidates, dense = self._search_batch([self.embed_query(query)], [query])
+        results = self._rerank_batch([query], candidates, dense)[0]
+        self.store_results(query, results)
         return results
 
+    def cached_results(self, query: str) -> Optional[List[NodeWithScore]]:
+        """Model çağırmadan verilebilen sonuç: kod index'i kısa yolu veya sorgu önbelleği."""
+        self.check_for_update()
+        fast = self.lookup_codes(query)
+        if fast:
+            return fast
+        cached = self.cache.results.get(
+            (self.cache.normalize(query), self._state.version)
+        )
+        if cached is None:
+            return None
+        tracing.count("retrieval_cache_hit")
+        return list(cached)
+
+    def store_results(self, query: str, results: List[NodeWithScore]) -> None:
+        self.cache.results.put(
+            (self.cache.normalize(query), self._state.version), list(results)
+        )
+
+    def search_queries(
+        self, queries: List[str], embeddings: Optional[List[List[float]]] = None
+    ) -> Tuple[List[List[NodeWithScore]], List[List[float]]]:
+        """
+        Rerank öncesi aşama: sorgular (embedding verilmediyse tek forward pass'te embed
+        edilip) FAISS'te tek çok-sorgulu aramayla aranır. (adaylar, ilk aşama skorları)
+        döner; rerank_candidates'e verilir.
+        """
+        if embeddings is None:
+            embeddings = self.embed_queries(queries)
+        return self._search_batch(embeddings, queries)
+
+    def rerank_candidates(
+        self,
+        queries: List[str],
+        candidates: List[List[NodeWithScore]],
+        dense_scores: Optional[List[List[float]]] = None,
+        batch_size: Optional[int] = None,
+    ) -> List[List[NodeWithScore]]:
+        """Birden çok sorgunun adaylarını tek cross-encoder çağrısıyla yeniden sıralar."""
+        return self._rerank_batch(queries, candidates, dense_scores, batch_size)
+
+    def lookup_codes(self, query: str) -> List[NodeWithScore]:
+        """
+        Sorguda bilinen bir arıza/parça/belge kodu varsa o kodu kapsayan parçaları
+        doğrudan kod index'inden döndürür (embedding, FAISS ve reranker atlanır).
+        Kod yoksa boş liste.
+        """
+        state = self._state
+        if state.code_index is None:
+            return []
+        hits = state.code_index.lookup(query, self.top_k_rerank)
+        if not hits:
+            return []
+        by_pos = self._nodes_at({pos for pos, _ in hits}, state)
+        from llama_index.schema import NodeWithScore
+
+        nodes = [NodeWithScore(node=by_pos[p], score=s) for p, s in hits if p in by_pos]
+        if nodes:
+            self.code_hits += 1
+            tracing.count("code_index_hit")
+        return nodes
+
+    def embed_query(self, query: str) -> List[float]:
+        """Sorgu embedding'i (önbellekten veya modelden)."""
+        key = self.cache.normalize(query)
+        embedding = self.cache.embeddings.get(key)
+        if embedding is None:
+            with tracing.span("embed"):
+                embedding = self.embed_model.get_query_embedding(query)
+            self.cache.embeddings.put(key, embedding)
+        else:
+            tracing.count("embed_cache_hit")
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Birden çok sorguyu önbellek + tek batch'li forward pass ile embed eder."""
+        keys = [self.cache.normalize(q) for q in queries]
+        out: List[Optional[List[float]]] = [self.cache.embeddings.get(k) for k in keys]
+        missing = [i for i, e in enumerate(out) if e is None]
+        if len(missing) < len(queries):
+            tracing.count("embed_cache_hit", len(queries) - len(missing))
+        if missing:
+            from llama_index.embeddings.huggingface_utils import format_query
+
+            model = self.embed_model
+            texts = [
+                format_query(queries[i], model.model_name, model.query_instruction)
+                for i in missing
+            ]
+            bs = max(1, model.embed_batch_size)
+            vectors: List[List[float]] = []
+            with tracing.span("embed"):
+                for start in range(0, len(texts), bs):
+                    vectors.extend(model._embed(texts[start : start + bs]))
+            for i, vec in zip(missing, vectors):
+                out[i] = vec
+                self.cache.embeddings.put(keys[i], vec)
+        return out  # type: ignore[return-value]
+
+    def retrieve_batch(
+        self, queries: List[str], rerank_batch_size: int = 64
+    ) -> List[List[NodeWithScore]]:
+        """
+        retrieve'ın toplu sürümü: sorgular tek batch'te embed edilir, FAISS'te tek
+        çok-sorgulu `search` yapılır ve tüm (sorgu, parça) çiftleri cross-encoder'dan
+        batch'ler halinde geçirilir. Sonuç sırası giriş sırasıyla aynıdır.
+        """
+        self.check_for_update()
+        version = self._state.version
+        keys = [self.cache.normalize(q) for q in queries]
+        results: List[Optional[List[NodeWithScore]]] = [
+            self.lookup_codes(q) or self.cache.results.get((k, version))
+            for q, k in zip(queries, keys)
+        ]
+        todo = [i for i, r in enumerate(results) if r is None]
+        if not todo:
+            return [list(r) for r in results]  # type: ignore[arg-type]
+
+        todo_queries = [queries[i] for i in todo]
+        candidates, dense = self._search_batch(
+            self.embed_queries(todo_queries), todo_queries
+        )
+        reranked = self._rerank_batch(
+            todo_queries, candidates, dense, rerank_batch_size
+        )
+        for i, nodes in zip(todo, reranked):
+            results[i] = nodes
+            self.cache.results.put((keys[i], version), list(nodes))
+        return [list(r) for r in results]  # type: ignore[arg-type]
+
+    def _search_batch(
+        self, embeddings: List[List[float]], queries: Optional[List[str]] = None
+    ) -> Tuple[List[List[NodeWithScore]], List[List[float]]]:
+        """
+        FAISS'te tek çok-sorgulu arama; BM25 index'i varsa her sorgunun FAISS ve BM25
+        sıralamaları RRF ile birleştirilir (skor = RRF skoru). Adaylarla birlikte, aynı
+        sırada uygulanan sıralamanın skorları döner (FAISS skoru büyük olan iyi
+        yönüne çevrilmiş ya da RRF skoru); rerank politikası bunlara bakar.
+        """
+        state = self._state
+        with tracing.span("search"):
+            query_np = np.asarray(embeddings, dtype="float32")
+            shards = state.shard_index
+            if (
+                shards is not None
+                and queries is not None
+                and len(shards) > self.max_shards
+            ):
+                routes = [
+                    shards.route(q, e, self.max_shards, self.shard_margin)
+                    for q, e in zip(queries, query_np)
+                ]
+                dists, idxs = shards.search(
+                    query_np, routes, self.top_k_retrieval, self._shard_executor()
+                )
+                tracing.count("shards_searched", sum(len(r) for r in routes))
+            else:
+                dists, idxs = state.faiss_index.search(query_np, self.top_k_retrieval)
+
+            hits = [
+                [(int(j), float(d)) for d, j in zip(drow, irow) if j >= 0]
+                for drow, irow in zip(dists, idxs)
+            ]
+            sign = 1.0 if state.higher_is_better else -1.0
+            ranked = [[(pos, sign * d) for pos, d in row] for row in hits]
+            if state.lexical_index is not None and queries is not None:
+                hits = [
+                    reciprocal_rank_fusion(
+                        [
+                            [pos for pos, _ in row],
+                            [
+                                pos
+                                for pos, _ in state.lexical_index.search(
+                                    q, self.top_k_retrieval
+                                )
+                            ],
+                        ],
+                        k=self.rrf_k,
+                        top_k=self.top_k_retrieval,
+                    )
+                    for q, row in zip(queries, hits)
+                ]
+                ranked = hits
+            from llama_index.schema import NodeWithScore
+
+            by_pos = self._nodes_at({pos for row in hits for pos, _ in row}, state)
+            candidates = [
+                [
+                    NodeWithScore(node=by_pos[pos], score=d)
+                    for pos, d in row
+                    if pos in by_pos
+                ]
+                for row in hits
+            ]
+            first_stage = [[sc for pos, sc in row if pos in by_pos] for row in ranked]
+            return candidates, first_stage
+
+    def _shard_executor(self) -> ThreadPoolExecutor:
+        if self._shard_pool is None:
+            self._shard_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SHARD_THREADS", "4")),
+                thread_name_prefix="shard",
+            )
+        return self._shard_pool
+
+    def _nodes_at(
+        self, positions: Set[int], state: Optional[LoadedIndex] = None
+    ) -> Dict[int, BaseNode]:
+        """FAISS pozisyonu → node (mmap modunda yalnızca istenen kayıtlar çözülür)."""
+        state = state or self._state
+        positions = sorted(positions)
+        if state.node_store is not None:
+            nodes = state.node_store.get_many(positions)
+            return {p: n for p, n in zip(positions, nodes) if n is not None}
+        nodes_dict = state.index.index_struct.nodes_dict
+        wanted = {p: nodes_dict[str(p)] for p in positions if str(p) in nodes_dict}
+        by_id = {
+            n.node_id: n for n in state.index.docstore.get_nodes(list(wanted.values()))
+        }
+        return {p: by_id[nid] for p, nid in wanted.items() if nid in by_id}
+
+    def _rerank_batch(
+        self,
+        queries: List[str],
+        candidates: List[List[NodeWithScore]],
+        dense_scores: Optional[List[List[float]]] = None,
+        batch_size: Optional[int] = None,
+    ) -> List[List[NodeWithScore]]:
+        with tracing.span("rerank"):
+            return self.rerank_engine.rerank(
+                queries, candidates, dense_scores=dense_scores, batch_size=batch_size
+            )
+
+    def cache_stats(self) -> dict:
+        """Sorgu önbelleği, kod index'i kısa yolu ve rerank yollarının sayaçları."""
+        stats = self.cache.stats()
+        stats["code_index_hits"] = self.code_hits
+        stats["snapshot"] = {"version": self._state.version, "reloads": self.reloads}
+        shards = self._state.shard_index
+        stats["shards"] = shards.names if shards is not None else []
+        stats["rerank"] = self.rerank_engine.stats()
+        return stats
+
 
 if __name__ == "__main__":
     retriever = DocumentRetriever()
@@ -0,0 +1,356 @@
+"""
+Kategori shard'ları: kaynak dosya (ya da `category` metadata'sı) başına ayrı FAISS index'i
+ve sorguyu ilgili shard'lara yönlendiren hafif router.
+
+Build sırasında global index'in yanına, onunla aynı IndexSpec'le (flat/IVF/HNSW/PQ) ve
+build'in bellekteki vektörlerinden yazılır. Shard içi ID'ler global FAISS pozisyonlarına
+eşlenir; node deposu, kod index'i ve BM25 ortak kalır:
+    shards/shards.json  : spec, shard başına dosya, boyut, node id özeti (digest), merkez vektör, anahtar kelimeler
+    shards/<ad>.faiss   : yalnızca o kategorinin vektörleri (yerel ID 0..n-1)
+    shards/<ad>.pos.npy : yerel ID → global FAISS pozisyonu (her build'de yazılır)
+
+Digest shard'ın node id'lerinden hesaplanır: node kümesi değişmeyen shard'ın index'i,
+başka bir kategoride dosya silinip pozisyonlar kaysa bile yeniden yazılmaz; yalnızca
+küçük pozisyon dosyası güncellenir.
+
+Router, sorgu embedding'inin shard merkezlerine benzerliğini ve sorgu terimlerinin shard
+anahtar kelimeleriyle eşleşmesini toplar; en iyi shard'a skoru `margin` içinde kalanlar
+eklenir (en fazla max_shards). Birden çok shard thread havuzunda paralel aranır, sonuçlar
+mesafeye göre birleştirilir. Shard'lar global index'le aynı tipte olduğundan IVF/HNSW'nin
+alt-doğrusal araması korunur; sorgu parametreleri (nprobe/ef_search) her ikisine uygulanır.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.index_factory import IndexSpec, make_index, set_search_params, train_index
+from app.lexical_index import analyze
+from app.node_store import read_faiss_mmap
+
+if TYPE_CHECKING:
+    import faiss
+    from llama_index.schema import BaseNode
+
+SHARDS_DIR = "shards"
+SHARDS_META = "shards.json"
+SHARDS_VERSION = 2
+
+# Shard başına saklanan ayırt edici terim sayısı
+KEYWORDS_PER_SHARD = 24
+# Router: anahtar kelime eşleşme oranının merkez benzerliğine eklenirken ağırlığı
+KEYWORD_WEIGHT = 0.5
+
+
+def shard_key(node: BaseNode) -> str:
+    """Node'un shard'ı: `category` metadata'sı, yoksa kaynak dosyanın adı (uzantısız)."""
+    meta = node.metadata or {}
+    name = (
+        meta.get("category")
+        or Path(meta.get("file_name") or meta.get("file_path") or "").stem
+    )
+    return name or "diger"
+
+
+def _file_name(key: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", key) + ".faiss"
+
+
+def _positions_file(key: str) -> str:
+    return _file_name(key)[: -len(".faiss")] + ".pos.npy"
+
+
+def _digest(node_ids: List[str], spec: IndexSpec, dim: int) -> str:
+    h = hashlib.sha1(json.dumps([spec.to_dict(), dim], sort_keys=True).encode())
+    h.update("\n".join(node_ids).encode())
+    return h.hexdigest()
+
+
+def _shard_vectors(
+    positions: np.ndarray,
+    node_ids: List[str],
+    vectors: Dict[str, np.ndarray],
+    faiss_index: faiss.Index,
+) -> Optional[np.ndarray]:
+    """
+    Shard vektörleri: build'in bellekteki vektörleri; eksikler (artımlı build'de
+    değişmeyen dosyalar) yalnızca flat global index'ten birebir okunur, yoksa None.
+    """
+    import faiss
+
+    missing = [i for i, nid in enumerate(node_ids) if nid not in vectors]
+    if missing and not isinstance(faiss_index, faiss.IndexFlat):
+        return None
+    out = np.empty((len(node_ids), faiss_index.d), dtype="float32")
+    for i, nid in enumerate(node_ids):
+        if nid in vectors:
+            out[i] = vectors[nid]
+    for i in missing:
+        out[i] = faiss_index.reconstruct(int(positions[i]))
+    return out
+
+
+def _keywords(texts_by_shard: Dict[str, List[str]], top_n: int) -> Dict[str, List[str]]:
+    """Shard'a özgü terimler: shard içi sıklık × log(shard sayısı / terimi içeren shard)."""
+    counts = {
+        key: Counter(t for text in texts for t in analyze(text))
+        for key, texts in texts_by_shard.items()
+    }
+    df = Counter(t for c in counts.values() for t in c)
+    n = len(counts)
+    out = {}
+    for key, c in counts.items():
+        total = sum(c.values()) or 1
+        scored = sorted(
+            ((cnt / total) * math.log((1 + n) / df[t]), t)
+            for t, cnt in c.items()
+            if len(t) > 2
+        )
+        # Shard adı her zaman anahtar kelimedir (ariza_kodlari → arıza, kodla)
+        name_terms = analyze(key.replace("_", " ").replace("-", " "))
+        out[key] = list(dict.fromkeys(name_terms + [t for _, t in reversed(scored)]))[
+            :top_n
+        ]
+    return out
+
+
+def write_shard_index(
+    persist_dir: str,
+    records: Iterable[Tuple[int, BaseNode]],
+    faiss_index: faiss.Index,
+    spec: IndexSpec,
+    vectors: Dict[str, np.ndarray],
+    keywords_per_shard: int = KEYWORDS_PER_SHARD,
+) -> int:
+    """
+    (FAISS pozisyonu, node) çiftlerini kategorilere ayırıp shard index'lerini `spec` ile
+    yazar; shard sayısını döndürür. `vectors` build'de embed edilen node id → vektör
+    eşlemesidir. Yeniden yazılması gereken bir shard'ın vektörleri elde edilemiyorsa
+    (flat olmayan index'te artımlı build) shard yazılmaz, sorgular global index'e gider.
+    """
+    groups: Dict[str, Dict[str, int]] = defaultdict(dict)
+    texts: Dict[str, List[str]] = defaultdict(list)
+    for pos, node in sorted(records, key=lambda r: r[0]):
+        key = shard_key(node)
+        groups[key][node.node_id] = pos
+        texts[key].append(node.get_content())
+    root = Path(persist_dir) / SHARDS_DIR
+    if len(groups) < 2:
+        # Tek kategori: shard global index'in kopyası olurdu
+        _clear(root)
+        return 0
+
+    dim = int(faiss_index.d)
+    old = _read_meta(root) or {}
+    old_shards = old.get("shards", {})
+    root.mkdir(parents=True, exist_ok=True)
+    keywords = _keywords(texts, keywords_per_shard)
+    shards = {}
+    written = 0
+    for key, pos_by_id in sorted(groups.items()):
+        node_ids = sorted(pos_by_id)
+        positions = np.asarray([pos_by_id[nid] for nid in node_ids], dtype="int64")
+        digest = _digest(node_ids, spec, dim)
+        fname = _file_name(key)
+        prev = old_shards.get(key)
+        if prev and prev.get("digest") == digest and (root / fname).exists():
+            centroid = prev["centroid"]
+        else:
+            vecs = _shard_vectors(positions, node_ids, vectors, faiss_index)
+            if vecs is None:
+                print(
+                    f"[shard_index] '{key}' shard'ının vektörleri bellekte yok ve "
+                    f"{spec.kind} index'ten birebir okunamıyor; shard yazılmadı."
+                )
+                _clear(root)
+                return 0
+            sub = make_index(spec, dim, len(vecs))
+            train_index(sub, vecs, spec.train_size)
+            sub.add(vecs)
+            _write_index(sub, root / fname)
+            written += 1
+            unit = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            mean = unit.mean(axis=0)
+            mean /= max(float(np.linalg.norm(mean)), 1e-12)
+            centroid = [round(float(x), 6) for x in mean]
+        # Pozisyonlar başka shard'lardaki silmelerle kayabilir; her build'de yazılır
+        tmp = root / (_positions_file(key) + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, positions)
+        os.replace(tmp, root / _positions_file(key))
+        shards[key] = {
+            "file": fname,
+            "positions": _positions_file(key),
+            "size": len(node_ids),
+            "digest": digest,
+            "centroid": centroid,
+            "keywords": keywords[key],
+        }
+    keep = {s["file"] for s in shards.values()} | {
+        s["positions"] for s in shards.values()
+    }
+    for stale in root.iterdir():
+        if stale.name != SHARDS_META and stale.name not in keep:
+            stale.unlink()
+    meta = {
+        "version": SHARDS_VERSION,
+        "dim": dim,
+        "ip": spec.metric == "ip",
+        "spec": spec.to_dict(),
+        "shards": shards,
+    }
+    tmp = root / (SHARDS_META + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, root / SHARDS_META)
+    print(f"[shard_index] {len(shards)} shard ({written} yeniden yazıldı)")
+    return len(shards)
+
+
+def _write_index(index: faiss.Index, path: Path) -> None:
+    import faiss
+
+    tmp = path.with_name(path.name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    os.replace(tmp, path)
+
+
+def _read_meta(root: Path) -> Optional[dict]:
+    path = root / SHARDS_META
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta if meta.get("version") == SHARDS_VERSION else None
+
+
+def _clear(root: Path) -> None:
+    if root.is_dir():
+        for p in root.iterdir():
+            p.unlink()
+        root.rmdir()
+
+
+class ShardIndex:
+    """Shard index'leri (mmap) + merkez/anahtar kelime router'ı."""
+
+    def __init__(self, persist_dir: str, meta: dict):
+        root = Path(persist_dir) / SHARDS_DIR
+        self.names: List[str] = sorted(meta["shards"])
+        self.higher_is_better = bool(meta.get("ip"))
+        self.sizes = np.asarray(
+            [meta["shards"][n]["size"] for n in self.names], dtype="int64"
+        )
+        self.indexes = [
+            read_faiss_mmap(str(root / meta["shards"][n]["file"])) for n in self.names
+        ]
+        self.positions = [
+            np.load(root / meta["shards"][n]["positions"], mmap_mode="r")
+            for n in self.names
+        ]
+        self.centroids = np.asarray(
+            [meta["shards"][n]["centroid"] for n in self.names], dtype="float32"
+        )
+        self.keywords: Dict[str, List[int]] = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for term in meta["shards"][name]["keywords"]:
+                self.keywords[term].append(i)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["ShardIndex"]:
+        meta = _read_meta(Path(persist_dir) / SHARDS_DIR)
+        if not meta or len(meta.get("shards") or {}) < 2:
+            return None
+        return cls(persist_dir, meta)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def set_search_params(
+        self, nprobe: Optional[int] = None, ef_search: Optional[int] = None
+    ) -> None:
+        """Sorgu zamanı parametrelerini her shard'a uygular (bkz. index_factory)."""
+        for index in self.indexes:
+            set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    def scores(self, query: str, embedding: Sequence[float]) -> np.ndarray:
+        """Shard başına router skoru: merkez cosine'i + KEYWORD_WEIGHT × terim eşleşme oranı."""
+        q = np.asarray(embedding, dtype="float32")
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        scores = self.centroids @ q
+        terms = list(dict.fromkeys(analyze(query)))
+        if terms:
+            hits = np.zeros(len(self.names), dtype="float32")
+            for term in terms:
+                for i in self.keywords.get(term, ()):
+                    hits[i] += 1
+            scores = scores + KEYWORD_WEIGHT * hits / len(terms)
+        return scores
+
+    def route(
+        self,
+        query: str,
+        embedding: Sequence[float],
+        max_shards: int = 2,
+        margin: float = 0.05,
+    ) -> List[int]:
+        """Aranacak shard'lar: en iyi shard + skoru `margin` içinde kalanlar (en fazla max_shards)."""
+        scores = self.scores(query, embedding)
+        order = np.argsort(-scores, kind="stable")
+        best = scores[order[0]]
+        return [int(i) for i in order[:max_shards] if scores[i] >= best - margin]
+
+    def search(
+        self,
+        queries: np.ndarray,
+        routes: List[List[int]],
+        k: int,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Her sorguyu kendi shard'larında arar. Aynı shard'a düşen sorgular tek `search`
+        çağrısında toplanır; birden çok shard varsa executor'da paralel çalışır. Sonuç
+        global index'in `search` çıktısıyla aynı biçimdedir (eksikler -1).
+        """
+        by_shard: Dict[int, List[int]] = defaultdict(list)
+        for qi, shard_ids in enumerate(routes):
+            for s in shard_ids:
+                by_shard[s].append(qi)
+
+        def _one(item: Tuple[int, List[int]]):
+            s, qis = item
+            kk = min(k, int(self.sizes[s]))
+            d, i = self.indexes[s].search(np.ascontiguousarray(queries[qis]), kk)
+            # Yerel ID → global FAISS pozisyonu (eksikler -1 kalır)
+            i = np.where(i >= 0, self.positions[s][np.maximum(i, 0)], -1)
+            return qis, d, i
+
+        items = list(by_shard.items())
+        if executor is not None and len(items) > 1:
+            parts = list(executor.map(_one, items))
+        else:
+            parts = [_one(item) for item in items]
+
+        hits: List[List[Tuple[float, int]]] = [[] for _ in range(len(queries))]
+        for qis, d, i in parts:
+            for row, qi in enumerate(qis):
+                hits[qi].extend(
+                    (float(dd), int(ii)) for dd, ii in zip(d[row], i[row]) if ii >= 0
+                )
+        dists = np.full((len(queries), k), np.nan, dtype="float32")
+        idxs = np.full((len(queries), k), -1, dtype="int64")
+        for qi, row in enumerate(hits):
+            row.sort(key=lambda h: -h[0] if self.higher_is_better else h[0])
+            for j, (dd, ii) in enumerate(row[:k]):
+                dists[qi, j], idxs[qi, j] = dd, ii
+        return dists, idxs
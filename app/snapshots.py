@@ -0,0 +1,160 @@
+"""
+Sürümlü index snapshot'ları ve atomik "current" işaretçisi.
+
+Her build yeni bir klasöre yazar; bittiğinde CURRENT dosyası `os.replace` ile tek adımda
+yeni sürümü gösterir. Okuyucular (DocumentRetriever) yarım yazılmış bir index görmez;
+işaretçi değişince yeni sürümü arka planda yükleyip takas eder.
+
+    db/faiss_index/
+        CURRENT                                 → "00000042-20261018T201500123456Z"
+        snapshots/00000042-20261018T201500123456Z/  (default__vector_store.json, nodes.bin, ...)
+
+Sürüm adı artan sıra numarası + UTC zaman damgasıdır; sıralama yalnızca sıra numarasına
+bakar, saat geri alınsa (DST, NTP) da yeni snapshot eskilerin önünde kalır.
+
+CURRENT yoksa persist klasörünün kendisi index'tir (eski düz düzen); ilk snapshot'lı
+build o dosyaları yeni snapshot'a kopyalar, GC de kökte kalan index dosyalarını
+(LEGACY_FILES) temizler.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+
+# Current dışında saklanacak eski snapshot sayısı (geri dönüş ve hâlâ eski sürümü
+# okuyan süreçler için)
+KEEP = int(os.getenv("RAG_SNAPSHOT_KEEP", "2"))
+
+_VERSION_RE = re.compile(r"^(\d{8})-\d{8}T\d{12}Z$")
+
+# Eski düz düzenin kökte bıraktığı index dosyaları; GC kökte yalnızca bunları siler
+LEGACY_FILES = frozenset(
+    {
+        "default__vector_store.json",
+        "docstore.json",
+        "graph_store.json",
+        "image__vector_store.json",
+        "index_store.json",
+        "index_spec.json",
+        "manifest.json",
+        "nodes.bin",
+        "nodes.idx",
+        "codes.json",
+        "bm25.json",
+        "bm25.bin",
+    }
+)
+
+
+def current_version(persist_dir: str) -> Optional[str]:
+    """CURRENT'in gösterdiği snapshot adı (eski düzende None)."""
+    try:
+        with open(Path(persist_dir) / CURRENT_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_path(persist_dir: str, version: str) -> str:
+    return str(Path(persist_dir) / SNAPSHOTS_DIR / version)
+
+
+def resolve(persist_dir: str) -> str:
+    """Okunacak index klasörü: current snapshot ya da (eski düzende) persist klasörü."""
+    version = current_version(persist_dir)
+    return snapshot_path(persist_dir, version) if version else str(persist_dir)
+
+
+def index_exists(persist_dir: str) -> bool:
+    """Yayınlanmış bir index var mı (ilk build sürerken False)."""
+    from app.index_factory import VECTOR_STORE_FILE
+
+    return (Path(resolve(persist_dir)) / VECTOR_STORE_FILE).exists()
+
+
+def _order(name: str) -> Tuple[int, str]:
+    """Sıralama anahtarı: sıra numarası; eski (yalnızca yerel saatli) adlar hepsinden önce."""
+    m = _VERSION_RE.match(name)
+    return (int(m.group(1)), name) if m else (0, name)
+
+
+def list_snapshots(persist_dir: str) -> List[str]:
+    """Snapshot adları, eskiden yeniye (sıra numarasına göre)."""
+    root = Path(persist_dir) / SNAPSHOTS_DIR
+    if not root.is_dir():
+        return []
+    return sorted((p.name for p in root.iterdir() if p.is_dir()), key=_order)
+
+
+def new_snapshot(persist_dir: str, copy_current: bool = True) -> str:
+    """
+    Yeni (yayınlanmamış) snapshot klasörü oluşturur ve yolunu döndürür. copy_current
+    ise güncel index'in dosyaları kopyalanır (artımlı build bunların üzerine yazar;
+    yayınlanmış snapshot'lar hiç değiştirilmez).
+    """
+    # Build'ler kilitle sıralı olduğundan sıra numarası = yayın sırası; zaman damgası bilgi içindir
+    names = list_snapshots(persist_dir)
+    seq = _order(names[-1])[0] + 1 if names else 1
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    version = f"{seq:08d}-{stamp}"
+    target = Path(snapshot_path(persist_dir, version))
+    target.mkdir(parents=True)
+    if copy_current and index_exists(persist_dir):
+        # Eski düzende kaynak kök klasördür (snapshots/ ve CURRENT de orada); onlar hariç
+        for p in Path(resolve(persist_dir)).iterdir():
+            if p.is_file() and p.name != CURRENT_FILE:
+                shutil.copy2(p, target / p.name)
+            elif p.is_dir() and p.name != SNAPSHOTS_DIR:
+                shutil.copytree(p, target / p.name)  # ör. shards/
+    return str(target)
+
+
+def publish(persist_dir: str, snapshot_dir: str) -> str:
+    """CURRENT'i atomik olarak yeni snapshot'a çevirir; sürüm adını döndürür."""
+    version = Path(snapshot_dir).name
+    pointer = Path(persist_dir) / CURRENT_FILE
+    tmp = pointer.with_name(CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    print(f"[snapshots] Yayınlandı: {version}")
+    return version
+
+
+def discard(snapshot_dir: str) -> None:
+    """Yayınlanmamış (ör. başarısız build'in) snapshot'ını siler."""
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+
+def gc(persist_dir: str, keep: int = KEEP) -> List[str]:
+    """
+    Current'ten eski snapshot'ların en yeni `keep` tanesi dışındakileri, current'ten yeni
+    (yarım kalmış build) klasörleri ve eski düzenden kökte kalan index dosyalarını siler.
+    Build kilidi altında çağrılmalıdır. Silinen adları döndürür.
+    """
+    current = current_version(persist_dir)
+    names = list_snapshots(persist_dir)
+    if current is None or current not in names:
+        return []
+    i = names.index(current)
+    older = names[:i]
+    stale = older[: max(0, len(older) - keep)] + names[i + 1 :]
+    for name in stale:
+        shutil.rmtree(snapshot_path(persist_dir, name), ignore_errors=True)
+    for name in LEGACY_FILES:
+        p = Path(persist_dir) / name
+        if p.is_file():
+            p.unlink()
+    if stale:
+        print(f"[snapshots] {len(stale)} eski snapshot silindi.")
+    return stale
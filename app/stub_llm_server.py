@@ -0,0 +1,236 @@
+"""
+OpenRouter/OpenAI chat-completions protokolünü konuşan yerel sahte (stub) LLM sunucusu.
+
+Ağ erişimi olmadan istemciyi, tekrar/backoff davranışını ve akış (SSE) yolunu denemek
+için kullanılır:
+
+    python -m app.stub_llm_server --port 8089 --latency 0.5 --fail-rate 0.2
+    python -m app.stub_llm_server --slow-rate 0.1 --slow-delay 8   # kuyruk gecikmesi (hedge denemesi)
+    OPENROUTER_BASE_URL=http://127.0.0.1:8089/v1/chat/completions OPENROUTER_API_KEY=stub make llm
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.2  # toplam cevap süresi (sn)
+    ttft: float = 0.05  # stream modunda ilk token gecikmesi (sn)
+    fail_rate: float = 0.0  # hata döndürme olasılığı
+    fail_status: int = 429
+    retry_after: Optional[float] = 0.1  # hata yanıtına eklenen Retry-After (sn)
+    answer: str = "Stub cevap: {question} [Kaynak: Belge 1]"
+    # Kuyruk gecikmesi: isteklerin slow_rate kadarında ilk token slow_delay sn daha geç gelir
+    slow_rate: float = 0.0
+    slow_delay: float = 0.0
+    slow_model: Optional[str] = None  # verilirse yalnızca bu modelin istekleri yavaşlar
+
+    def extra_delay(self, model: str) -> float:
+        if self.slow_rate <= 0 or (self.slow_model and model != self.slow_model):
+            return 0.0
+        return self.slow_delay if random.random() < self.slow_rate else 0.0
+
+
+def _question_from(payload: dict) -> str:
+    for msg in reversed(payload.get("messages") or []):
+        if msg.get("role") == "user":
+            text = str(msg.get("content", ""))
+            first = text.split("\n", 1)[0]
+            return first.replace("Soru:", "").strip()[:200]
+    return ""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # Başlık ve gövde ayrı yazılır; Nagle + gecikmeli ACK her cevaba ~40 ms eklemesin
+    disable_nagle_algorithm = True
+    server: "StubLLMServer"
+
+    def log_message(self, fmt, *args):  # sessiz
+        pass
+
+    def _send_json(
+        self, status: int, body: dict, extra_headers: Optional[dict] = None
+    ) -> None:
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        cfg = self.server.config
+        self.server.count("requests")
+        if cfg.fail_rate > 0 and random.random() < cfg.fail_rate:
+            self.server.count("failures")
+            headers = {}
+            if cfg.retry_after is not None:
+                headers["Retry-After"] = f"{cfg.retry_after:g}"
+            self._send_json(
+                cfg.fail_status, {"error": {"message": "stub injected error"}}, headers
+            )
+            return
+
+        model = payload.get("model", "stub-model")
+        answer = cfg.answer.format(question=_question_from(payload))
+        prompt_tokens = sum(
+            len(str(m.get("content", "")).split())
+            for m in payload.get("messages") or []
+        )
+        completion_tokens = len(answer.split())
+        delay = cfg.extra_delay(model)
+        if delay:
+            self.server.count("slowed")
+        if payload.get("stream"):
+            self._stream(model, answer, cfg, delay)
+            return
+
+        time.sleep(cfg.latency + delay)
+        self._send_json(
+            200,
+            {
+                "id": f"stub-{int(time.time() * 1000)}",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def _stream(
+        self, model: str, answer: str, cfg: StubConfig, delay: float = 0.0
+    ) -> None:
+        words = answer.split(" ")
+        per_token = max(0.0, cfg.latency - cfg.ttft) / max(1, len(words))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(cfg.ttft + delay)
+        try:
+            for i, word in enumerate(words):
+                delta = word if i == 0 else " " + word
+                chunk = {
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": delta}}],
+                }
+                self.wfile.write(
+                    f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+                )
+                self.wfile.flush()
+                if per_token:
+                    time.sleep(per_token)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # İstemci akışı iptal etti
+            self.server.count("cancelled")
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: Tuple[str, int], config: StubConfig):
+        super().__init__(addr, _Handler)
+        self.config = config
+        self.stats = {"requests": 0, "failures": 0, "slowed": 0, "cancelled": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+
+def start_stub_server(
+    host: str = "127.0.0.1", port: int = 0, config: Optional[StubConfig] = None
+) -> StubLLMServer:
+    """Sunucuyu arka plan thread'inde başlatır (port=0 → boş port). `shutdown()` ile kapatın."""
+    server = StubLLMServer((host, port), config or StubConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _cli():
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8089)
+    p.add_argument(
+        "--latency", type=float, default=0.2, help="Toplam cevap süresi (sn)"
+    )
+    p.add_argument("--ttft", type=float, default=0.05, help="İlk token gecikmesi (sn)")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="Hata oranı (0-1)")
+    p.add_argument("--fail-status", type=int, default=429)
+    p.add_argument("--retry-after", type=float, default=0.1)
+    p.add_argument(
+        "--slow-rate", type=float, default=0.0, help="Yavaşlatılan istek oranı (0-1)"
+    )
+    p.add_argument(
+        "--slow-delay",
+        type=float,
+        default=0.0,
+        help="Yavaş isteğe eklenen gecikme (sn)",
+    )
+    p.add_argument("--slow-model", default=None, help="Yalnızca bu modeli yavaşlat")
+    args = p.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        ttft=args.ttft,
+        fail_rate=args.fail_rate,
+        fail_status=args.fail_status,
+        retry_after=args.retry_after,
+        slow_rate=args.slow_rate,
+        slow_delay=args.slow_delay,
+        slow_model=args.slow_model,
+    )
+    server = StubLLMServer((args.host, args.port), config)
+    print(f"Stub LLM sunucusu → {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    _cli()
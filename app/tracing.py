@@ -0,0 +1,306 @@
+"""
+Hafif istek izleme (span) ve Prometheus metrikleri.
+
+Bir istek `with trace() as tr:` ile sarılır; içinde çalışan aşamalar `with span("embed"):`
+ile süre, `annotate(tokens_in=...)` ile değer, `count("answer_cache_hit")` ile olay
+kaydeder. Etkin iz contextvar'da tutulur (thread ve asyncio task başına ayrı); iz
+yokken span'ler yalnızca süreç geneli metriklere yazılır.
+
+    RAG_TRACING=0            → tamamen kapalı (span() paylaşılan boş bir nesne döndürür)
+    RAG_METRICS_PORT=9108    → start_metrics_server ile /metrics uç noktası
+
+`tr.to_dict()` feedback_logger satırına eklenir; `python -m app.feedback_logger --latency`
+model ve aşama bazında yüzdelikleri raporlar.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ENABLED = os.getenv("RAG_TRACING", "1").lower() not in ("0", "false", "no")
+
+# Saniye cinsinden histogram sınırları (5 ms – 30 sn)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def set_enabled(enabled: bool) -> None:
+    global ENABLED
+    ENABLED = bool(enabled)
+
+
+# ----------------------------- Metrikler -----------------------------
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Prometheus metin biçiminde dışa aktarılan, thread-safe histogram ve sayaçlar."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._hist: Dict[Labels, List[float]] = {}
+        self._sums: Dict[Labels, float] = defaultdict(float)
+        self._counts: Dict[Labels, int] = defaultdict(int)
+        self._events: Dict[Labels, float] = defaultdict(float)
+        self._tokens: Dict[Labels, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, model: Optional[str] = None) -> None:
+        labels: Labels = (("stage", stage),) + ((("model", model),) if model else ())
+        with self._lock:
+            counts = self._hist.get(labels)
+            if counts is None:
+                counts = self._hist[labels] = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            self._sums[labels] += seconds
+            self._counts[labels] += 1
+
+    def event(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self._events[(("event", name),)] += n
+
+    def tokens(self, direction: str, n: float, model: Optional[str] = None) -> None:
+        with self._lock:
+            self._tokens[(("direction", direction), ("model", model or ""))] += n
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hist.clear()
+            self._sums.clear()
+            self._counts.clear()
+            self._events.clear()
+            self._tokens.clear()
+
+    @staticmethod
+    def _fmt(labels: Labels, extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP rag_stage_seconds Aşama süresi (embed, search, rerank, prompt, llm, ...)",
+                "# TYPE rag_stage_seconds histogram",
+            ]
+            for labels, counts in sorted(self._hist.items()):
+                for bound, c in zip(self.buckets, counts):
+                    le = self._fmt(labels, 'le="%g"' % bound)
+                    lines.append(f"rag_stage_seconds_bucket{le} {c}")
+                total = self._counts[labels]
+                le = self._fmt(labels, 'le="+Inf"')
+                lines.append(f"rag_stage_seconds_bucket{le} {total}")
+                lines.append(
+                    f"rag_stage_seconds_sum{self._fmt(labels)} {self._sums[labels]:.6f}"
+                )
+                lines.append(f"rag_stage_seconds_count{self._fmt(labels)} {total}")
+            lines += [
+                "# HELP rag_events_total Önbellek isabetleri ve diğer olaylar",
+                "# TYPE rag_events_total counter",
+            ]
+            for labels, v in sorted(self._events.items()):
+                lines.append(f"rag_events_total{self._fmt(labels)} {v:g}")
+            lines += [
+                "# HELP rag_tokens_total LLM token sayıları",
+                "# TYPE rag_tokens_total counter",
+            ]
+            for labels, v in sorted(self._tokens.items()):
+                lines.append(f"rag_tokens_total{self._fmt(labels)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+# ----------------------------- İzler -----------------------------
+class Trace:
+    """Tek isteğin span süreleri (ms, aynı adlılar toplanır), değerleri ve olayları."""
+
+    __slots__ = ("trace_id", "started", "total_ms", "spans", "attrs", "events")
+
+    def __init__(self, **attrs: Any):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.spans: Dict[str, float] = {}
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.events: Dict[str, int] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self.total_ms, 2) if self.total_ms is not None else None,
+            "spans_ms": {k: round(v, 2) for k, v in self.spans.items()},
+            "attrs": dict(self.attrs),
+            "events": dict(self.events),
+        }
+
+
+def answered_model(attrs: Dict[str, Any]) -> Optional[str]:
+    """İz değerlerinden cevabı üreten model: hedge kazananı, yoksa istenen model."""
+    return (attrs.get("hedge") or {}).get("model") or attrs.get("model")
+
+
+_CURRENT: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT.get() if ENABLED else None
+
+
+@contextmanager
+def trace(**attrs: Any) -> Iterator[Optional[Trace]]:
+    """İstek izini başlatır; kapalıyken None verir."""
+    if not ENABLED:
+        yield None
+        return
+    tr = Trace(**attrs)
+    token = _CURRENT.set(tr)
+    try:
+        yield tr
+    finally:
+        _CURRENT.reset(token)
+        tr.total_ms = (time.perf_counter() - tr.started) * 1000
+        METRICS.observe("request", tr.total_ms / 1000, answered_model(tr.attrs))
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "model", "t0")
+
+    def __init__(self, name: str, model: Optional[str]):
+        self.name = name
+        self.model = model
+
+    def __enter__(self) -> "_Span":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        seconds = time.perf_counter() - self.t0
+        METRICS.observe(self.name, seconds, self.model)
+        tr = _CURRENT.get()
+        if tr is not None:
+            tr.add(self.name, seconds * 1000)
+
+
+def span(name: str, model: Optional[str] = None):
+    """Aşama süresini ölçer (etkin ize ve metriklere yazar)."""
+    return _Span(name, model) if ENABLED else _NOOP
+
+
+def record_span(name: str, seconds: float, model: Optional[str] = None) -> None:
+    """Önceden ölçülmüş bir süreyi span olarak kaydeder (ör. ilk token süresi)."""
+    if not ENABLED:
+        return
+    METRICS.observe(name, seconds, model)
+    tr = _CURRENT.get()
+    if tr is not None:
+        tr.add(name, seconds * 1000)
+
+
+def annotate(**attrs: Any) -> None:
+    """Etkin ize değer ekler (ör. model, tokens_in, tokens_out)."""
+    if ENABLED:
+        tr = _CURRENT.get()
+        if tr is not None:
+            tr.attrs.update(attrs)
+
+
+def count(event: str, n: int = 1) -> None:
+    """Olay sayar (ör. code_index_hit, retrieval_cache_hit, answer_cache_hit)."""
+    if not ENABLED:
+        return
+    METRICS.event(event, n)
+    tr = _CURRENT.get()
+    if tr is not None:
+        tr.events[event] = tr.events.get(event, 0) + n
+
+
+def record_tokens(
+    model: Optional[str], tokens_in: Optional[int], tokens_out: Optional[int]
+) -> None:
+    if not ENABLED:
+        return
+    if tokens_in is not None:
+        METRICS.tokens("in", tokens_in, model)
+    if tokens_out is not None:
+        METRICS.tokens("out", tokens_out, model)
+    annotate(tokens_in=tokens_in, tokens_out=tokens_out)
+
+
+# ----------------------------- /metrics -----------------------------
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "0.0.0.0"):
+    """
+    /metrics'i ayrı bir thread'de sunar (Streamlit gibi kendi HTTP sunucusu olmayan
+    süreçler için; port None → RAG_METRICS_PORT, o da yoksa başlatılmaz). Süreç başına bir kez.
+    """
+    global _SERVER
+    if port is None:
+        env = os.getenv("RAG_METRICS_PORT")
+        if not env:
+            return None
+        port = int(env)
+    with _SERVER_LOCK:
+        if _SERVER is not None:
+            return _SERVER
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):  # sessiz
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0].rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = METRICS.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="metrics", daemon=True
+        ).start()
+        _SERVER = server
+        print(f"[tracing] Metrikler → http://{host}:{server.server_address[1]}/metrics")
+        return server
@@ -1,8 +1,14 @@
 import os
-import json
 import uuid
 import streamlit as st
-from app.feedback_logger import LOG_PATH as FB_LOG_PATH, log_feedback
+from app import tracing
+from app.snapshots import current_version, index_exists
+from app.feedback_logger import (
+    FEEDBACK_DB as FB_DB,
+    LOG_PATH as FB_LOG_PATH,
+    log_feedback,
+    tail,
+)
 
 # Gürültüyü kapat
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
@@ -14,6 +20,21 @@ for k in (
     "OPENROUTER_BASE_URL",
     "SYSTEM_PROMPT_PATH",
     "TOKENIZERS_PARALLELISM",
+    "ANSWER_CACHE_THRESHOLD",
+    "RETRIEVER_LOAD_MODE",
+    "RERANK_BACKEND",
+    "RERANK_QUANTIZE",
+    "RERANK_THREADS",
+    "QUERY_ENCODER_BACKEND",
+    "QUERY_SERVICE_URL",
+    "RAG_METRICS_PORT",
+    "RAG_FEEDBACK_DB",
+    "CONTEXT_TOKEN_BUDGET",
+    "CONTEXT_TOKENIZER",
+    "LLM_BACKEND",
+    "LLAMA_CPP_MODEL",
+    "LLM_HEDGE_MODEL",
+    "LLM_DEADLINE",
 ):
     try:
         if hasattr(st, "secrets") and k in st.secrets and not os.getenv(k):
@@ -21,27 +42,31 @@ for k in (
     except Exception:
         pass
 
+# Arka planda ısınma: modeller, index ve örnek sorgu ilk sorudan önce hazır olsun.
+# Streamlit her etkileşimde betiği yeniden çalıştırır; start_warmup süreç başına bir kez çalışır.
+# QUERY_SERVICE_URL verilmişse UI ince istemcidir; modeller ve index serviste yüklüdür.
+SERVICE_URL = os.getenv("QUERY_SERVICE_URL")
+# RAG_METRICS_PORT verilmişse Prometheus /metrics ayrı bir thread'de sunulur
+tracing.start_metrics_server()
+if not SERVICE_URL and index_exists("db/faiss_index"):
+    from app.warmup import start_warmup
+
+    start_warmup(load_mode=os.getenv("RETRIEVER_LOAD_MODE", "mmap"))
+
 
 # ----------------------------- Yardımcılar -----------------------------
 @st.cache_data(ttl=30)
 def _read_feedback(path: str = FB_LOG_PATH, limit: int = 50):
-    """JSONL logundan son N kaydı okunur ve tablo görünümü hazırlanır."""
-    if not os.path.exists(path):
-        return []
-    rows = []
+    """Son N kayıt (SQLite deposu ya da JSONL'in sonundan geri okuma) tablo görünümüne çevrilir."""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    rows.append(json.loads(line))
-                except Exception:
-                    pass
+        if FB_DB:
+            from app.feedback_store import get_store
+
+            rows = get_store(FB_DB).recent(limit)
+        else:
+            rows = tail(path, limit)
     except Exception:
         return []
-    rows = rows[-limit:]
     view = []
     for r in reversed(rows):  # en yeni üstte
         view.append(
@@ -71,26 +96,77 @@ st.set_page_config(page_title="RAG SupportBot", layout="wide")
 st.title("RAG SupportBot")
 st.caption("Belgelerinizden beslenen teknik destek asistanı.")
 
-# Belge yükleme + embedding
+
+# Belge yükleme + embedding (arka plan kuyruğu; oturum bloklanmaz)
+@st.fragment(run_every=2)
+def _ingest_progress(job_id: str):
+    from app.ingest import job_status
+
+    job = job_status(job_id)
+    if job is None:
+        return
+    prog = job.get("progress") or {}
+    if job["status"] == "pending":
+        st.info(f"Embedding kuyrukta (sıra: {job.get('queue_position', 1)})…")
+    elif job["status"] == "running":
+        files = f"{prog.get('files_done') or 0}/{prog.get('files_total') or 0} dosya"
+        chunks_total = prog.get("chunks_total") or 0
+        chunks_done = prog.get("chunks_done") or 0
+        eta = f", kalan ~{prog['eta_s']:.0f} sn" if prog.get("eta_s") else ""
+        st.progress(
+            chunks_done / chunks_total if chunks_total else 0.0,
+            text=f"{prog.get('stage') or 'hazırlanıyor'}: {files}, "
+            f"{chunks_done}/{chunks_total} parça{eta}",
+        )
+    else:
+        # Bitti: sonucu sakla ve tüm sayfayı yeniden çalıştır (fragment artık çizilmez)
+        st.session_state["ingest_result"] = job
+        st.session_state.pop("ingest_job", None)
+        st.rerun()
+
+
 with st.expander("Belge Yükleme (TXT, PDF, MD)"):
     uploaded_files = st.file_uploader("Dosyaları yükleyin", accept_multiple_files=True)
-    if uploaded_files:
+    # file_uploader seçimi yeniden çalıştırmalarda kalır; aynı yükleme bir kez kuyruğa girer
+    new_files = [
+        f
+        for f in uploaded_files or []
+        if f.file_id not in st.session_state.setdefault("ingested_file_ids", set())
+    ]
+    if new_files:
         data_dir = "data"
         os.makedirs(data_dir, exist_ok=True)
-        for file in uploaded_files:
+        for file in new_files:
             with open(os.path.join(data_dir, file.name), "wb") as f:
                 f.write(file.getbuffer())
-        st.info(f"{len(uploaded_files)} belge yüklendi. Embedding başlatılıyor…")
         try:
-            from app.embedder import build_index
+            from app.ingest import submit
 
-            build_index(data_dir=data_dir, persist_dir="db/faiss_index")
+            st.session_state.pop("ingest_result", None)
+            st.session_state["ingest_job"] = submit(
+                files=[f.name for f in new_files],
+                data_dir=data_dir,
+                persist_dir="db/faiss_index",
+            )
+            st.session_state["ingested_file_ids"].update(f.file_id for f in new_files)
+            st.info(
+                f"{len(new_files)} belge yüklendi. Embedding arka planda başlatıldı."
+            )
+        except Exception as e:
+            st.error("Embedding kuyruğa eklenemedi.")
+            with st.expander("Hata detayı"):
+                st.code(repr(e))
+    if st.session_state.get("ingest_job"):
+        _ingest_progress(st.session_state["ingest_job"])
+    elif st.session_state.get("ingest_result"):
+        result = st.session_state["ingest_result"]
+        if result["status"] == "done":
             st.success("Embedding tamamlandı. Yeni belgeler kullanılabilir.")
             st.session_state["index_ready"] = True
-        except Exception as e:
+        else:
             st.error("Embedding sırasında hata oluştu.")
             with st.expander("Hata detayı"):
-                st.code(repr(e))
+                st.code(result.get("error") or "")
 
 # Soru / Cevap
 st.subheader("Soru")
@@ -99,8 +175,41 @@ question = st.text_input(
     placeholder="Örn: Makine sıkmada gürültü yapıyor, nereleri kontrol etmeliyim?",
 )
 
-if question:
-    if not os.path.isdir("db/faiss_index"):
+if question and SERVICE_URL:
+    try:
+        from types import SimpleNamespace
+
+        from app.query_service import remote_answer
+
+        with st.spinner("Yanıt hazırlanıyor…"):
+            data = remote_answer(question, url=SERVICE_URL)
+        st.subheader("Yanıt")
+        st.markdown(data["answer"])
+        # Kaynaklar, aşağıdaki geri bildirim kodunun okuduğu alanlarla (text/score/metadata)
+        results = [SimpleNamespace(**s) for s in data.get("sources") or []]
+
+        st.session_state["last_question"] = question
+        st.session_state["last_answer"] = data["answer"]
+        st.session_state["last_nodes"] = results
+        st.session_state["last_model"] = data.get("model")
+        st.session_state["last_trace"] = data.get("trace")
+        st.session_state["feedback_key"] = str(
+            abs(hash(question + "\n" + data["answer"])) % (10**12)
+        )
+
+        with st.expander("Kaynak Belgeler"):
+            for i, node in enumerate(results):
+                score = node.score if node.score is not None else 0.0
+                st.markdown(
+                    f"**Belge {i+1}** (Skor: {score:.4f})\n\n{node.text[:400]}..."
+                )
+    except Exception as e:
+        st.error("Sorgu servisine ulaşılamadı.")
+        with st.expander("Hata detayı"):
+            st.code(repr(e))
+
+elif question:
+    if not index_exists("db/faiss_index"):
         st.warning(
             "FAISS indeksi bulunamadı. Lütfen belge yükleyip embedding oluşturun."
         )
@@ -110,32 +219,55 @@ if question:
 
         @st.cache_resource(show_spinner=False)
         def _load_retriever():
-            from app.retriever import DocumentRetriever
+            from app.warmup import get_retriever
 
-            return DocumentRetriever()
+            # Isınma sürüyorsa bitmesini bekler, bittiyse hazır örneği döndürür
+            return get_retriever(load_mode=os.getenv("RETRIEVER_LOAD_MODE", "mmap"))
+
+        @st.cache_resource(show_spinner=False)
+        def _load_answer_cache(_retriever):
+            from app.answer_cache import SemanticAnswerCache
+
+            return SemanticAnswerCache(
+                embed_fn=_retriever.embed_query,
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            )
 
         retriever = _load_retriever()
+        answer_cache = _load_answer_cache(retriever)
+
+        # İz: aşama süreleri (embed/search/rerank/prompt/llm) feedback satırına eklenir
+        with tracing.trace(ui="streamlit") as tr:
+            with st.spinner("Belgeler aranıyor…"):
+                results = retriever.retrieve(question) or []
 
-        with st.spinner("Belgeler aranıyor…"):
-            results = retriever.retrieve(question) or []
+            answer = None
+            if results:
+                from app.llm_generator import generate_answer_stream
+
+                # Token'lar geldikçe yazılır; write_stream tam metni döndürür
+                st.subheader("Yanıt")
+                answer = st.write_stream(
+                    generate_answer_stream(question, results, cache=answer_cache)
+                )
+        st.session_state["last_trace"] = tr.to_dict() if tr else None
 
         if not results:
             st.warning("Bu sorunun cevabı elimdeki belgelerde bulunamadı.")
             st.session_state.pop("last_answer", None)
         else:
-            with st.spinner("Yanıt üretiliyor…"):
-                from app.llm_generator import generate_answer
-
-                answer = generate_answer(question, results)
-
-            st.subheader("Yanıt")
-            st.write(answer)
+            answer = answer if isinstance(answer, str) else "".join(map(str, answer))
 
             # Feedback için state
             st.session_state["last_question"] = question
             st.session_state["last_answer"] = answer
             st.session_state["last_nodes"] = results
-            st.session_state["last_model"] = os.getenv("OPENROUTER_MODEL")
+            from app.llm_generator import DEFAULT_MODEL
+
+            # Cevabı üreten model (hedge kazananı ya da yerel model), istenen değil
+            st.session_state["last_model"] = (
+                tracing.answered_model(tr.attrs) if tr else None
+            ) or DEFAULT_MODEL
             st.session_state["feedback_key"] = str(
                 abs(hash(question + "\n" + answer)) % (10**12)
             )
@@ -201,6 +333,7 @@ if "last_answer" in st.session_state:
                 model=st.session_state.get("last_model"),
                 docs=docs_meta,
                 extra={"ui": "streamlit"},
+                trace=st.session_state.get("last_trace"),
                 fb_id=feedback_id,
             )
 
@@ -244,4 +377,5 @@ else:
 with st.expander("Debug"):
     st.write("CWD:", os.getcwd())
     st.write("Log yolu:", FB_LOG_PATH)
-    st.write("db/faiss_index var mı?:", os.path.isdir("db/faiss_index"))
+    st.write("db/faiss_index var mı?:", index_exists("db/faiss_index"))
+    st.write("Index sürümü:", current_version("db/faiss_index") or "-")
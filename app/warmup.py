@@ -0,0 +1,165 @@
+"""
+Hızlı açılış: arka planda ısınma ve açılış süresi profili.
+
+UI açılırken `start_warmup()` ağır işleri (llama_index/torch içe aktarımı, modellerin
+yüklenmesi, index'in mmap ile açılması, örnek sorgu) bir arka plan thread'inde başlatır;
+ilk soru geldiğinde `get_retriever()` hazır örneği döndürür ya da ısınmanın bitmesini bekler.
+
+    python -m app.warmup                      # ısın ve süreyi yazdır
+    python -m app.warmup --profile-startup    # modül/aşama bazında süre dökümü
+"""
+
+import argparse
+import importlib
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+WARMUP_QUERY = "Makine su almıyor, ne yapmalıyım?"
+
+# Açılışta sırayla yüklenen ağır modüller (profil bu sırayla ölçer)
+STARTUP_MODULES = (
+    "numpy",
+    "faiss",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "llama_index",
+    "app.retriever",
+    "app.llm_generator",
+)
+
+_LOCK = threading.Lock()
+_FUTURE: Optional[Future] = None
+
+
+def _warm(retriever_kwargs: Dict[str, Any]):
+    from app.retriever import DocumentRetriever
+
+    t0 = time.perf_counter()
+    retriever = DocumentRetriever(**retriever_kwargs)
+    retriever.embed_query(WARMUP_QUERY)
+    # Uyarlamalı rerank modeli atlayabilir; cross-encoder'ı açıkça yükle
+    _ = retriever.rerank_engine.model
+    retriever.retrieve(WARMUP_QUERY)
+    try:
+        importlib.import_module("app.llm_generator").warm_up()
+    except Exception as e:  # noqa: BLE001 - LLM ilk istekte yeniden denenir
+        print(f"[warmup] LLM ısınması başarısız: {e!r}")
+    print(f"[warmup] Retriever hazır ({time.perf_counter() - t0:.1f} sn)")
+    return retriever
+
+
+def start_warmup(**retriever_kwargs) -> Future:
+    """
+    Isınmayı arka planda başlatır (süreç başına bir kez; başarısız olduysa yeniden dener)
+    ve DocumentRetriever'ı taşıyan Future'ı döndürür.
+    """
+    global _FUTURE
+    with _LOCK:
+        if _FUTURE is not None and not (_FUTURE.done() and _FUTURE.exception()):
+            return _FUTURE
+        future: Future = Future()
+        _FUTURE = future
+
+    def _run() -> None:
+        try:
+            future.set_result(_warm(retriever_kwargs))
+        except BaseException as e:  # noqa: BLE001 - hata get_retriever'da yükseltilir
+            print(f"[warmup] Isınma başarısız: {e!r}")
+            future.set_exception(e)
+
+    threading.Thread(target=_run, name="warmup", daemon=True).start()
+    return future
+
+
+def get_retriever(timeout: Optional[float] = None, **retriever_kwargs):
+    """Isınmış DocumentRetriever (başlatılmadıysa başlatır, bitene kadar bekler)."""
+    return start_warmup(**retriever_kwargs).result(timeout=timeout)
+
+
+def warmup_status() -> str:
+    """idle | running | ready | failed"""
+    future = _FUTURE
+    if future is None:
+        return "idle"
+    if not future.done():
+        return "running"
+    return "failed" if future.exception() else "ready"
+
+
+# ----------------------------- Profil -----------------------------
+def _timed(rows: List[dict], stage: str, fn, note: str = ""):
+    t0 = time.perf_counter()
+    try:
+        result = fn()
+    except ImportError as e:
+        rows.append({"aşama": stage, "sn": 0.0, "not": f"yok ({e.name})"})
+        return None
+    rows.append({"aşama": stage, "sn": round(time.perf_counter() - t0, 3), "not": note})
+    return result
+
+
+def profile_startup(**retriever_kwargs) -> List[dict]:
+    """
+    Modül içe aktarım ve başlatma sürelerini ölçer. İçe aktarım süreleri artımlıdır
+    (önceki modüllerin yüklediği bağımlılıklar tekrar sayılmaz); anlamlı sonuç için
+    yeni bir süreçte çalıştırın.
+    """
+    rows: List[dict] = []
+    for name in STARTUP_MODULES:
+        note = "önceden yüklü" if name in sys.modules else ""
+        _timed(rows, f"import {name}", lambda n=name: importlib.import_module(n), note)
+
+    from app.retriever import DocumentRetriever
+
+    retriever = _timed(
+        rows, "DocumentRetriever()", lambda: DocumentRetriever(**retriever_kwargs)
+    )
+    if retriever is not None:
+        _timed(
+            rows, "sorgu kodlayıcı (yükleme + ısınma)", lambda: retriever.embed_model
+        )
+        _timed(
+            rows,
+            "cross-encoder (yükleme + ısınma)",
+            lambda: retriever.rerank_engine.model,
+        )
+        _timed(rows, "ilk sorgu", lambda: retriever.retrieve(WARMUP_QUERY))
+        _timed(
+            rows, "ikinci sorgu", lambda: retriever.retrieve("Garanti süresi ne kadar?")
+        )
+    rows.append(
+        {"aşama": "TOPLAM", "sn": round(sum(r["sn"] for r in rows), 3), "not": ""}
+    )
+    return rows
+
+
+def _print_rows(rows: List[dict]) -> None:
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def _cli():
+    p = argparse.ArgumentParser(description="Isınma / açılış süresi profili")
+    p.add_argument("--profile-startup", action="store_true", help="Süre dökümü yazdır")
+    p.add_argument("--persist-dir", default="db/faiss_index")
+    p.add_argument("--load-mode", choices=("memory", "mmap"), default="mmap")
+    args = p.parse_args()
+
+    kwargs = {"persist_dir": args.persist_dir, "load_mode": args.load_mode}
+    if args.profile_startup:
+        _print_rows(profile_startup(**kwargs))
+    else:
+        t0 = time.perf_counter()
+        get_retriever(**kwargs)
+        print(f"[warmup] Toplam {time.perf_counter() - t0:.1f} sn")
+
+
+if __name__ == "__main__":
+    _cli()
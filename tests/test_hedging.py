@@ -0,0 +1,130 @@
+"""Hedge edilmiş LLM istekleri, gecikme enjekte edilen yerel stub sunucuya karşı."""
+
+import time
+
+import pytest
+
+import app.llm_generator as lg
+from app import tracing
+from app.hedging import DeadlineExceeded, HedgeConfig, TTFTTracker, hedged_stream
+from app.llm_backends import LLMBackend
+from app.stub_llm_server import StubConfig, start_stub_server
+
+PROMPT = "Soru: su almıyor\n\nBelgeler: ..."
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = start_stub_server(config=StubConfig(latency=0.1, ttft=0.02))
+    monkeypatch.setattr(lg, "API_URL", server.url)
+    monkeypatch.setattr(lg, "API_KEY", "stub")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _run(config, backend=lg.OPENROUTER, model="primary", tracker=None):
+    usage, outcome = {}, {}
+    text = "".join(
+        hedged_stream(
+            model,
+            backend,
+            "sistem",
+            PROMPT,
+            0.0,
+            64,
+            usage,
+            outcome,
+            config=config,
+            secondary_backend=lg.OPENROUTER,
+            tracker=tracker or TTFTTracker(),
+        )
+    )
+    return text, usage, outcome
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_slow_primary_loses_to_secondary_and_is_cancelled(stub):
+    stub.config.slow_rate, stub.config.slow_delay = 1.0, 2.0
+    stub.config.slow_model = "primary"
+    config = HedgeConfig(secondary="secondary", initial_delay=0.2, min_delay=0.1)
+    tracker = TTFTTracker()
+    with tracing.trace() as tr:
+        t0 = time.perf_counter()
+        text, _, outcome = _run(config, tracker=tracker)
+        elapsed = time.perf_counter() - t0
+    assert text.startswith("Stub cevap: su almıyor")
+    assert elapsed < 1.5
+    assert outcome == {"path": "secondary", "model": "secondary"}
+    trace = tr.to_dict()
+    assert trace["attrs"]["hedge"]["path"] == "secondary"
+    assert tracing.answered_model(trace["attrs"]) == "secondary"
+    assert trace["events"] == {"hedge_fired": 1, "hedge_secondary_won": 1}
+    assert tracker.stats()["wins"] == {"secondary": 1}
+    # Kaybedenin bağlantısı kapatıldı; stub bir sonraki yazımda bunu görür
+    assert _wait_for(lambda: stub.stats["cancelled"] == 1)
+
+
+def test_fast_primary_wins_without_hedging(stub):
+    config = HedgeConfig(secondary="secondary", initial_delay=1.0)
+    text, _, outcome = _run(config)
+    assert outcome["path"] == "primary" and text
+    assert stub.stats["requests"] == 1
+
+
+def test_deadline_raises_and_cancels_all_attempts(stub):
+    stub.config.slow_rate, stub.config.slow_delay = 1.0, 2.0
+    config = HedgeConfig(
+        secondary="secondary", deadline=0.6, initial_delay=0.2, min_delay=0.1
+    )
+    with tracing.trace() as tr:
+        t0 = time.perf_counter()
+        with pytest.raises(DeadlineExceeded):
+            _run(config)
+        elapsed = time.perf_counter() - t0
+    assert 0.6 <= elapsed < 1.2
+    assert tr.to_dict()["events"]["llm_deadline_exceeded"] == 1
+    assert _wait_for(lambda: stub.stats["cancelled"] == 2)
+
+
+class _FailingBackend(LLMBackend):
+    def complete(self, model, system_prompt, user_prompt, temperature, max_tokens):
+        raise RuntimeError("birincil model hatası")
+
+
+def test_primary_error_fails_over_without_waiting(stub):
+    config = HedgeConfig(secondary="secondary", initial_delay=5.0)
+    with tracing.trace() as tr:
+        t0 = time.perf_counter()
+        text, _, outcome = _run(config, backend=_FailingBackend())
+        elapsed = time.perf_counter() - t0
+    assert outcome["path"] == "secondary" and text
+    assert elapsed < 1.0
+    assert tr.to_dict()["events"]["hedge_failover"] == 1
+
+
+def test_error_without_secondary_is_raised(stub):
+    with pytest.raises(RuntimeError, match="birincil"):
+        _run(HedgeConfig(deadline=5.0), backend=_FailingBackend())
+
+
+def test_threshold_follows_observed_p95():
+    config = HedgeConfig(
+        initial_delay=3.0, min_delay=0.1, max_delay=2.0, min_samples=20
+    )
+    tracker = TTFTTracker()
+    for _ in range(19):
+        tracker.observe("m", 0.2)
+    # Örnek az: initial_delay kullanılır, max_delay'e kırpılır
+    assert tracker.threshold("m", config) == 2.0
+    tracker.observe("m", 0.2)
+    assert tracker.threshold("m", config) == pytest.approx(0.2)
+    for _ in range(20):
+        tracker.observe("m", 0.5)
+    assert tracker.threshold("m", config) == pytest.approx(0.5)
@@ -0,0 +1,122 @@
+"""LLM HTTP istemcisinin tekrar/Retry-After davranışı, yerel stub sunucuya karşı."""
+
+import asyncio
+import socket
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from app.http_client import (
+    AsyncLLMHttpClient,
+    ClientConfig,
+    LLMHttpClient,
+    backoff_delay,
+    retry_after_seconds,
+)
+from app.stub_llm_server import StubConfig, start_stub_server
+
+PAYLOAD = {"model": "stub", "messages": [{"role": "user", "content": "Soru: test"}]}
+FAST = {"backoff_base": 0.01, "backoff_max": 0.05, "connect_timeout": 0.5}
+
+
+@pytest.fixture
+def stub():
+    server = start_stub_server(config=StubConfig(latency=0.0))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after_seconds("2.5") == 2.5
+    assert retry_after_seconds("-1") == 0.0
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("bozuk") is None
+    assert 8 <= retry_after_seconds(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+
+def test_backoff_prefers_retry_after_and_caps_it():
+    cfg = ClientConfig(backoff_base=1.0, backoff_max=5.0)
+    assert backoff_delay(cfg, 0, "3") == 3.0
+    assert backoff_delay(cfg, 0, "60") == 5.0
+    assert all(0 <= backoff_delay(cfg, 10) <= 5.0 for _ in range(50))
+
+
+def test_retries_429_honouring_retry_after(stub):
+    stub.config.fail_rate = 1.0
+    stub.config.retry_after = 0.1
+    # Jitter'lı backoff en fazla ~0.004 sn sürerdi; beklenen süre Retry-After'dan gelir
+    client = LLMHttpClient(
+        ClientConfig(max_retries=2, backoff_base=0.001, backoff_max=1.0)
+    )
+    t0 = time.perf_counter()
+    status, body = client.post_json(stub.url, {}, PAYLOAD)
+    elapsed = time.perf_counter() - t0
+    assert status == 429 and "error" in body
+    assert stub.stats["requests"] == 3 and client.retries == 2
+    assert elapsed >= 0.2  # 2 × Retry-After
+
+
+def test_recovers_after_transient_errors(stub):
+    stub.config.fail_rate = 1.0
+    stub.config.fail_status = 503
+    stub.config.retry_after = None
+    client = LLMHttpClient(ClientConfig(max_retries=3, **FAST))
+    calls = []
+
+    def _heal(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            stub.config.fail_rate = 0.0
+        return original(*args, **kwargs)
+
+    original = client.session.post
+    client.session.post = _heal
+    status, body = client.post_json(stub.url, {}, PAYLOAD)
+    assert status == 200 and body["choices"][0]["message"]["content"]
+    assert stub.stats["requests"] == 2 and client.retries == 1
+
+
+def test_read_timeout_is_not_retried(stub):
+    stub.config.latency = 1.0
+    client = LLMHttpClient(ClientConfig(max_retries=3, timeout=0.2, **FAST))
+    with pytest.raises(requests.ReadTimeout):
+        client.post_json(stub.url, {}, PAYLOAD)
+    assert stub.stats["requests"] == 1 and client.retries == 0
+
+
+def test_connection_refused_is_retried():
+    client = LLMHttpClient(ClientConfig(max_retries=2, **FAST))
+    url = f"http://127.0.0.1:{_free_port()}/v1/chat/completions"
+    with pytest.raises(requests.ConnectionError):
+        client.post_json(url, {}, PAYLOAD)
+    assert client.retries == 2
+
+
+def test_async_client_retry_rules(stub):
+    async def run():
+        client = AsyncLLMHttpClient(ClientConfig(max_retries=2, timeout=0.2, **FAST))
+        try:
+            stub.config.fail_rate = 1.0
+            stub.config.retry_after = 0.05
+            status, _ = await client.post_json(stub.url, {}, PAYLOAD)
+            assert status == 429 and client.retries == 2
+            assert stub.stats["requests"] == 3
+
+            stub.config.fail_rate = 0.0
+            stub.config.latency = 1.0
+            with pytest.raises(asyncio.TimeoutError):
+                await client.post_json(stub.url, {}, PAYLOAD)
+            assert stub.stats["requests"] == 4 and client.retries == 2
+        finally:
+            await client.close()
+
+    asyncio.run(run())
@@ -0,0 +1,46 @@
+"""Türkçe ek atma ve BM25 eşleşmesi."""
+
+import pytest
+
+from app.lexical_index import LexicalIndex, analyze, stem, write_lexical_index
+
+
+@pytest.mark.parametrize(
+    "words",
+    [
+        ("kapı", "kapısı", "kapıyı", "kapısında"),
+        ("su", "suyu"),
+        ("ses", "sesi"),
+        ("alma", "almıyor"),
+        ("sıkma", "sıkmıyor", "sıkıyor"),
+        ("kapak", "kapağı", "kapakta"),
+        ("kilit", "kilidi"),
+        ("makine", "makineye", "makinelerden"),
+        ("kod", "kodu", "kodları"),
+    ],
+)
+def test_inflected_forms_share_a_stem(words):
+    assert len({stem(w) for w in words}) == 1, [stem(w) for w in words]
+
+
+def test_short_roots_and_unsoftened_words_are_kept():
+    assert stem("su") == "su"
+    assert stem("dağı") == "dağ"
+    assert analyze("sadece") == []
+    assert analyze("Hata E21'i gösteriyor") == ["hat", "e21", "göster"]
+
+
+class _Node:
+    def __init__(self, text):
+        self.text = text
+
+    def get_content(self):
+        return self.text
+
+
+def test_search_matches_inflected_query(tmp_path):
+    docs = ["Makine su almıyor: musluğu kontrol edin.", "Kapak kilidi arızası."]
+    write_lexical_index(str(tmp_path), [(i, _Node(t)) for i, t in enumerate(docs)])
+    index = LexicalIndex.load(str(tmp_path))
+    assert [pos for pos, _ in index.search("suyu almıyor", 2)] == [0]
+    assert [pos for pos, _ in index.search("kapağın kilit", 2)] == [1]
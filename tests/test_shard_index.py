@@ -0,0 +1,80 @@
+"""Kategori shard'larının build'i: index tipi, node id digest'i ve pozisyon eşlemesi."""
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from app.index_factory import IndexSpec, make_index, train_index  # noqa: E402
+from app.shard_index import ShardIndex, write_shard_index  # noqa: E402
+
+DIM = 16
+
+
+class _Node:
+    def __init__(self, node_id, category):
+        self.node_id = node_id
+        self.metadata = {"file_name": f"{category}.txt"}
+
+    def get_content(self):
+        return f"{self.metadata['file_name']} {self.node_id}"
+
+
+def _corpus(n=300):
+    rng = np.random.default_rng(0)
+    cats = [i % 3 for i in range(n)]
+    vecs = rng.normal(size=(n, DIM)).astype("float32")
+    vecs[np.arange(n), cats] += 5.0
+    nodes = [_Node(f"n{i}", "abc"[c]) for i, c in enumerate(cats)]
+    return nodes, vecs
+
+
+def _global(spec, vecs):
+    index = make_index(spec, DIM, len(vecs))
+    train_index(index, vecs, spec.train_size)
+    index.add(vecs)
+    return index
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_shards_use_spec_and_map_to_global_positions(tmp_path, kind):
+    nodes, vecs = _corpus()
+    spec = IndexSpec(kind=kind)
+    index = _global(spec, vecs)
+    vectors = {n.node_id: v for n, v in zip(nodes, vecs)}
+    assert write_shard_index(str(tmp_path), enumerate(nodes), index, spec, vectors) == 3
+
+    shards = ShardIndex.load(str(tmp_path))
+    assert type(shards.indexes[0]) is type(index)
+    queries = vecs[:4] + 0.01
+    _, ids = shards.search(queries, [[0, 1, 2]] * 4, 3)
+    _, expected = index.search(queries, 3)
+    assert (ids[:, 0] == expected[:, 0]).all()
+
+
+def test_deleting_in_one_category_keeps_other_shard_files(tmp_path, capsys):
+    nodes, vecs = _corpus()
+    spec = IndexSpec()
+    index = _global(spec, vecs)
+    vectors = {n.node_id: v for n, v in zip(nodes, vecs)}
+    write_shard_index(str(tmp_path), enumerate(nodes), index, spec, vectors)
+
+    drop = list(range(0, 60, 3))  # yalnızca 'a' kategorisi; sonraki pozisyonlar kayar
+    index.remove_ids(np.asarray(drop, dtype="int64"))
+    kept = [n for i, n in enumerate(nodes) if i not in drop]
+    capsys.readouterr()
+    write_shard_index(str(tmp_path), enumerate(kept), index, spec, {})
+    assert "(1 yeniden yazıldı)" in capsys.readouterr().out
+
+    queries = vecs[[1, 2, 4]] + 0.01
+    _, ids = ShardIndex.load(str(tmp_path)).search(queries, [[0, 1, 2]] * 3, 3)
+    _, expected = index.search(queries, 3)
+    assert (ids == expected).all()
+
+
+def test_non_flat_without_vectors_writes_no_shards(tmp_path):
+    nodes, vecs = _corpus()
+    spec = IndexSpec(kind="hnsw")
+    index = _global(spec, vecs)
+    n = write_shard_index(str(tmp_path), enumerate(nodes), index, spec, {})
+    assert n == 0 and ShardIndex.load(str(tmp_path)) is None